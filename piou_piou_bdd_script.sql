@@ -1,3 +1,5 @@
+DROP TABLE IF EXISTS compteur_mesure;
+DROP TABLE IF EXISTS retention;
 DROP TABLE IF EXISTS mesure;
 DROP TABLE IF EXISTS station;
 
@@ -12,6 +14,7 @@ CREATE TABLE station (
 CREATE TABLE mesure (
 	id INTEGER PRIMARY KEY AUTOINCREMENT,
 	mesure_date TEXT NOT NULL,
+	mesure_ts INTEGER,
 	wind_heading REAL,
 	wind_speed_avg REAL,
 	wind_speed_max REAL,
@@ -20,4 +23,44 @@ CREATE TABLE mesure (
 	FOREIGN KEY(station) references station(id)
 );
 
+CREATE INDEX idx_mesure_station_id ON mesure (station, id);
+-- mesure_ts : date de la mesure en timestamp epoch (secondes UTC), utilisée pour l'unicité et les recherches par période
+CREATE UNIQUE INDEX uq_mesure_station_ts ON mesure (station, mesure_ts);
+CREATE INDEX idx_mesure_ts ON mesure (mesure_ts);
+
+-- Rétention : nombre maximum de mesures ('station' : par station, 'all' : au total, -1 : pas de limite)
+CREATE TABLE retention (
+	id INTEGER PRIMARY KEY CHECK (id = 1),
+	max_mesure INTEGER NOT NULL,
+	mode TEXT NOT NULL,
+	nb_total INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE compteur_mesure (
+	station INTEGER PRIMARY KEY,
+	nb INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO retention (id, max_mesure, mode, nb_total) VALUES (1, 10, 'station', 0);
+
+CREATE TRIGGER trg_mesure_retention_insert AFTER INSERT ON mesure
+BEGIN
+	INSERT INTO compteur_mesure (station, nb) VALUES (NEW.station, 1) ON CONFLICT(station) DO UPDATE SET nb = nb + 1;
+	UPDATE retention SET nb_total = nb_total + 1;
+	DELETE FROM mesure WHERE id = (SELECT MIN(id) FROM mesure WHERE station = NEW.station)
+		AND (SELECT mode = 'station' AND max_mesure > 0 FROM retention)
+		AND (SELECT nb FROM compteur_mesure WHERE station = NEW.station) > (SELECT max_mesure FROM retention);
+	DELETE FROM mesure WHERE id = (SELECT MIN(id) FROM mesure)
+		AND (SELECT mode = 'all' AND max_mesure > 0 AND nb_total > max_mesure FROM retention);
+END;
+
+CREATE TRIGGER trg_mesure_retention_delete AFTER DELETE ON mesure
+BEGIN
+	UPDATE compteur_mesure SET nb = nb - 1 WHERE station = OLD.station;
+	UPDATE retention SET nb_total = nb_total - 1;
+END;
+
+-- Version du schéma, utilisée par PiouPiouDao.initialiser_bdd pour les migrations
+PRAGMA user_version = 5;
+
 SELECT * FROM station;
\ No newline at end of file
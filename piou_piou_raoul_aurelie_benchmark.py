@@ -0,0 +1,272 @@
+"""Micro-benchmark de la DAO Piou Piou.
+
+Génère des stations et des mesures synthétiques puis chronomètre les opérations principales de la DAO
+(ajout de stations, ajout de mesures unitaire et par lot, lectures, comptage, rétention et sauvegarde).
+Chaque répétition utilise une BDD neuve, dans un répertoire temporaire ou en mémoire (--memoire).
+
+Le résultat est écrit en JSON (sortie standard ou --sortie) pour être comparé d'un commit à l'autre (--comparer).
+
+Exemple :
+    python piou_piou_raoul_aurelie_benchmark.py --stations 20 --mesures 500 --sortie avant.json
+    python piou_piou_raoul_aurelie_benchmark.py --stations 20 --mesures 500 --comparer avant.json
+"""
+import argparse
+import json
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from os import path
+
+from piou_piou_raoul_aurelie_dao import PiouPiouDao
+from piou_piou_raoul_aurelie_objets import Station, Mesure
+
+# Date de la première mesure générée
+DATE_DEBUT = datetime(2023, 6, 1, tzinfo=timezone.utc)
+# Nombre de mesures ajoutées une par une (ajouter_mesure) par station
+NB_MESURES_UNITAIRES = 10
+
+
+def generer_stations(nb_stations, graine=0):
+    """Génère des stations synthétiques autour du lac du Bourget
+
+    Args:
+        nb_stations (int): Nombre de stations à générer
+        graine (int, optional): Graine du générateur aléatoire. Defaults to 0.
+
+    Returns:
+        list[Station]: Les stations générées, identifiants 1 à nb_stations
+    """
+    alea = random.Random(graine)
+    return [Station(id, f"Station {id}", latitude=round(45.7 + alea.uniform(-0.5, 0.5), 5), longitude=round(5.87 + alea.uniform(-0.5, 0.5), 5))
+            for id in range(1, nb_stations + 1)]
+
+
+def generer_mesures(stations, nb_mesures, debut=DATE_DEBUT, pas=60, graine=0):
+    """Génère des mesures synthétiques : nb_mesures par station, une toutes les pas secondes
+
+    Args:
+        stations (list[Station]): Stations à mesurer
+        nb_mesures (int): Nombre de mesures par station
+        debut (datetime, optional): Date de la première mesure. Defaults to DATE_DEBUT.
+        pas (int, optional): Intervalle en secondes entre deux mesures d'une station. Defaults to 60.
+        graine (int, optional): Graine du générateur aléatoire. Defaults to 0.
+
+    Returns:
+        dict{int:list[Mesure]}: Les mesures de chaque station, dans l'ordre chronologique
+    """
+    alea = random.Random(graine)
+    res = {}
+    for station in stations:
+        mesures = []
+        cap = alea.uniform(0, 360)
+        for i in range(nb_mesures):
+            cap = (cap + alea.gauss(0, 15)) % 360
+            vent_min = round(alea.uniform(0, 20), 2)
+            vent_moyen = round(vent_min + alea.uniform(0, 10), 2)
+            vent_max = round(vent_moyen + alea.uniform(0, 10), 2)
+            date = (debut + timedelta(seconds=i * pas)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            mesures.append(Mesure(date, round(cap), vent_moyen, vent_max, vent_min, station))
+        res[station.id] = mesures
+    return res
+
+
+def chronometrer(fonction, *args, **kwargs):
+    """Exécute une fonction et mesure sa durée
+
+    Args:
+        fonction (callable): Fonction à chronométrer
+
+    Returns:
+        (float, any): Durée en secondes et résultat de la fonction
+    """
+    debut = time.perf_counter()
+    res = fonction(*args, **kwargs)
+    return time.perf_counter() - debut, res
+
+
+def executer_repetition(repertoire, nb_stations, nb_mesures, memoire=False, durabilite=PiouPiouDao.DURABILITE_COMPLETE, graine=0):
+    """Exécute une série complète d'opérations sur une BDD neuve
+
+    Args:
+        repertoire (str): Répertoire temporaire des fichiers de la BDD et de la sauvegarde
+        nb_stations (int): Nombre de stations
+        nb_mesures (int): Nombre de mesures par station
+        memoire (bool, optional): True pour une BDD en mémoire (:memory:). Defaults to False.
+        durabilite (str, optional): Mode de durabilité de la DAO. Defaults to DURABILITE_COMPLETE.
+        graine (int, optional): Graine des générateurs. Defaults to 0.
+
+    Returns:
+        dict{str:(float, int)}: Pour chaque opération, la durée totale en secondes et le nombre d'opérations élémentaires
+    """
+    stations = generer_stations(nb_stations, graine)
+    mesures = generer_mesures(stations, nb_mesures, graine=graine)
+    nb_unitaires = min(NB_MESURES_UNITAIRES, nb_mesures)
+    nom_bdd = ":memory:" if memoire else path.join(repertoire, "benchmark.db")
+    # pas de sauvegarde automatique ni de rétention pendant les ajouts : seule l'opération chronométrée est mesurée
+    ma_dao = PiouPiouDao(nom_bdd, frequence_backup=0, max_mesure=-1, durabilite=durabilite, delai_validation=None)
+    res = {}
+    try:
+        ma_dao.initialiser_bdd(drop_if_exist=True)
+
+        duree = 0.0
+        for station in stations:
+            duree += chronometrer(ma_dao.ajouter_station, station)[0]
+        res["ajouter_station"] = (duree, len(stations))
+
+        # les premières mesures de chaque station une par une, les suivantes en un lot
+        duree = 0.0
+        for station in stations:
+            for mesure in mesures[station.id][:nb_unitaires]:
+                duree += chronometrer(ma_dao.ajouter_mesure, mesure)[0]
+        duree += chronometrer(ma_dao.valider)[0]
+        res["ajouter_mesure"] = (duree, nb_unitaires * len(stations))
+
+        lot = [mesure for station in stations for mesure in mesures[station.id][nb_unitaires:]]
+        duree = chronometrer(ma_dao.ajouter_mesures, lot)[0]
+        duree += chronometrer(ma_dao.valider)[0]
+        res["ajouter_mesures"] = (duree, len(lot))
+
+        duree = 0.0
+        for station in stations:
+            duree += chronometrer(ma_dao.select_mesures, station=station)[0]
+        res["select_mesures"] = (duree, len(stations))
+
+        # requêtes courtes répétées (dix dernières minutes de chaque station) : le coût de préparation de la requête domine
+        fin = DATE_DEBUT + timedelta(seconds=nb_mesures * 60)
+        duree = 0.0
+        for station in stations:
+            duree += chronometrer(ma_dao.select_mesures, station=station, since=fin - timedelta(minutes=10), until=fin)[0]
+        res["select_mesures_periode"] = (duree, len(stations))
+
+        res["mesures"] = (chronometrer(ma_dao.mesures)[0], 1)
+
+        duree = chronometrer(ma_dao.nombre_mesures)[0]
+        for station in stations:
+            duree += chronometrer(ma_dao.nombre_mesures, station.id)[0]
+        res["nombre_mesures"] = (duree, len(stations) + 1)
+
+        # la rétention garde la moitié des mesures de chaque station
+        # l'accesseur max_mesure appliquerait la rétention hors chronométrage : seul l'attribut est modifié
+        ma_dao._max_mesure = max(1, nb_mesures // 2)
+        duree = chronometrer(ma_dao.appliquer_retention)[0]
+        duree += chronometrer(ma_dao.valider)[0]
+        res["appliquer_retention"] = (duree, 1)
+
+        # une BDD en mémoire est sauvegardée dans un fichier temporaire
+        res["creer_sauvegarde"] = (chronometrer(ma_dao.creer_sauvegarde, path.join(repertoire, "benchmark.backup.db"))[0], 1)
+    finally:
+        ma_dao.fermer()
+    return res
+
+
+def version_code():
+    """Identifie la version du code mesurée
+
+    Returns:
+        str: Hash court du commit git courant, None si indisponible
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=path.dirname(path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lancer_benchmark(nb_stations=10, nb_mesures=200, repetitions=3, memoire=False, durabilite=PiouPiouDao.DURABILITE_COMPLETE, graine=0, verbose=False):
+    """Lance le benchmark et agrège les durées des répétitions
+
+    Args:
+        nb_stations (int, optional): Nombre de stations. Defaults to 10.
+        nb_mesures (int, optional): Nombre de mesures par station. Defaults to 200.
+        repetitions (int, optional): Nombre de répétitions, chacune sur une BDD neuve. Defaults to 3.
+        memoire (bool, optional): True pour une BDD en mémoire (:memory:). Defaults to False.
+        durabilite (str, optional): Mode de durabilité de la DAO. Defaults to DURABILITE_COMPLETE.
+        graine (int, optional): Graine des générateurs. Defaults to 0.
+        verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+
+    Returns:
+        dict: Résultats sérialisables en JSON : environnement, paramètres et, pour chaque opération,
+              durées totales min / médiane (s), nombre d'opérations élémentaires et durée médiane par opération (µs)
+    """
+    durees = {}
+    repertoire = tempfile.mkdtemp(prefix="piou_piou_benchmark_")
+    try:
+        for i in range(repetitions):
+            res = executer_repetition(repertoire, nb_stations, nb_mesures, memoire=memoire, durabilite=durabilite, graine=graine)
+            for operation, (duree, nb) in res.items():
+                durees.setdefault(operation, ([], nb))[0].append(duree)
+            if verbose:
+                print(f"Benchmark > Répétition {i + 1}/{repetitions} : {sum(d for d, _ in res.values()):.3f} s", file=sys.stderr)
+    finally:
+        shutil.rmtree(repertoire, ignore_errors=True)
+
+    resultats = {}
+    for operation, (liste, nb) in durees.items():
+        mediane = statistics.median(liste)
+        resultats[operation] = {"nb": nb, "min_s": min(liste), "mediane_s": mediane, "mediane_par_operation_us": mediane / nb * 1e6}
+    return {
+        "version": version_code(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "parametres": {"stations": nb_stations, "mesures": nb_mesures, "repetitions": repetitions, "memoire": memoire,
+                       "durabilite": durabilite, "graine": graine},
+        "resultats": resultats,
+    }
+
+
+def comparer(reference, resultat):
+    """Compare deux résultats de benchmark, opération par opération
+
+    Args:
+        reference (dict): Résultat de référence (lancer_benchmark)
+        resultat (dict): Résultat à comparer
+
+    Returns:
+        list[str]: Une ligne par opération : durées médianes par opération et rapport résultat / référence
+    """
+    lignes = [f"{'opération':<22}{'référence (µs)':>16}{'actuel (µs)':>14}{'rapport':>10}"]
+    for operation, mesure in resultat["resultats"].items():
+        ref = reference["resultats"].get(operation)
+        actuel = mesure["mediane_par_operation_us"]
+        if ref is None:
+            lignes.append(f"{operation:<22}{'-':>16}{actuel:>14.1f}{'-':>10}")
+        else:
+            ref = ref["mediane_par_operation_us"]
+            rapport = actuel / ref if ref else float("inf")
+            lignes.append(f"{operation:<22}{ref:>16.1f}{actuel:>14.1f}{rapport:>9.2f}x")
+    return lignes
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Micro-benchmark de la DAO Piou Piou")
+    parser.add_argument("--stations", type=int, default=10, help="nombre de stations (défaut 10)")
+    parser.add_argument("--mesures", type=int, default=200, help="nombre de mesures par station (défaut 200)")
+    parser.add_argument("--repetitions", type=int, default=3, help="nombre de répétitions, chacune sur une BDD neuve (défaut 3)")
+    parser.add_argument("--memoire", action="store_true", help="BDD en mémoire (:memory:) au lieu d'un fichier temporaire")
+    parser.add_argument("--durabilite", choices=PiouPiouDao.DURABILITES, default=PiouPiouDao.DURABILITE_COMPLETE, help="mode de durabilité de la DAO")
+    parser.add_argument("--graine", type=int, default=0, help="graine des générateurs de données (défaut 0)")
+    parser.add_argument("--sortie", help="fichier JSON des résultats (défaut : sortie standard)")
+    parser.add_argument("--comparer", help="fichier JSON de référence : affiche le rapport des durées sur la sortie d'erreur")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="traces de progression sur la sortie d'erreur")
+    args = parser.parse_args()
+
+    resultat = lancer_benchmark(args.stations, args.mesures, args.repetitions, memoire=args.memoire, durabilite=args.durabilite,
+                                graine=args.graine, verbose=args.verbose)
+    texte = json.dumps(resultat, indent=2, ensure_ascii=False)
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as fichier:
+            fichier.write(texte + "\n")
+    else:
+        print(texte)
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as fichier:
+            print("\n".join(comparer(json.load(fichier), resultat)), file=sys.stderr)
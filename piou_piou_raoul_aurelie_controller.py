@@ -1,7 +1,17 @@
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from piou_piou_raoul_aurelie_dao import *
 from piou_piou_raoul_aurelie_objets import *
 from datetime import datetime
+import json
+from itertools import chain
+from os import path, remove, replace
+import queue
+import sqlite3
+import sys
+import tempfile
+import threading
 import time
 
 
@@ -22,9 +32,29 @@ stations_22 = {
 }
 
 BDD_NAME = 'my_piou_piou_raoul_aurelie.db'
+# Instantané des stations et de leurs mesures, écrit à l'arrêt pour un démarrage rapide, None pour le désactiver
+INSTANTANE_NAME = 'my_piou_piou_raoul_aurelie.instantane.json'
+# Métriques au format texte Prometheus (durées SQL et API, validations, sauvegardes), None pour les désactiver
+METRIQUES_NAME = 'my_piou_piou_raoul_aurelie.prom'
 PP_URL_API_LIVE = "http://api.pioupiou.fr/v1/live/"
+PP_URL_API_LIVE_ALL = PP_URL_API_LIVE + "all"
+# à partir de ce nombre de stations suivies, un seul appel à live/all remplace les appels par station
+SEUIL_RAFRAICHISSEMENT_GLOBAL = 10
+TAILLE_MORCEAU_HTTP = 64 * 1024 # taille des morceaux lus lors de la lecture en flux de la réponse live/all
 TIMEOUT = 5 # nombre de seconde à attendre
 SLEEP_TIME =  30 # in secondes
+NB_REQUETES_PARALLELES = 8 # nombre maximum d'appels simultanés à l'API
+
+# Planification des relevés : chaque station est interrogée juste après sa prochaine mesure attendue
+PERIODE_RELEVE_MIN = 10 # in secondes, délai minimum entre deux relevés d'une station
+PERIODE_RELEVE_MAX = 30 * 60 # in secondes, délai maximum entre deux relevés d'une station (station en erreur ou silencieuse)
+MARGE_RELEVE = 5 # in secondes, délai après la date attendue de la prochaine mesure
+LISSAGE_CADENCE = 0.3 # poids de la dernière période observée dans la cadence de la station (moyenne mobile exponentielle)
+
+# Collecte : les relevés de l'API et les écritures en BDD sont faits par des threads différents
+TAILLE_FILE_MESURES = 1000 # nombre maximum de mesures en attente d'écriture, les relevés attendent au-delà
+TAILLE_LOT_ECRITURE = 200 # nombre maximum de mesures écrites en BDD en une fois
+DELAI_LOT_ECRITURE = 0.5 # in secondes, attente maximum pour compléter un lot avant de l'écrire
 
 MAX_MESURE_MOD_STATION = 'station'
 MAX_MESURE_MOD_ALL = 'all'
@@ -32,7 +62,8 @@ MAX_MESURE_MOD_ALL = 'all'
 max_mesure=10
 max_mesure_mod = MAX_MESURE_MOD_STATION
 
-curent_path = getcwd()+ "\\projet_sql_piou_piou_foil\\"
+# Répertoire du programme (la base est créée à côté des sources)
+curent_path = path.dirname(path.abspath(__file__))
 
 # verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
 verbose = 1
@@ -43,13 +74,227 @@ verbose = 1
 #                               FONCTIONS
 # ---------------------------------------------------------------------------------------------
 
-def api_station_information(url, id_station, verbose=False):
+_session = None
+_verrou_session = threading.Lock()
+
+# Métriques des appels à l'API (durées, statuts HTTP, erreurs), None pour ne rien mesurer.
+# Peut être le même objet Metriques que celui de la DAO, pour un seul export.
+metriques_api = None
+
+def session_http(nb_connexions=NB_REQUETES_PARALLELES):
+    """Retourne la session HTTP partagée (connexions keep-alive réutilisées d'un appel à l'autre)
+
+    Args:
+        nb_connexions (int, optional): nombre de connexions conservées par hôte. Defaults to NB_REQUETES_PARALLELES.
+
+    Returns:
+        requests.Session: la session partagée
+    """
+    global _session
+    with _verrou_session:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=nb_connexions)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+    return _session
+
+
+def _appeler_api(session, url, appel, timeout=TIMEOUT, **kwargs):
+    """Effectue la requête GET sur l'API, en mesurant sa durée, son statut et ses erreurs lorsque metriques_api est défini
+
+    Args:
+        session (requests.Session): session HTTP
+        url (str): url complète de la requête
+        appel (str): nom de l'appel pour les métriques ('station', 'mesure', 'toutes')
+        timeout (float, optional): délai maximum de connexion et de lecture en secondes. Defaults to TIMEOUT.
+
+    Raises:
+        requests.RequestException: En cas d'erreur de connexion ou de délai dépassé
+
+    Returns:
+        requests.Response: la réponse
+    """
+    metriques = metriques_api
+    if metriques is None:
+        return session.get(url=url, timeout=timeout, **kwargs)
+    debut = time.perf_counter()
+    try:
+        resp = session.get(url=url, timeout=timeout, **kwargs)
+    except requests.RequestException as error:
+        metriques.incrementer("api_erreurs_total", appel=appel, erreur=type(error).__name__)
+        raise
+    finally:
+        metriques.observer("api_duree_secondes", time.perf_counter() - debut, appel=appel)
+    metriques.incrementer("api_requetes_total", appel=appel, statut=resp.status_code)
+    if resp.status_code != 200:
+        metriques.incrementer("api_erreurs_total", appel=appel, erreur=f"http_{resp.status_code}")
+    return resp
+
+
+class EtatReleve:
+    """Planification des relevés d'une station
+    """
+    __slots__ = ("derniere_date", "cadence", "dernier_releve", "prochain_releve", "nb_echecs", "nb_silences")
+
+    def __init__(self, derniere_date=None):
+        """
+        Args:
+            derniere_date (int, optional): date de la dernière mesure connue, en timestamp epoch. Defaults to None.
+        """
+        self.derniere_date = derniere_date
+        self.cadence = None # période de mesure observée, en secondes
+        self.dernier_releve = None # timestamp epoch du dernier appel réussi
+        self.prochain_releve = 0 # timestamp epoch, 0 : à interroger immédiatement
+        self.nb_echecs = 0
+        self.nb_silences = 0
+
+
+class PlanificateurReleves:
+    """Planifie les appels à l'API station par station.
+    La cadence de chaque station est apprise à partir de l'écart entre les dates de ses mesures successives (moyenne mobile exponentielle),
+    la station est interrogée juste après la date attendue de sa prochaine mesure.
+    Une station en erreur ou qui ne publie pas de nouvelle mesure est interrogée de moins en moins souvent (délai doublé, jusqu'à periode_max).
+    """
+
+    def __init__(self, periode_initiale=SLEEP_TIME, periode_min=PERIODE_RELEVE_MIN, periode_max=PERIODE_RELEVE_MAX,
+                 marge=MARGE_RELEVE, lissage=LISSAGE_CADENCE, horloge=time.time):
+        """
+        Args:
+            periode_initiale (float, optional): délai entre deux relevés tant que la cadence de la station est inconnue, en secondes. Defaults to SLEEP_TIME.
+            periode_min (float, optional): délai minimum entre deux relevés d'une station, en secondes. Defaults to PERIODE_RELEVE_MIN.
+            periode_max (float, optional): délai maximum entre deux relevés d'une station, en secondes. Defaults to PERIODE_RELEVE_MAX.
+            marge (float, optional): délai après la date attendue de la prochaine mesure, en secondes. Defaults to MARGE_RELEVE.
+            lissage (float, optional): poids de la dernière période observée dans la cadence, entre 0 et 1. Defaults to LISSAGE_CADENCE.
+            horloge (callable, optional): heure courante en timestamp epoch. Defaults to time.time.
+        """
+        self.periode_initiale = periode_initiale
+        self.periode_min = periode_min
+        self.periode_max = periode_max
+        self.marge = marge
+        self.lissage = lissage
+        self.horloge = horloge
+        self._etats = {}
+
+    def etat(self, station):
+        """
+        Args:
+            station (Station/int): station ou identifiant de la station
+
+        Returns:
+            EtatReleve: planification de la station, None si la station n'a jamais été planifiée
+        """
+        return self._etats.get(station.id if isinstance(station, Station) else station)
+
+    def _etat(self, station):
+        etat = self._etats.get(station.id)
+        if etat is None:
+            # la dernière mesure chargée depuis la BDD sert de référence pour la première période observée
+            derniere = station.derniere_mesure()
+            etat = EtatReleve(derniere.timestamp if derniere is not None else None)
+            self._etats[station.id] = etat
+        return etat
+
+    def stations_a_interroger(self, stations, maintenant=None):
+        """
+        Args:
+            stations (Iterable[Station]): stations suivies
+            maintenant (float, optional): heure courante en timestamp epoch. Defaults to None, l'heure de l'horloge.
+
+        Returns:
+            List[Station]: stations dont le relevé est dû, les nouvelles stations sont dues immédiatement
+        """
+        if maintenant is None:
+            maintenant = self.horloge()
+        return [station for station in stations if self._etat(station).prochain_releve <= maintenant]
+
+    def delai_avant_prochain_releve(self, stations, maintenant=None):
+        """
+        Args:
+            stations (Iterable[Station]): stations suivies
+            maintenant (float, optional): heure courante en timestamp epoch. Defaults to None, l'heure de l'horloge.
+
+        Returns:
+            float: nombre de secondes avant le prochain relevé dû, 0 si un relevé est déjà dû
+        """
+        if maintenant is None:
+            maintenant = self.horloge()
+        prochain = min((self._etat(station).prochain_releve for station in stations), default=maintenant + self.periode_initiale)
+        return max(0, min(prochain - maintenant, self.periode_max))
+
+    def marquer_en_cours(self, station, maintenant=None):
+        """Reporte le prochain relevé de la station pendant son interrogation (replanifiée par enregistrer_releve ou enregistrer_echec)
+
+        Args:
+            station (Station): station en cours d'interrogation
+            maintenant (float, optional): heure courante en timestamp epoch. Defaults to None, l'heure de l'horloge.
+        """
+        if maintenant is None:
+            maintenant = self.horloge()
+        self._etat(station).prochain_releve = maintenant + self.periode_max
+
+    def enregistrer_releve(self, station, mesure, maintenant=None):
+        """Met à jour la cadence de la station à partir de la mesure lue et planifie son prochain relevé
+
+        Args:
+            station (Station): station interrogée
+            mesure (Mesure): mesure lue, None si la station n'a pas de mesure
+            maintenant (float, optional): heure courante en timestamp epoch. Defaults to None, l'heure de l'horloge.
+
+        Returns:
+            bool: True si la mesure est plus récente que la dernière mesure connue de la station
+        """
+        if maintenant is None:
+            maintenant = self.horloge()
+        etat = self._etat(station)
+        etat.nb_echecs = 0
+        dernier_releve = etat.dernier_releve
+        etat.dernier_releve = maintenant
+        date = mesure.timestamp if mesure is not None else None
+        if date is None or (etat.derniere_date is not None and date <= etat.derniere_date):
+            # pas de nouvelle mesure : la station est en retard ou silencieuse
+            etat.nb_silences += 1
+            etat.prochain_releve = maintenant + min(self.periode_max, self.periode_min * 2 ** (etat.nb_silences - 1))
+            return False
+        # l'écart avec une mesure chargée depuis la BDD (avant le premier appel) n'est pas une période de mesure
+        if etat.derniere_date is not None and dernier_releve is not None:
+            periode = date - etat.derniere_date
+            if etat.cadence is not None and periode > 1.5 * etat.cadence and date - dernier_releve > etat.cadence:
+                # des mesures ont pu être publiées entre les deux appels sans être lues (échecs) : période moyenne
+                periode /= round(periode / etat.cadence)
+            periode = min(max(periode, self.periode_min), self.periode_max)
+            etat.cadence = periode if etat.cadence is None else (1 - self.lissage) * etat.cadence + self.lissage * periode
+        etat.derniere_date = date
+        etat.nb_silences = 0
+        if etat.cadence is None:
+            etat.prochain_releve = maintenant + self.periode_initiale
+        else:
+            etat.prochain_releve = max(date + etat.cadence + self.marge, maintenant + self.periode_min)
+        return True
+
+    def enregistrer_echec(self, station, maintenant=None):
+        """Planifie le prochain relevé d'une station en erreur, le délai double à chaque échec consécutif
+
+        Args:
+            station (Station): station interrogée
+            maintenant (float, optional): heure courante en timestamp epoch. Defaults to None, l'heure de l'horloge.
+        """
+        if maintenant is None:
+            maintenant = self.horloge()
+        etat = self._etat(station)
+        etat.nb_echecs += 1
+        etat.prochain_releve = maintenant + min(self.periode_max, self.periode_initiale * 2 ** (etat.nb_echecs - 1))
+
+
+def api_station_information(url, id_station, verbose=False, session=None, timeout=TIMEOUT):
     """Appelle l'API pour récupérer la mesure de la station reçue
 
     Args:
         url (str): url de l'API (sans l'id de la station)
         id_station (int): identifiant de la station
         verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+        session (requests.Session, optional): session HTTP. Defaults to None, la session partagée.
+        timeout (float, optional): délai maximum de connexion et de lecture en secondes. Defaults to TIMEOUT.
 
     Raises:
         Exception: En cas d'incohérence entre les donnes reçues et la station
@@ -61,7 +306,9 @@ def api_station_information(url, id_station, verbose=False):
     nouvelle_station = None
     if id_station is not None and isinstance(id_station, int):       
         # Récupération des données de l'API avec l'ID de la station
-        resp = requests.get(url=url+str(id_station))
+        if session is None:
+            session = session_http()
+        resp = _appeler_api(session, url+str(id_station), "station", timeout)
         data = resp.json()
         # Vérification du code réponse
         if resp.status_code == 200 :
@@ -84,25 +331,282 @@ def api_station_information(url, id_station, verbose=False):
     return nouvelle_station
 
 
-def api_mesure_courante_pour_la_station(url, station, verbose=False):
-    """Appelle l'API pour récupérer la mesure de la station reçue
+def _mesure_depuis_json(data, station, verbose=False):
+    """Créé la mesure à partir des données JSON d'une station renvoyées par l'API
+
+    Args:
+        data (dict): données de la station (id, meta, location, measurements, ...)
+        station (Station): Station de la mesure
+        verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+
+    Returns:
+        Mesure: la mesure, None si la station n'a pas encore de mesure
+    """
+    # Information sur la mesure
+    measurements = data['measurements']
+    if measurements is None or measurements['date'] is None:
+        return None
+    measures_date_str1 = measurements['date']
+    # convertion en date
+    measures_date_str = datetime.fromisoformat(measures_date_str1[:-1])
+    # "2022-01-17T09:45:47.000Z"  ==> YYYY-MM-DDTHH:MM:SS.mmmmmm
+    measures_date = measures_date_str.strftime('%Y-%m-%d %H:%M:%S')
+    wind_heading = measurements['wind_heading']
+    wind_speed_avg = measurements['wind_speed_avg']
+    wind_speed_min = measurements['wind_speed_min']
+    wind_speed_max = measurements['wind_speed_max']
+    if verbose:
+        print(f"{data['id']} : {measures_date} - {wind_heading}, {wind_speed_avg}, {wind_speed_min} => {data['meta']['name']}")
+    return Mesure(measures_date, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min, station)
+
+
+def _fin_valeur_json(texte, debut):
+    """Cherche la fin de la valeur JSON qui commence à la position debut, sans la décoder (les chaînes et les imbrications sont prises en compte)
+
+    Args:
+        texte (str): texte lu
+        debut (int): position du premier caractère de la valeur
+
+    Returns:
+        int: position qui suit la fin de la valeur, None si la valeur est incomplète
+    """
+    pos = debut
+    if texte[debut] not in '{["':
+        # nombre, true, false ou null : jusqu'au séparateur suivant
+        while pos < len(texte):
+            if texte[pos] in ',]} \t\r\n':
+                return pos
+            pos += 1
+        return None
+    profondeur = 0
+    dans_chaine = False
+    while pos < len(texte):
+        caractere = texte[pos]
+        if dans_chaine:
+            if caractere == '\\':
+                pos += 2
+                continue
+            if caractere == '"':
+                dans_chaine = False
+                if profondeur == 0:
+                    return pos + 1
+        elif caractere == '"':
+            dans_chaine = True
+        elif caractere in '{[':
+            profondeur += 1
+        elif caractere in '}]':
+            profondeur -= 1
+            if profondeur == 0:
+                return pos + 1
+        pos += 1
+    return None
+
+
+def _iterer_donnees_json(morceaux):
+    """Lit en flux le tableau "data" d'une réponse JSON de l'API : chaque station est décodée dès qu'elle est complète,
+    sans charger toute la réponse en mémoire. Les clés de l'objet réponse sont lues jusqu'à la clé "data",
+    la réponse qui suit la fin du tableau n'est pas lue.
+
+    Args:
+        morceaux (Iterable[str]): morceaux successifs du texte de la réponse
+
+    Raises:
+        ValueError: Si la réponse n'est pas un objet JSON valide, n'a pas de tableau "data",
+                    contient une station invalide ou se termine avant la fin du tableau
+
+    Yields:
+        dict: données d'une station
+    """
+    decodeur = json.JSONDecoder()
+    tampon = ""
+    pos = 0
+    # objet, cle, deux_points, valeur, suite_objet, premier_element, element, suite_tableau
+    etape = "objet"
+    cle = None
+    for morceau in chain(morceaux, [None]):
+        if morceau is not None:
+            tampon += morceau
+        while True:
+            while pos < len(tampon) and tampon[pos] in ' \t\r\n':
+                pos += 1
+            if pos >= len(tampon):
+                break
+            caractere = tampon[pos]
+            if etape == "objet":
+                if caractere != '{':
+                    raise ValueError(f"Réponse JSON invalide : objet attendu et non {caractere!r}")
+                pos += 1
+                etape = "cle"
+            elif etape in ("cle", "suite_objet") and caractere == '}':
+                raise ValueError('Réponse JSON sans tableau "data"')
+            elif etape == "suite_objet":
+                if caractere != ',':
+                    raise ValueError(f"Réponse JSON invalide : ',' attendue et non {caractere!r}")
+                pos += 1
+                etape = "cle"
+            elif etape == "deux_points":
+                if caractere != ':':
+                    raise ValueError(f"Réponse JSON invalide : ':' attendu et non {caractere!r}")
+                pos += 1
+                etape = "valeur"
+            elif etape == "valeur" and cle == "data":
+                if caractere != '[':
+                    raise ValueError('Réponse JSON invalide : "data" n\'est pas un tableau')
+                pos += 1
+                etape = "premier_element"
+            elif etape in ("premier_element", "suite_tableau") and caractere == ']':
+                return
+            elif etape == "suite_tableau":
+                if caractere != ',':
+                    raise ValueError(f"Réponse JSON invalide : ',' attendue et non {caractere!r}")
+                pos += 1
+                etape = "element"
+            else:
+                # clé, valeur d'une autre clé ou station : décodée lorsqu'elle est complète
+                if etape == "cle" and caractere != '"':
+                    raise ValueError(f"Réponse JSON invalide : clé attendue et non {caractere!r}")
+                try:
+                    valeur, pos_fin = decodeur.raw_decode(tampon, pos)
+                except json.JSONDecodeError as error:
+                    # valeur coupée entre deux morceaux : on attend le morceau suivant, sinon la valeur est invalide
+                    if _fin_valeur_json(tampon, pos) is None:
+                        break
+                    raise ValueError(f"Réponse JSON invalide : {error}") from error
+                if pos_fin >= len(tampon) and caractere not in '{["':
+                    # un nombre (ou true, false, null) en fin de tampon peut continuer dans le morceau suivant
+                    break
+                pos = pos_fin
+                if etape == "cle":
+                    cle = valeur
+                    etape = "deux_points"
+                elif etape == "valeur":
+                    etape = "suite_objet"
+                else:
+                    yield valeur
+                    etape = "suite_tableau"
+        tampon = tampon[pos:]
+        pos = 0
+    raise ValueError('Réponse JSON incomplète : fin du flux avant la fin du tableau "data"')
+
+
+def api_iterer_toutes_les_mesures(url, gestionnaire, verbose=False, session=None, timeout=TIMEOUT):
+    """Lit en flux (live/all) la mesure courante de toutes les stations du réseau, seules les stations suivies par le gestionnaire sont retournées.
+    Les mesures ne sont pas ajoutées aux stations.
+
+    Args:
+        url (str): url de l'API live/all
+        gestionnaire (GestionnaireDeStations): gestionnaire des stations suivies
+        verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+        session (requests.Session, optional): session HTTP. Defaults to None, la session partagée.
+        timeout (float, optional): délai maximum de connexion et de lecture en secondes. Defaults to TIMEOUT.
+
+    Raises:
+        http_error : En cas d'erreur d'accès à l'API
+
+    Yields:
+        tuple(Station, Mesure): station suivie et sa mesure (None si la station n'a pas encore de mesure)
+    """
+    if session is None:
+        session = session_http()
+    with _appeler_api(session, url, "toutes", timeout, stream=True) as resp:
+        if resp.status_code != 200:
+            data = resp.json()
+            print(f'{resp.status_code} => {data["error_code"]} : {data["error_message"]} \n {url}')
+            resp.raise_for_status()
+        if verbose>1:
+            print(f"API > Statut {resp.status_code}")
+        if resp.encoding is None:
+            resp.encoding = "utf-8"
+        for data in _iterer_donnees_json(resp.iter_content(chunk_size=TAILLE_MORCEAU_HTTP, decode_unicode=True)):
+            station = gestionnaire.station(data.get('id'))
+            if station is None or not isinstance(station, Station):
+                continue
+            yield station, _mesure_depuis_json(data, station, verbose)
+
+
+def api_recuperer_toutes_les_mesures(url, gestionnaire, verbose=False, session=None, timeout=TIMEOUT, planificateur=None, stations=None):
+    """Récupère en un seul appel (live/all) la mesure courante de toutes les stations du réseau,
+    seules les stations suivies par le gestionnaire (ou les stations reçues) sont conservées.
+
+    Args:
+        url (str): url de l'API live/all
+        gestionnaire (GestionnaireDeStations): gestionnaire des stations suivies
+        verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+        session (requests.Session, optional): session HTTP. Defaults to None, la session partagée.
+        timeout (float, optional): délai maximum de connexion et de lecture en secondes. Defaults to TIMEOUT.
+        planificateur (PlanificateurReleves, optional): planification des relevés, mise à jour pour chaque station conservée. Defaults to None.
+        stations (Iterable[Station], optional): stations à conserver (dont le relevé est dû). Defaults to None, toutes les stations suivies.
+
+    Raises:
+        http_error : En cas d'erreur d'accès à l'API
+
+    Returns:
+        List[Mesures]: Liste des mesures récupérées
+    """
+    ids_stations = None if stations is None else {station.id for station in stations}
+    mesures = []
+    for station, mesure in api_iterer_toutes_les_mesures(url, gestionnaire, verbose, session, timeout):
+        if ids_stations is not None and station.id not in ids_stations:
+            # relevé non dû : ni la mesure ni la planification de la station ne sont modifiées
+            continue
+        if planificateur is not None:
+            planificateur.enregistrer_releve(station, mesure)
+        if mesure is not None:
+            mesures.append(station.ajouter_mesure(mesure))
+    return mesures
+
+
+def api_rafraichir_mesures(gestionnaire, verbose=False, session=None, timeout=TIMEOUT, planificateur=None):
+    """Récupère la mesure courante des stations suivies : un appel par station,
+    ou un seul appel à live/all lorsque le nombre de stations atteint SEUIL_RAFRAICHISSEMENT_GLOBAL.
+    Avec un planificateur, seules les stations dont le relevé est dû sont conservées, quel que soit l'appel utilisé.
+
+    Args:
+        gestionnaire (GestionnaireDeStations): gestionnaire des stations suivies
+        verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+        session (requests.Session, optional): session HTTP. Defaults to None, la session partagée.
+        timeout (float, optional): délai maximum de connexion et de lecture en secondes. Defaults to TIMEOUT.
+        planificateur (PlanificateurReleves, optional): pour n'interroger que les stations dont le relevé est dû. Defaults to None, toutes les stations.
+
+    Returns:
+        List[Mesures]: Liste des mesures récupérées
+    """
+    stations = None
+    if planificateur is not None:
+        stations = planificateur.stations_a_interroger(gestionnaire.iter_stations())
+        if len(stations) == 0:
+            return []
+    if len(gestionnaire.stations) >= SEUIL_RAFRAICHISSEMENT_GLOBAL:
+        try:
+            return api_recuperer_toutes_les_mesures(PP_URL_API_LIVE_ALL, gestionnaire, verbose, session, timeout, planificateur, stations)
+        except (requests.RequestException, ValueError) as error:
+            print(f"API > Erreur lors de la récupération globale des mesures, interrogation station par station : {error}")
+    return api_recuperer_mesures(PP_URL_API_LIVE, gestionnaire, verbose, session, timeout, stations=stations, planificateur=planificateur)
+
+
+def api_lire_mesure(url, station, verbose=False, session=None, timeout=TIMEOUT):
+    """Appelle l'API pour lire la mesure courante de la station reçue, sans l'ajouter à la station
 
     Args:
         url (str): url de l'API (sans l'id de la station)
-        station (Station): Station à mettre à jour
+        station (Station): Station à interroger
         verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+        session (requests.Session, optional): session HTTP. Defaults to None, la session partagée.
+        timeout (float, optional): délai maximum de connexion et de lecture en secondes. Defaults to TIMEOUT.
 
     Raises:
         Exception: En cas d'incohérence entre les donnes reçues et la station
         http_error : En cas d'erreur d'accès à l'API
 
     Returns:
-        Mesure: la mesure ou None
+        Mesure: la mesure lue ou None
     """
     mesure = None
     if station is not None and isinstance(station, Station):       
+        if session is None:
+            session = session_http()
         # Récupération des données de l'API avec l'ID de la station
-        resp = requests.get(url=url+str(station.id))
+        resp = _appeler_api(session, url+str(station.id), "mesure", timeout)
         data = resp.json()
         # Vérification du code réponse
         if resp.status_code == 200 :
@@ -115,126 +619,659 @@ def api_mesure_courante_pour_la_station(url, station, verbose=False):
             name = data['meta']['name']
             # Vérification de la cohérence entre la station de la mesure et la station courante
             if id == station.id:
-                # Information sur la mesure
-                data = data['measurements']
-                measures_date_str1 = data['date']
-                # convertion en date
-                measures_date_str = datetime.fromisoformat(measures_date_str1[:-1])
-                # "2022-01-17T09:45:47.000Z"  ==> YYYY-MM-DDTHH:MM:SS.mmmmmm
-                measures_date = measures_date_str.strftime('%Y-%m-%d %H:%M:%S')
-                wind_heading = data['wind_heading']
-                wind_speed_avg = data['wind_speed_avg']
-                wind_speed_min = data['wind_speed_min']
-                wind_speed_max = data['wind_speed_max']
-                if verbose:
-                    print(f"{id} : {measures_date} - {wind_heading}, {wind_speed_avg}, {wind_speed_min} => {name}")
-                mesure = station.ajouter_mesure(date=measures_date, wind_heading=wind_heading, wind_speed_avg=wind_speed_avg, wind_speed_max=wind_speed_max, wind_speed_min=wind_speed_min)
+                mesure = _mesure_depuis_json(data, station, verbose)
             else:
                 raise Exception(f"La mesure reçue pour la station {id}-{name} ne concerne pas la station {station.id}-{station.name}")
         else:
             print(f'{resp.status_code} => {data["error_code"]} : {data["error_message"]} \n {url+str(station.id)}')
             resp.raise_for_status()
     return mesure
-   
-def api_recuperer_mesures(url, gestionnaire, verbose=False):
-    """[summary]
+
+
+def api_mesure_courante_pour_la_station(url, station, verbose=False, session=None, timeout=TIMEOUT):
+    """Appelle l'API pour récupérer la mesure de la station reçue et l'ajoute à la station
 
     Args:
-        url ([type]): [description]
-        gestionnaire ([type]): [description]
+        url (str): url de l'API (sans l'id de la station)
+        station (Station): Station à mettre à jour
         verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+        session (requests.Session, optional): session HTTP. Defaults to None, la session partagée.
+        timeout (float, optional): délai maximum de connexion et de lecture en secondes. Defaults to TIMEOUT.
+
+    Raises:
+        Exception: En cas d'incohérence entre les donnes reçues et la station
+        http_error : En cas d'erreur d'accès à l'API
 
     Returns:
-        List[Mesures]: Liste des mesures récupérées
+        Mesure: la mesure ou None
     """
+    mesure = api_lire_mesure(url, station, verbose, session, timeout)
+    if mesure is not None:
+        mesure = station.ajouter_mesure(mesure)
+    return mesure
+
+
+def api_recuperer_mesures(url, gestionnaire, verbose=False, session=None, timeout=TIMEOUT, nb_paralleles=NB_REQUETES_PARALLELES, stations=None, planificateur=None):
+    """Récupère la mesure courante de chaque station du gestionnaire.
+    Les stations sont interrogées en parallèle, la durée d'un cycle est celle de la station la plus lente.
+    Une station en erreur est ignorée pour ce cycle.
+
+    Args:
+        url (str): url de l'API (sans l'id de la station)
+        gestionnaire (GestionnaireDeStations): gestionnaire des stations à interroger
+        verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+        session (requests.Session, optional): session HTTP. Defaults to None, la session partagée.
+        timeout (float, optional): délai maximum de connexion et de lecture en secondes, par requête. Defaults to TIMEOUT.
+        nb_paralleles (int, optional): nombre maximum de requêtes simultanées. Defaults to NB_REQUETES_PARALLELES.
+        stations (List[Station], optional): stations à interroger. Defaults to None, toutes les stations du gestionnaire.
+        planificateur (PlanificateurReleves, optional): planification des relevés, mise à jour pour chaque station interrogée. Defaults to None.
 
+    Returns:
+        List[Mesures]: Liste des mesures récupérées
+    """
     mesures = []
-    stations = gestionnaire.stations
-    # Récupéreration des mesures pour chaque station
-    for station in stations.values():
-        mesure = api_mesure_courante_pour_la_station(url, station, verbose)
-        if mesure is not None:
-            mesures.append(mesure)
+    stations = list(gestionnaire.stations.values()) if stations is None else list(stations)
+    if len(stations) == 0:
+        return mesures
+    if session is None:
+        session = session_http(nb_paralleles)
+    with ThreadPoolExecutor(max_workers=max(1, min(nb_paralleles, len(stations))), thread_name_prefix="piou_piou_api") as executor:
+        lectures = [(station, executor.submit(api_lire_mesure, url, station, verbose, session, timeout)) for station in stations]
+        # Les mesures sont ajoutées aux stations dans ce thread, dans l'ordre des stations
+        for station, lecture in lectures:
+            try:
+                mesure = lecture.result()
+            except Exception as error:
+                print(f"API > Erreur lors de la récupération de la mesure de la station {station.id} : {error}")
+                if planificateur is not None:
+                    planificateur.enregistrer_echec(station)
+                continue
+            if planificateur is not None:
+                planificateur.enregistrer_releve(station, mesure)
+            if mesure is not None:
+                mesures.append(station.ajouter_mesure(mesure))
             
     return mesures
 
 def dao_ajouter_mesures_bdd(mesures, ma_dao, verbose=False):
-    """Vérifie et au besoin ajoute en BDD les mesures en mémoire qui ne sont pas encore en BDD
+    """Ajoute en BDD les mesures en mémoire qui ne sont pas encore en BDD.
+    Les mesures déjà en BDD (même station et même date) sont écartées par le cache des dernières mesures de la DAO,
+    ou à défaut ignorées par la contrainte d'unicité.
 
     Args:
         mesures (List[Mesure]): mesures à ajouter
         ma_dao (PiouPiouDao): dao
         verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+
+    Returns:
+        int: nombre de mesures réellement ajoutées en BDD
     """
-    # Vérifier si les mesures en BDD sont différentes ou non
-    for mesure in mesures:
-        # id_station=None, mesure_date=None, wind_heading=None, wind_speed_avg=None, wind_speed_min=None,wind_speed_max=None
-        dao_mesure_list = ma_dao.select_mesures(station=mesure.station, mesure_date=mesure.date, wind_heading=mesure.wind_heading, wind_speed_avg=mesure.wind_speed_avg, wind_speed_min=mesure.wind_speed_min,wind_speed_max=mesure.wind_speed_max, verbose=verbose)
-        if dao_mesure_list is not None and len(dao_mesure_list)>0:
-            pass
-        else:
-            # Sauvegarder en BDD
-            ma_dao.ajouter_mesure(mesure, verbose)
+    if len(mesures) == 0:
+        return 0
+    ma_dao.ajouter_mesures(mesures, verbose=verbose, ignorer_doublons=True)
+    return ma_dao.nb_mesures_inserees
 
 
-def dao_synchroniser_bdd(gestionnaire, ma_dao, verbose=False):
-    """Rafraîchit les mesures de chaque station par rapport à ce qui est en BDD
+def dao_synchroniser_bdd(gestionnaire, ma_dao, verbose=False, complete=False, stations=None):
+    """Rafraîchit les mesures de chaque station par rapport à ce qui est en BDD.
+    La synchronisation est incrémentale : seules les mesures plus récentes que la dernière mesure connue sont lues,
+    les mesures supprimées par la rétention et les mesures non enregistrées (doublons) sont retirées de la mémoire.
 
     Args:
         gestionnaire (GestionnaireDeStations): gestionnaire des stations
         ma_dao (PiouPiouDao): dao
         verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+        complete (bool, optional): True pour recharger toutes les mesures de la BDD. Defaults to False.
+        stations (Iterable[Station], optional): stations à synchroniser. Defaults to None, toutes les stations du gestionnaire.
     """
-    stations = gestionnaire.stations
+    if stations is None:
+        stations = gestionnaire.iter_stations()
     # Récupéreration des mesures pour chaque station
-    for station in stations.values():
-        # pour être sûre d'avoir les mêmes données qu'en BDD, on remplace les données en mémoire par les données de la BDD        
-        station.mesures = ma_dao.select_mesures(station=station, verbose=verbose)
+    for station in stations:
+        dernier_id = station.dernier_id_mesure()
+        if complete or dernier_id is None:
+            # pour être sûre d'avoir les mêmes données qu'en BDD, on remplace les données en mémoire par les données de la BDD        
+            station.mesures = ma_dao.select_mesures(station=station, verbose=verbose)
+        else:
+            premier_id = ma_dao.premier_id_mesure(station, verbose=verbose)
+            if premier_id is None:
+                # toutes les mesures de la station ont été supprimées par la rétention
+                station.mesures = []
+                continue
+            station.retirer_mesures(id_min=premier_id, non_enregistrees=True)
+            for mesure in ma_dao.select_mesures(station=station, after_id=dernier_id, verbose=verbose):
+                station.mesures = mesure
+
+
+def sauvegarder_instantane(gestionnaire, ma_dao, file_path, verbose=False):
+    """Écrit l'instantané des stations (et de leurs mesures enregistrées) et de la DAO, pour un démarrage rapide au prochain lancement.
+    Le fichier est remplacé d'un bloc (fichier temporaire puis renommage).
+
+    Args:
+        gestionnaire (GestionnaireDeStations): gestionnaire des stations
+        ma_dao (PiouPiouDao): dao, les écritures en attente sont validées
+        file_path (str): chemin complet du fichier de l'instantané
+        verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+
+    Returns:
+        bool: True si l'instantané a été écrit
+    """
+    donnees = {"dao": ma_dao.instantane(verbose), "stations": gestionnaire.vers_instantane()}
+    if donnees["dao"]["empreinte"] is None:
+        return False
+    fichier_temp = None
+    try:
+        # fichier temporaire unique : deux sauvegardes simultanées ne partagent pas le même fichier temporaire
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.dirname(path.abspath(file_path)),
+                                         prefix=path.basename(file_path) + ".", suffix=".tmp", delete=False) as fichier:
+            fichier_temp = fichier.name
+            json.dump(donnees, fichier, ensure_ascii=False, separators=(",", ":"))
+        replace(fichier_temp, file_path)
+    except OSError as error:
+        print("Instantané > Erreur lors de l'écriture", error)
+        if fichier_temp is not None:
+            try:
+                remove(fichier_temp)
+            except OSError:
+                pass
+        return False
+    if verbose:
+        print(f"Instantané > {len(donnees['stations'])} stations sauvegardées : {file_path}")
+    return True
+
+
+def charger_instantane(ma_dao, file_path, verbose=False):
+    """Démarrage rapide : recrée le gestionnaire des stations depuis l'instantané, s'il correspond toujours à la BDD (voir PiouPiouDao.reprendre_instantane).
+    Remplace initialiser_bdd, la lecture des stations et la synchronisation des mesures.
+
+    Args:
+        ma_dao (PiouPiouDao): dao
+        file_path (str): chemin complet du fichier de l'instantané
+        verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+
+    Returns:
+        GestionnaireDeStations: le gestionnaire des stations, None si l'instantané est absent, illisible ou périmé
+    """
+    try:
+        with open(file_path, encoding="utf-8") as fichier:
+            donnees = json.load(fichier)
+        if not ma_dao.reprendre_instantane(donnees["dao"], verbose):
+            return None
+        return GestionnaireDeStations.depuis_instantane(donnees["stations"])
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        print("Instantané > Instantané illisible", error)
+        return None
+
+
+class CollecteurMesures:
+    """Collecte en continu les mesures des stations suivies (producteur / consommateur) :
+    des threads de relevé interrogent l'API selon le planificateur et déposent les nouvelles mesures dans une file bornée,
+    un thread d'écriture les ajoute par lots en BDD. Un relevé lent ne retarde pas l'écriture, et inversement.
+    Lorsque la file est pleine, les relevés attendent que l'écriture la vide (contre-pression).
+    """
+
+    def __init__(self, gestionnaire, ma_dao, verbose=False, session=None, timeout=TIMEOUT, nb_paralleles=NB_REQUETES_PARALLELES,
+                 taille_file=TAILLE_FILE_MESURES, taille_lot=TAILLE_LOT_ECRITURE, delai_lot=DELAI_LOT_ECRITURE, planificateur=None, url=PP_URL_API_LIVE):
+        """
+        Args:
+            gestionnaire (GestionnaireDeStations): gestionnaire des stations suivies
+            ma_dao (PiouPiouDao): dao, utilisée uniquement par le thread d'écriture
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+            session (requests.Session, optional): session HTTP. Defaults to None, la session partagée.
+            timeout (float, optional): délai maximum de connexion et de lecture en secondes, par requête. Defaults to TIMEOUT.
+            nb_paralleles (int, optional): nombre de threads de relevé. Defaults to NB_REQUETES_PARALLELES.
+            taille_file (int, optional): nombre maximum de mesures en attente d'écriture. Defaults to TAILLE_FILE_MESURES.
+            taille_lot (int, optional): nombre maximum de mesures écrites en une fois. Defaults to TAILLE_LOT_ECRITURE.
+            delai_lot (float, optional): attente maximum en secondes pour compléter un lot. Defaults to DELAI_LOT_ECRITURE.
+            planificateur (PlanificateurReleves, optional): planification des relevés. Defaults to None, un nouveau planificateur.
+            url (str, optional): url de l'API (sans l'id de la station), live/all est à la suite. Defaults to PP_URL_API_LIVE.
+        """
+        self.gestionnaire = gestionnaire
+        self.ma_dao = ma_dao
+        self.verbose = verbose
+        self.session = session if session is not None else session_http(nb_paralleles)
+        self.timeout = timeout
+        self.nb_paralleles = nb_paralleles
+        self.taille_lot = taille_lot
+        self.delai_lot = delai_lot
+        self.planificateur = planificateur if planificateur is not None else PlanificateurReleves()
+        self.url = url
+        self._file = queue.Queue(maxsize=taille_file)
+        # le planificateur est partagé entre le thread de planification et les threads de relevé
+        self._verrou_planification = threading.Lock()
+        self._arret = threading.Event()
+        # levé lorsque plus aucun relevé ne peut déposer de mesure dans la file
+        self._releves_termines = threading.Event()
+        self._vider_file = True
+        self._executeur = None
+        self._thread_planification = None
+        self._thread_ecriture = None
+        self._verrou_statut = threading.Lock()
+        self._statut = {"nb_releves": 0, "nb_erreurs_api": 0, "nb_mesures_lues": 0, "nb_mesures_ecrites": 0, "nb_lots": 0,
+                        "nb_erreurs_bdd": 0, "derniere_ecriture": None, "duree_derniere_ecriture": None}
+
+    def __enter__(self):
+        return self.demarrer()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.arreter()
+        return False
+
+    def demarrer(self):
+        """Démarre les threads de relevé et d'écriture
+
+        Returns:
+            CollecteurMesures: le collecteur
+        """
+        if self.en_cours():
+            return self
+        self._arret.clear()
+        self._releves_termines.clear()
+        self._executeur = ThreadPoolExecutor(max_workers=max(1, self.nb_paralleles), thread_name_prefix="piou_piou_releve")
+        self._thread_ecriture = threading.Thread(target=self._ecrire_en_continu, name="piou_piou_ecriture", daemon=True)
+        self._thread_planification = threading.Thread(target=self._planifier_en_continu, name="piou_piou_planification", daemon=True)
+        self._thread_ecriture.start()
+        self._thread_planification.start()
+        return self
+
+    def en_cours(self):
+        """
+        Returns:
+            bool: True si la collecte est en cours (y compris l'écriture des dernières mesures lors de l'arrêt)
+        """
+        return self._thread_ecriture is not None and self._thread_ecriture.is_alive()
+
+    def arreter(self, vider=True, timeout=None):
+        """Arrête la collecte : plus aucun relevé n'est lancé, les relevés en cours se terminent,
+        puis les mesures en attente sont écrites en BDD (vider=True) ou abandonnées
+
+        Args:
+            vider (bool, optional): True pour écrire les mesures en attente avant l'arrêt. Defaults to True.
+            timeout (float, optional): délai d'attente maximum en secondes de l'arrêt du thread d'écriture. Defaults to None, pas de limite.
+
+        Returns:
+            bool: True si la collecte est arrêtée
+        """
+        self._vider_file = vider
+        self._arret.set()
+        if self._thread_planification is not None:
+            self._thread_planification.join(timeout)
+        if self._executeur is not None:
+            self._executeur.shutdown(wait=True)
+        self._releves_termines.set()
+        if self._thread_ecriture is not None:
+            self._thread_ecriture.join(timeout)
+        return not self.en_cours()
+
+    def statut(self):
+        """Etat de la collecte, sans attendre les threads
+
+        Returns:
+            dict: en_cours, taille_file (mesures en attente d'écriture), nb_releves, nb_erreurs_api, nb_mesures_lues (nouvelles mesures déposées dans la file),
+                  nb_mesures_ecrites, nb_lots, nb_erreurs_bdd, derniere_ecriture (timestamp epoch), duree_derniere_ecriture (secondes)
+        """
+        statut = dict(self._statut)
+        statut["en_cours"] = self.en_cours()
+        statut["taille_file"] = self._file.qsize()
+        return statut
+
+    def _compter(self, **increments):
+        with self._verrou_statut:
+            for cle, valeur in increments.items():
+                self._statut[cle] += valeur
+
+    def _planifier_en_continu(self):
+        """Thread de planification : lance les relevés dus sur le pool de threads de relevé
+        """
+        while not self._arret.is_set():
+            stations = list(self.gestionnaire.iter_stations())
+            with self._verrou_planification:
+                dues = self.planificateur.stations_a_interroger(stations)
+                for station in dues:
+                    self.planificateur.marquer_en_cours(station)
+            if len(dues) > 0:
+                if len(stations) >= SEUIL_RAFRAICHISSEMENT_GLOBAL:
+                    self._executeur.submit(self._relever_toutes, dues)
+                else:
+                    for station in dues:
+                        self._executeur.submit(self._relever, station)
+            with self._verrou_planification:
+                delai = self.planificateur.delai_avant_prochain_releve(stations)
+            # réveil au moins toutes les secondes, pour les nouvelles stations du gestionnaire
+            self._arret.wait(min(delai, 1.0))
+
+    def _relever(self, station):
+        """Thread de relevé : lit la mesure courante de la station et la dépose dans la file si elle est nouvelle
+
+        Args:
+            station (Station): station à interroger
+        """
+        try:
+            mesure = api_lire_mesure(self.url, station, self.verbose, self.session, self.timeout)
+        except Exception as error:
+            print(f"API > Erreur lors de la récupération de la mesure de la station {station.id} : {error}")
+            with self._verrou_planification:
+                self.planificateur.enregistrer_echec(station)
+            self._compter(nb_releves=1, nb_erreurs_api=1)
+            return
+        self._deposer(station, mesure)
+
+    def _relever_toutes(self, stations):
+        """Thread de relevé : lit en un seul appel (live/all) la mesure courante de toutes les stations suivies,
+        seules les mesures des stations dues sont conservées. En cas d'erreur les stations dues sont interrogées une par une
+
+        Args:
+            stations (List[Station]): stations dont le relevé est dû
+        """
+        ids_dues = {station.id for station in stations}
+        lues = set()
+        try:
+            for station, mesure in api_iterer_toutes_les_mesures(self.url + "all", self.gestionnaire, self.verbose, self.session, self.timeout):
+                if station.id not in ids_dues:
+                    # relevé non dû : la planification de la station n'est pas modifiée
+                    continue
+                lues.add(station.id)
+                self._deposer(station, mesure)
+        except (requests.RequestException, ValueError) as error:
+            print(f"API > Erreur lors de la récupération globale des mesures, interrogation station par station : {error}")
+            self._compter(nb_erreurs_api=1)
+            for station in stations:
+                if station.id not in lues:
+                    self._relever(station)
+            return
+        # les stations absentes de la réponse sont replanifiées comme des stations sans nouvelle mesure
+        for station in stations:
+            if station.id not in lues:
+                self._deposer(station, None)
+
+    def _deposer(self, station, mesure):
+        """Planifie le prochain relevé de la station et dépose la mesure dans la file si elle est nouvelle.
+        Lorsque la file est pleine, attend qu'une place se libère (sauf arrêt sans vidage de la file)
+
+        Args:
+            station (Station): station interrogée
+            mesure (Mesure): mesure lue, None si la station n'a pas de mesure
+        """
+        with self._verrou_planification:
+            nouvelle = self.planificateur.enregistrer_releve(station, mesure)
+        self._compter(nb_releves=1)
+        if not nouvelle:
+            return
+        while True:
+            try:
+                self._file.put(mesure, timeout=0.5)
+                self._compter(nb_mesures_lues=1)
+                return
+            except queue.Full:
+                if self._arret.is_set() and not self._vider_file:
+                    return
+
+    def _prendre_lot(self):
+        """
+        Returns:
+            List[Mesure]: mesures à écrire, au plus taille_lot, en attendant au plus delai_lot pour compléter le lot
+        """
+        try:
+            lot = [self._file.get(timeout=self.delai_lot)]
+        except queue.Empty:
+            return []
+        fin = time.monotonic() + self.delai_lot
+        while len(lot) < self.taille_lot:
+            reste = fin - time.monotonic()
+            try:
+                lot.append(self._file.get(timeout=reste) if reste > 0 else self._file.get_nowait())
+            except queue.Empty:
+                break
+        return lot
+
+    def _ecrire_en_continu(self):
+        """Thread d'écriture : ajoute les mesures de la file en BDD par lots, jusqu'à l'arrêt et au vidage de la file
+        """
+        while True:
+            if self._arret.is_set() and not self._vider_file:
+                break
+            if self._releves_termines.is_set() and self._file.empty():
+                break
+            lot = self._prendre_lot()
+            if len(lot) > 0:
+                self._ecrire(lot)
+        try:
+            self.ma_dao.valider(self.verbose)
+        except Exception as error:
+            print(f"SQLite > Erreur lors de la validation des dernières mesures : {error!r}")
+
+    def _ecrire(self, lot):
+        """Ajoute le lot de mesures en BDD puis, une fois l'écriture validée, aux stations, et synchronise les stations modifiées.
+        En cas d'erreur, les stations ne sont pas modifiées.
+
+        Args:
+            lot (List[Mesure]): mesures à écrire
+        """
+        debut = time.perf_counter()
+        try:
+            # comme Station.ajouter_mesure : une mesure équivalente à la dernière mesure de sa station n'est pas enregistrée
+            a_ecrire = []
+            dernieres = {}
+            for mesure in lot:
+                station = mesure.station
+                derniere = dernieres[station.id] if station.id in dernieres else station.derniere_mesure()
+                if derniere is not None and derniere == mesure:
+                    continue
+                dernieres[station.id] = mesure
+                a_ecrire.append(mesure)
+            # les mesures déjà en BDD sont écartées par la DAO (cache des dernières mesures et contrainte d'unicité)
+            nb_ajoutees = dao_ajouter_mesures_bdd(a_ecrire, self.ma_dao, self.verbose)
+            self.ma_dao.valider(self.verbose)
+            if nb_ajoutees > 0:
+                ajoutees = [mesure for mesure in a_ecrire if mesure.id is not None]
+                for mesure in ajoutees:
+                    mesure.station.ajouter_mesure(mesure)
+                if self.ma_dao.max_mesure_mode == PiouPiouDao.MAX_MESURE_MOD_ALL and self.ma_dao.max_mesure > 0:
+                    # la rétention globale supprime les plus anciennes mesures de n'importe quelle station
+                    stations_modifiees = None
+                else:
+                    stations_modifiees = {mesure.station.id: mesure.station for mesure in ajoutees}.values()
+                dao_synchroniser_bdd(self.gestionnaire, self.ma_dao, self.verbose, stations=stations_modifiees)
+        except Exception as error:
+            # toute erreur est tracée et comptée : le thread d'écriture continue avec les lots suivants
+            print(f"SQLite > Erreur lors de l'écriture de {len(lot)} mesures : {error!r}")
+            self._compter(nb_erreurs_bdd=1)
+            return
+        with self._verrou_statut:
+            self._statut["nb_mesures_ecrites"] += nb_ajoutees
+            self._statut["nb_lots"] += 1
+            self._statut["derniere_ecriture"] = time.time()
+            self._statut["duree_derniere_ecriture"] = time.perf_counter() - debut
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#                                              TESTS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def test_iterer_donnees_json():
+    print("API > lecture en flux de live/all, morceaux coupés n'importe où")
+    donnees = [{"id": 1, "meta": {"name": "Pordic {\"data\": [1]}"}, "location": {"latitude": 48.582274, "longitude": -2.780045},
+                "measurements": {"date": "2022-01-17T09:45:47.000Z", "wind_heading": 225.5, "wind_speed_avg": 3, "wind_speed_max": 5, "wind_speed_min": 1}},
+               {"id": 2, "meta": {"name": "Plérin ] , } \\"}, "location": {"latitude": None, "longitude": None}, "measurements": {"date": None}},
+               {"id": 334, "meta": {"name": "Champeaux 🌬 \u00e9"}, "status": {"state": "on"}, "measurements": {}}]
+    texte = json.dumps({"doc": "documentation", "license": "data [libre]", "data": donnees, "fin": [1, 2]}, ensure_ascii=False, indent=1)
+    assert list(_iterer_donnees_json([texte])) == donnees
+    # coupure en deux morceaux à chaque position : clé "data", chaînes, nombres et objets coupés
+    for coupure in range(len(texte) + 1):
+        assert list(_iterer_donnees_json([texte[:coupure], texte[coupure:]])) == donnees, coupure
+    # morceaux de toutes tailles, dont des morceaux vides
+    for taille in (1, 2, 3, 7, 64):
+        morceaux = [texte[i:i + taille] for i in range(0, len(texte), taille)]
+        assert list(_iterer_donnees_json(morceaux[:3] + [""] + morceaux[3:])) == donnees, taille
+    assert list(_iterer_donnees_json(['{"data": ', '[]}'])) == []
+    # la clé "data" est un jeton JSON : ni une valeur "data", ni un tableau qui précède la clé
+    texte_cles = '{"type": "data", "meta": [9, 8], "doc": {"data": [7]}, "data": [{"id": 1}, {"id": 2}]}'
+    for taille in (1, 5, len(texte_cles)):
+        assert list(_iterer_donnees_json([texte_cles[i:i + taille] for i in range(0, len(texte_cles), taille)])) == [{"id": 1}, {"id": 2}]
+    # réponses invalides : erreur, et non une liste de stations incomplète
+    for morceaux in (['{"data":[{"id":1},{"id":2},{"id":'], ['{"data":[{"id":1},', '{"id":2 oops},{"id":3}]}'], ['{"doc": "x"}'], [''],
+                     ['{"data": {"id": 1}}'], ['{"data": [{"id": 1},]}'], ['{"data": [{"id": 1} {"id": 2}]}'], ['["data", [1]]']):
+        lues = []
+        try:
+            for donnees_station in _iterer_donnees_json(morceaux):
+                lues.append(donnees_station)
+            assert False, morceaux
+        except ValueError:
+            assert lues in ([], [{"id": 1}], [{"id": 1}, {"id": 2}]), lues
+    # lecture paresseuse : la première station est retournée avant la fin de la réponse
+    flux = _iterer_donnees_json(iter([texte[:texte.index('"id": 2')]]))
+    assert next(flux) == donnees[0]
+
+
+def test_instantane(repertoire, verbose=False):
+    print("Instantané > démarrage rapide et détection d'une BDD modifiée")
+    file_bdd = path.join(repertoire, "bdd_test_instantane.db")
+    file_instantane = path.join(repertoire, "bdd_test_instantane.json")
+    gestionnaire = GestionnaireDeStations([Station(i, f"L'Île {i}", 47.0 + i / 100, -2.0) for i in range(1, 6)])
+    with PiouPiouDao(file_bdd, durabilite=PiouPiouDao.DURABILITE_GROUPEE, max_mesure=3, frequence_backup=0) as ma_dao:
+        assert ma_dao.initialiser_bdd(verbose=verbose)
+        for station in gestionnaire.iter_stations():
+            ma_dao.ajouter_station(station, verbose=verbose)
+        ma_dao.ajouter_mesures([Mesure(f"2022-01-17 15:0{k}:00", 10.0 * k, 3, 5, 1, station) for station in gestionnaire.iter_stations() for k in range(5)], verbose=verbose)
+        dao_synchroniser_bdd(gestionnaire, ma_dao, verbose, complete=True)
+        assert sauvegarder_instantane(gestionnaire, ma_dao, file_instantane, verbose)
+        # sauvegardes simultanées : chacune son fichier temporaire, le fichier final est toujours complet
+        sauvegardes = [threading.Thread(target=sauvegarder_instantane, args=(gestionnaire, ma_dao, file_instantane)) for _ in range(8)]
+        for sauvegarde in sauvegardes:
+            sauvegarde.start()
+        for sauvegarde in sauvegardes:
+            sauvegarde.join()
+        assert not any(nom.endswith(".tmp") for nom in listdir(repertoire))
+        with open(file_instantane, encoding="utf-8") as fichier:
+            assert len(json.load(fichier)["stations"]) == 5
+    attendu =[(st.id, st.name, [(m.id, m.date) for m in st.mesures]) for st in gestionnaire.iter_stations()]
+    assert all(len(mesures) == 3 for _, _, mesures in attendu)
+
+    # même empreinte : stations et mesures reprises de l'instantané, cache des dernières mesures compris
+    with PiouPiouDao(file_bdd, durabilite=PiouPiouDao.DURABILITE_GROUPEE, max_mesure=3, frequence_backup=0) as ma_dao:
+        reprise = charger_instantane(ma_dao, file_instantane, verbose)
+        assert reprise is not None
+        assert [(st.id, st.name, [(m.id, m.date) for m in st.mesures]) for st in reprise.iter_stations()] == attendu
+        assert ma_dao.cache_mesures.complet and ma_dao.cache_mesures.derniere(1)[0] == reprise.station(1).derniere_mesure().timestamp
+        # une mesure ajoutée après la reprise est écrite et synchronisée normalement
+        station_1 = reprise.station(1)
+        assert dao_ajouter_mesures_bdd([station_1.ajouter_mesure(Mesure("2022-01-17 16:00:00", 0, 1, 2, 0, station_1))], ma_dao, verbose) == 1
+        dao_synchroniser_bdd(reprise, ma_dao, verbose, stations=[station_1])
+        assert len(station_1.mesures) == 3 and all(m.id is not None for m in station_1.mesures)
+
+    # empreinte différente (mesure ajoutée après l'instantané) : l'instantané est périmé, démarrage complet
+    with PiouPiouDao(file_bdd, durabilite=PiouPiouDao.DURABILITE_GROUPEE, max_mesure=3, frequence_backup=0) as ma_dao:
+        assert charger_instantane(ma_dao, file_instantane, verbose) is None
+        assert ma_dao.initialiser_bdd(verbose=verbose)
+        complet = GestionnaireDeStations()
+        complet.stations = ma_dao.stations(verbose=verbose)
+        dao_synchroniser_bdd(complet, ma_dao, verbose, complete=True)
+        assert [m.date for m in complet.station(1).mesures] == [m.date for m in station_1.mesures]
+        # paramètres de rétention différents : périmé aussi
+        assert sauvegarder_instantane(complet, ma_dao, file_instantane, verbose)
+    with PiouPiouDao(file_bdd, durabilite=PiouPiouDao.DURABILITE_GROUPEE, max_mesure=2, frequence_backup=0) as ma_dao:
+        assert charger_instantane(ma_dao, file_instantane, verbose) is None
+
+    # instantané absent ou illisible
+    with PiouPiouDao(file_bdd, durabilite=PiouPiouDao.DURABILITE_GROUPEE, max_mesure=3, frequence_backup=0) as ma_dao:
+        assert charger_instantane(ma_dao, path.join(repertoire, "absent.json"), verbose) is None
+        with open(file_instantane, "w", encoding="utf-8") as fichier:
+            fichier.write('{"dao": ')
+        assert charger_instantane(ma_dao, file_instantane, verbose) is None
+
+def test_collecteur_ecriture(repertoire, verbose=False):
+    print("Collecte > écriture d'un lot : les stations ne sont modifiées qu'après l'écriture en BDD")
+    with PiouPiouDao(path.join(repertoire, "bdd_test_collecte.db"), frequence_backup=0) as ma_dao:
+        assert ma_dao.initialiser_bdd(verbose=verbose)
+        ma_dao.ajouter_station(Station(1, "Pordic", 48.582274, -2.780045), verbose=verbose)
+        gestionnaire = GestionnaireDeStations(ma_dao.stations(verbose=verbose))
+        station = gestionnaire.station(1)
+        collecteur = CollecteurMesures(gestionnaire, ma_dao, verbose)
+        # la 2e mesure est équivalente à la 1re, la 3e est déjà dans le lot
+        collecteur._ecrire([Mesure("2022-01-17 15:00:00", 10.0, 3, 5, 1, station), Mesure("2022-01-17 15:04:00", 10.0, 3, 5, 1, station),
+                            Mesure("2022-01-17 15:08:00", 20.0, 3, 5, 1, station), Mesure("2022-01-17 15:08:00", 20.0, 3, 5, 1, station)])
+        assert [m.date for m in station.mesures] == ["2022-01-17 15:00:00", "2022-01-17 15:08:00"]
+        assert all(m.id is not None for m in station.mesures) and ma_dao.nombre_mesures(verbose=verbose) == 2
+        # écriture en erreur (date illisible) : ni la BDD ni la station ne changent
+        collecteur._ecrire([Mesure("2022-01-17 15:12:00", 30.0, 3, 5, 1, station), Mesure("pas une date", 40.0, 3, 5, 1, station)])
+        assert collecteur.statut()["nb_erreurs_bdd"] == 1
+        assert len(station.mesures) == 2 and ma_dao.nombre_mesures(verbose=verbose) == 2
 
 # ---------------------------------------------------------------------------------------------
 #                               MAIN
 # ---------------------------------------------------------------------------------------------
 
-gestionnaire = GestionnaireDeStations()
-ma_dao = PiouPiouDao(curent_path+BDD_NAME)
-
-if ma_dao.initialiser_bdd(verbose=verbose):
-
-    nb_stations = ma_dao.nombre_stations(verbose=verbose)
-    if nb_stations == 0:
-        # Création des stations en BDD
-        for id in stations_proche_nantes.values():  
-            # Récupérer les informations de la station via l'API
-            station = api_station_information(PP_URL_API_LIVE, id, verbose)
-            if station is not None:
-                res = ma_dao.ajouter_station(station)
-                if res != id:
-                    print(f"SQLite > La station {id} soit {station} n'a pas pu être insérée en BDD.")
-            else:
-                print(f"API > Aucune information récupérée sur la station {id}.")
-    
-    # Normalement ici il y a des stations en BDD
-    nb_stations = ma_dao.nombre_stations(verbose=verbose)
-    if nb_stations == 0:
-        raise Exception("Aucune station.")
+if __name__ == "__main__" and sys.argv[1:] == ["tests"]:
+    # tests : python piou_piou_raoul_aurelie_controller.py tests
+    import shutil
+    from os import listdir
+
+    # Répertoire temporaire dédié aux tests
+    repertoire_tests = tempfile.mkdtemp(prefix="piou_piou_tests_")
+    test_iterer_donnees_json()
+    test_instantane(repertoire_tests)
+    test_collecteur_ecriture(repertoire_tests)
+    shutil.rmtree(repertoire_tests, ignore_errors=True)
+
+elif __name__ == "__main__":
+    gestionnaire = None
+    metriques = None
+    if METRIQUES_NAME is not None:
+        # les mêmes métriques pour la DAO et les appels API, exportées dans un seul fichier
+        metriques = Metriques(fichier_prometheus=path.join(curent_path, METRIQUES_NAME))
+        metriques_api = metriques
+    # Journal WAL et validation groupée : les écritures d'un lot sont validées ensemble
+    ma_dao = PiouPiouDao(path.join(curent_path, BDD_NAME), durabilite=PiouPiouDao.DURABILITE_GROUPEE, metriques=metriques)
+
+    fichier_instantane = path.join(curent_path, INSTANTANE_NAME) if INSTANTANE_NAME is not None else None
+    if fichier_instantane is not None:
+        # Démarrage rapide : stations et mesures reprises de l'instantané si la BDD n'a pas changé depuis le dernier arrêt
+        gestionnaire = charger_instantane(ma_dao, fichier_instantane, verbose)
+
+    if gestionnaire is None and ma_dao.initialiser_bdd(verbose=verbose):
+        gestionnaire = GestionnaireDeStations()
+
+        nb_stations = ma_dao.nombre_stations(verbose=verbose)
+        if nb_stations == 0:
+            # Création des stations en BDD
+            for id in stations_proche_nantes.values():  
+                # Récupérer les informations de la station via l'API
+                station = api_station_information(PP_URL_API_LIVE, id, verbose)
+                if station is not None:
+                    res = ma_dao.ajouter_station(station)
+                    if res != id:
+                        print(f"SQLite > La station {id} soit {station} n'a pas pu être insérée en BDD.")
+                else:
+                    print(f"API > Aucune information récupérée sur la station {id}.")
         
-    station_list = ma_dao.stations()
-    if station_list is not None:
-        # Ajout de la nouvelle station dans le gestionnaire
-        gestionnaire.stations = station_list
-  
-    # Initialisation des mesures
-    dao_synchroniser_bdd(gestionnaire, ma_dao, verbose)
-    
-    # Boucler pour mise à jour régulière
-    sortie = False    
-    while not sortie:
-         # Récupéreration des mesures pour chaque station
-        mesures_ajoutees = api_recuperer_mesures(PP_URL_API_LIVE, gestionnaire, verbose)
-        dao_ajouter_mesures_bdd(mesures_ajoutees, ma_dao, verbose)
-        dao_synchroniser_bdd(gestionnaire, ma_dao, verbose)
-        time.sleep(SLEEP_TIME)
-
-    print(f"---------------------- END ----------------------")
-    
+        # Normalement ici il y a des stations en BDD
+        nb_stations = ma_dao.nombre_stations(verbose=verbose)
+        if nb_stations == 0:
+            raise Exception("Aucune station.")
+            
+        station_list = ma_dao.stations()
+        if station_list is not None:
+            # Ajout de la nouvelle station dans le gestionnaire
+            gestionnaire.stations = station_list
+      
+        # Initialisation des mesures
+        dao_synchroniser_bdd(gestionnaire, ma_dao, verbose, complete=True)
+
+    if gestionnaire is not None:
+        # Collecte en continu, chaque station est interrogée selon sa cadence de mesure, jusqu'à CTRL + C
+        collecteur = CollecteurMesures(gestionnaire, ma_dao, verbose).demarrer()
+        try:
+            while collecteur.en_cours():
+                time.sleep(SLEEP_TIME)
+                if verbose:
+                    print(f"Collecte > {collecteur.statut()}")
+        except KeyboardInterrupt:
+            print("Collecte > Arrêt demandé, écriture des mesures en attente...")
+        finally:
+            collecteur.arreter()
+            if fichier_instantane is not None:
+                sauvegarder_instantane(gestionnaire, ma_dao, fichier_instantane, verbose)
+            ma_dao.fermer(verbose)
 
+        print(f"---------------------- END ----------------------")
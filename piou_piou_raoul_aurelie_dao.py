@@ -1,8 +1,283 @@
 import atexit
 import sqlite3
-from os import getcwd, remove, path
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from itertools import accumulate
+from os import chmod, close, remove, path, replace
+from urllib.parse import quote
 from piou_piou_raoul_aurelie_objets import *
 
+# NumPy n'est nécessaire que pour les statistiques de vent
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class CacheDernieresMesures:
+    """Dernière mesure en BDD de chaque station (date en timestamp epoch et valeurs), consultée avant toute requête :
+    une mesure déjà connue (même station et même date) est écartée sans requête SQL.
+    Le cache est mis à jour par PiouPiouDao, sous le verrou de la DAO.
+    """
+    __slots__ = ("_dernieres", "complet")
+
+    def __init__(self):
+        # {id station: (mesure_ts, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min)}
+        self._dernieres = {}
+        # True lorsque le cache a été chargé depuis la BDD : une station absente du cache n'a aucune mesure en BDD
+        self.complet = False
+
+    def __len__(self):
+        return len(self._dernieres)
+
+    def charger(self, lignes):
+        """Remplace le contenu du cache
+
+        Args:
+            lignes (Iterable[tuple]): (station, mesure_ts, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min) de la dernière mesure de chaque station
+        """
+        self._dernieres = {ligne[0]: tuple(ligne[1:]) for ligne in lignes}
+        self.complet = True
+
+    def vider(self):
+        self._dernieres = {}
+        self.complet = False
+
+    def lignes(self):
+        """
+        Returns:
+            List[tuple]: (station, mesure_ts, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min) de chaque station, voir charger
+        """
+        return [(station,) + derniere for station, derniere in self._dernieres.items()]
+
+    def derniere(self, station):
+        """
+        Args:
+            station (Station/int): station ou identifiant de la station
+
+        Returns:
+            tuple: (mesure_ts, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min) de la dernière mesure en BDD, None si inconnue
+        """
+        return self._dernieres.get(station.id if isinstance(station, Station) else station)
+
+    def mettre_a_jour(self, mesure, mesure_ts=None):
+        """Enregistre la mesure si elle est plus récente que la dernière mesure connue de sa station
+
+        Args:
+            mesure (Mesure): mesure ajoutée en BDD
+            mesure_ts (int, optional): date de la mesure en timestamp epoch. Defaults to None, calculée depuis la date de la mesure.
+        """
+        if mesure_ts is None:
+            mesure_ts = mesure.timestamp
+        if mesure_ts is None:
+            # mesure sans date : elle ne peut pas être comparée à la dernière mesure
+            return
+        derniere = self._dernieres.get(mesure.station.id)
+        if derniere is None or derniere[0] is None or mesure_ts > derniere[0]:
+            self._dernieres[mesure.station.id] = (mesure_ts, mesure.wind_heading, mesure.wind_speed_avg, mesure.wind_speed_max, mesure.wind_speed_min)
+
+    def filtrer(self, mesures):
+        """Écarte, sans requête SQL, les mesures dont la date est celle de la dernière mesure en BDD de leur station,
+        ainsi que les doublons du lot
+
+        Args:
+            mesures (Iterable[Mesure]): mesures lues
+
+        Returns:
+            List[Mesure]: mesures inconnues du cache, dans l'ordre du lot
+        """
+        res = []
+        vues = set()
+        for mesure in mesures:
+            cle = (mesure.station.id, mesure.timestamp)
+            derniere = self._dernieres.get(cle[0])
+            if cle in vues or (derniere is not None and derniere[0] == cle[1]):
+                continue
+            vues.add(cle)
+            res.append(mesure)
+        return res
+
+
+class Metriques:
+    """Compteurs et histogrammes de durées (requêtes SQL, validations, sauvegardes, appels API), partagés entre les threads.
+    Consultables via stats() ou exportés au format texte Prometheus (ecrire_prometheus / publier).
+    Les métriques sont désactivées par défaut : sans objet Metriques, la DAO et le controller ne mesurent rien.
+    """
+    PREFIXE = "piou_piou_"
+    # Bornes (en secondes) des histogrammes de durées
+    BORNES_DUREE = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, fichier_prometheus=None, intervalle_prometheus=15, bornes=BORNES_DUREE):
+        """Constructeur
+
+        Args:
+            fichier_prometheus (str, optional): Fichier texte Prometheus (collecteur textfile de node_exporter) mis à jour par publier(). Defaults to None, pas de fichier.
+            intervalle_prometheus (float, optional): Délai minimum en secondes entre deux écritures du fichier par publier(). Defaults to 15.
+            bornes (tuple[float], optional): Bornes croissantes des histogrammes de durées, en secondes. Defaults to BORNES_DUREE.
+        """
+        self.fichier_prometheus = fichier_prometheus
+        self.intervalle_prometheus = intervalle_prometheus
+        self.bornes = tuple(bornes)
+        self._verrou = threading.Lock()
+        # {(nom, étiquettes): valeur}
+        self._compteurs = {}
+        # {(nom, étiquettes): [nombre par borne (+ dépassement), somme, nombre, max]}
+        self._histogrammes = {}
+        self._derniere_publication = None
+
+    def incrementer(self, nom, valeur=1, **etiquettes):
+        """Incrémente un compteur
+
+        Args:
+            nom (str): nom du compteur (suffixé par _total par convention)
+            valeur (int/float, optional): incrément. Defaults to 1.
+            etiquettes (str): étiquettes du compteur (type de requête, appel API, ...)
+        """
+        cle = (nom, tuple(sorted(etiquettes.items())))
+        with self._verrou:
+            self._compteurs[cle] = self._compteurs.get(cle, 0) + valeur
+
+    def observer(self, nom, duree, **etiquettes):
+        """Enregistre une durée dans un histogramme
+
+        Args:
+            nom (str): nom de l'histogramme (suffixé par _secondes par convention)
+            duree (float): durée en secondes
+            etiquettes (str): étiquettes de l'histogramme
+        """
+        cle = (nom, tuple(sorted(etiquettes.items())))
+        index = bisect_left(self.bornes, duree)
+        with self._verrou:
+            histogramme = self._histogrammes.get(cle)
+            if histogramme is None:
+                histogramme = self._histogrammes[cle] = [[0] * (len(self.bornes) + 1), 0.0, 0, 0.0]
+            histogramme[0][index] += 1
+            histogramme[1] += duree
+            histogramme[2] += 1
+            if duree > histogramme[3]:
+                histogramme[3] = duree
+
+    def reinitialiser(self):
+        """Remet à zéro tous les compteurs et histogrammes
+        """
+        with self._verrou:
+            self._compteurs.clear()
+            self._histogrammes.clear()
+
+    def _instantane(self):
+        """
+        Returns:
+            (list, list): copie des compteurs [(nom, étiquettes, valeur)] et des histogrammes [(nom, étiquettes, nombres cumulés, somme, nombre, max)]
+        """
+        with self._verrou:
+            compteurs = [(nom, etiquettes, valeur) for (nom, etiquettes), valeur in self._compteurs.items()]
+            histogrammes = [(nom, etiquettes, list(accumulate(nombres)), somme, nb, maximum)
+                            for (nom, etiquettes), (nombres, somme, nb, maximum) in self._histogrammes.items()]
+        return sorted(compteurs), sorted(histogrammes)
+
+    def stats(self):
+        """
+        Returns:
+            dict: {"compteurs": {nom: {étiquettes: valeur}},
+                   "histogrammes": {nom: {étiquettes: {"nb", "somme", "moyenne", "max", "buckets": {borne: nombre cumulé}}}}}
+                  les étiquettes sont sous la forme "cle=valeur,cle=valeur" ("" sans étiquette)
+        """
+        compteurs, histogrammes = self._instantane()
+        res = {"compteurs": {}, "histogrammes": {}}
+        for nom, etiquettes, valeur in compteurs:
+            res["compteurs"].setdefault(nom, {})[",".join(f"{cle}={valeur}" for cle, valeur in etiquettes)] = valeur
+        for nom, etiquettes, cumuls, somme, nb, maximum in histogrammes:
+            res["histogrammes"].setdefault(nom, {})[",".join(f"{cle}={valeur}" for cle, valeur in etiquettes)] = {
+                "nb": nb, "somme": somme, "moyenne": somme / nb if nb else None, "max": maximum,
+                "buckets": dict(zip(self.bornes + (float("inf"),), cumuls))}
+        return res
+
+    def texte_prometheus(self):
+        """
+        Returns:
+            str: les métriques au format texte d'exposition Prometheus
+        """
+        compteurs, histogrammes = self._instantane()
+        lignes = []
+        nom_precedent = None
+        for nom, etiquettes, valeur in compteurs:
+            if nom != nom_precedent:
+                lignes.append(f"# TYPE {Metriques.PREFIXE}{nom} counter")
+                nom_precedent = nom
+            lignes.append(f"{Metriques.PREFIXE}{nom}{Metriques._etiquettes_prometheus(etiquettes)} {valeur}")
+        for nom, etiquettes, cumuls, somme, nb, maximum in histogrammes:
+            if nom != nom_precedent:
+                lignes.append(f"# TYPE {Metriques.PREFIXE}{nom} histogram")
+                nom_precedent = nom
+            for borne, cumul in zip(self.bornes + ("+Inf",), cumuls):
+                lignes.append(f"{Metriques.PREFIXE}{nom}_bucket{Metriques._etiquettes_prometheus(etiquettes + (('le', borne),))} {cumul}")
+            lignes.append(f"{Metriques.PREFIXE}{nom}_sum{Metriques._etiquettes_prometheus(etiquettes)} {somme}")
+            lignes.append(f"{Metriques.PREFIXE}{nom}_count{Metriques._etiquettes_prometheus(etiquettes)} {nb}")
+        return "\n".join(lignes) + "\n"
+
+    def ecrire_prometheus(self, file_path=None):
+        """Écrit les métriques au format texte Prometheus. Le fichier est remplacé d'un bloc (fichier temporaire puis renommage),
+        un lecteur ne voit jamais un fichier incomplet.
+
+        Args:
+            file_path (str, optional): Chemin complet du fichier. Defaults to None, fichier_prometheus.
+
+        Returns:
+            bool: True si le fichier a été écrit
+        """
+        if file_path is None:
+            file_path = self.fichier_prometheus
+        if file_path is None:
+            return False
+        fichier_temp = None
+        try:
+            # fichier temporaire unique : deux écritures simultanées ne partagent pas le même fichier temporaire
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.dirname(path.abspath(file_path)),
+                                             prefix=path.basename(file_path) + ".", suffix=".tmp", delete=False) as fichier:
+                fichier_temp = fichier.name
+                fichier.write(self.texte_prometheus())
+            # NamedTemporaryFile crée le fichier en 0600 : le fichier doit rester lisible par le collecteur
+            chmod(fichier_temp, 0o644)
+            replace(fichier_temp, file_path)
+        except OSError as error:
+            print("Métriques > Erreur lors de l'écriture du fichier Prometheus", error)
+            if fichier_temp is not None:
+                try:
+                    remove(fichier_temp)
+                except OSError:
+                    pass
+            return False
+        self._derniere_publication = time.monotonic()
+        return True
+
+    def publier(self):
+        """Écrit le fichier Prometheus (fichier_prometheus) si intervalle_prometheus secondes se sont écoulées depuis la dernière écriture
+
+        Returns:
+            bool: True si le fichier a été écrit
+        """
+        if self.fichier_prometheus is None:
+            return False
+        if self._derniere_publication is not None and time.monotonic() - self._derniere_publication < self.intervalle_prometheus:
+            return False
+        return self.ecrire_prometheus()
+
+    @staticmethod
+    def _etiquettes_prometheus(etiquettes):
+        if len(etiquettes) == 0:
+            return ""
+        paires = []
+        for cle, valeur in etiquettes:
+            # échappement des valeurs : antislash, guillemet et retour à la ligne
+            valeur = str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            paires.append(f'{cle}="{valeur}"')
+        return "{" + ",".join(paires) + "}"
+
 
 class PiouPiouDao:
     """Traite tout ce qui concerne la base de données
@@ -10,25 +285,401 @@ class PiouPiouDao:
     MAX_MESURE_MOD_STATION = 'station'
     MAX_MESURE_MOD_ALL = 'all'
 
-    def __init__(self, nom_bdd, backup_path=None, frequence_backup=5, max_mesure=10, max_mesure_mod=MAX_MESURE_MOD_STATION):
+    # Modes de durabilité des écritures
+    # complete : journal d'annulation (rollback journal), synchronous=FULL, validation à chaque écriture
+    DURABILITE_COMPLETE = 'complete'
+    # wal : journal WAL, synchronous=NORMAL, validation à chaque écriture (une coupure de courant peut perdre les dernières validations)
+    DURABILITE_WAL = 'wal'
+    # groupee : comme wal, les écritures sont validées ensemble par valider() ou au plus tard après delai_validation ms
+    DURABILITE_GROUPEE = 'groupee'
+    DURABILITES = (DURABILITE_COMPLETE, DURABILITE_WAL, DURABILITE_GROUPEE)
+
+    # Migrations du schéma : (version, description, requêtes). La version du fichier est conservée dans PRAGMA user_version,
+    # seules les migrations de version supérieure sont exécutées, chacune dans sa propre transaction.
+    # Les requêtes sont idempotentes pour les BDD créées avant le versionnement (user_version = 0).
+    MIGRATIONS = [
+        (1, "tables station et mesure", [
+            "CREATE TABLE IF NOT EXISTS station (id INTEGER PRIMARY KEY, station_name TEXT NOT NULL, latitude REAL, longitude REAL);",
+            "CREATE TABLE IF NOT EXISTS mesure (id INTEGER PRIMARY KEY AUTOINCREMENT, mesure_date TEXT NOT NULL, wind_heading REAL, wind_speed_avg REAL, wind_speed_max REAL, wind_speed_min REAL, station INTEGER, FOREIGN KEY(station) references station(id));",
+        ]),
+        (2, "rétention par triggers", [
+            "CREATE TABLE IF NOT EXISTS retention (id INTEGER PRIMARY KEY CHECK (id = 1), max_mesure INTEGER NOT NULL, mode TEXT NOT NULL, nb_total INTEGER NOT NULL DEFAULT 0);",
+            "CREATE TABLE IF NOT EXISTS compteur_mesure (station INTEGER PRIMARY KEY, nb INTEGER NOT NULL DEFAULT 0);",
+            # Initialisation des compteurs avec les mesures déjà présentes
+            f"INSERT OR REPLACE INTO retention (id, max_mesure, mode, nb_total) VALUES (1, -1, '{MAX_MESURE_MOD_STATION}', (SELECT count(*) FROM mesure));",
+            "INSERT OR REPLACE INTO compteur_mesure (station, nb) SELECT station, count(*) FROM mesure WHERE station IS NOT NULL GROUP BY station;",
+            # Index nécessaire pour trouver la mesure la plus ancienne d'une station sans parcourir la table
+            "CREATE INDEX IF NOT EXISTS idx_mesure_station_id ON mesure (station, id);",
+            # Chaque insertion incrémente un compteur (par station et global) et supprime au besoin la mesure la plus ancienne,
+            # le coût ne dépend pas du nombre de mesures conservées
+            f"""CREATE TRIGGER IF NOT EXISTS trg_mesure_retention_insert AFTER INSERT ON mesure
+            BEGIN
+                INSERT INTO compteur_mesure (station, nb) VALUES (NEW.station, 1) ON CONFLICT(station) DO UPDATE SET nb = nb + 1;
+                UPDATE retention SET nb_total = nb_total + 1;
+                DELETE FROM mesure WHERE id = (SELECT MIN(id) FROM mesure WHERE station = NEW.station)
+                    AND (SELECT mode = '{MAX_MESURE_MOD_STATION}' AND max_mesure > 0 FROM retention)
+                    AND (SELECT nb FROM compteur_mesure WHERE station = NEW.station) > (SELECT max_mesure FROM retention);
+                DELETE FROM mesure WHERE id = (SELECT MIN(id) FROM mesure)
+                    AND (SELECT mode = '{MAX_MESURE_MOD_ALL}' AND max_mesure > 0 AND nb_total > max_mesure FROM retention);
+            END;""",
+            """CREATE TRIGGER IF NOT EXISTS trg_mesure_retention_delete AFTER DELETE ON mesure
+            BEGIN
+                UPDATE compteur_mesure SET nb = nb - 1 WHERE station = OLD.station;
+                UPDATE retention SET nb_total = nb_total - 1;
+            END;""",
+        ]),
+        (3, "index de recherche des mesures", [
+            # nombre_mesures, mesures(station), select_mesures et la rétention filtrent sur la station, triés par id (idx_mesure_station_id)
+            "CREATE INDEX IF NOT EXISTS idx_mesure_station_date ON mesure (station, mesure_date);",
+            "CREATE INDEX IF NOT EXISTS idx_mesure_date ON mesure (mesure_date);",
+        ]),
+        (4, "unicité des mesures par station et date", [
+            # Suppression des doublons existants, la première mesure enregistrée est conservée
+            "DELETE FROM mesure WHERE id NOT IN (SELECT MIN(id) FROM mesure GROUP BY station, mesure_date);",
+            "DROP INDEX IF EXISTS idx_mesure_station_date;",
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_mesure_station_date ON mesure (station, mesure_date);",
+        ]),
+        (5, "date des mesures en timestamp epoch", [
+            # mesure_date reste le texte reçu, mesure_ts (secondes UTC) sert aux comparaisons et aux recherches par période.
+            # strftime gère les formats ISO 8601 avec ou sans 'T', millisecondes et suffixe 'Z'
+            "ALTER TABLE mesure ADD COLUMN mesure_ts INTEGER;",
+            "UPDATE mesure SET mesure_ts = CAST(strftime('%s', mesure_date) AS INTEGER);",
+            # Une même date a pu être enregistrée sous deux formats : la première mesure enregistrée est conservée
+            "DELETE FROM mesure WHERE mesure_ts IS NOT NULL AND id NOT IN (SELECT MIN(id) FROM mesure WHERE mesure_ts IS NOT NULL GROUP BY station, mesure_ts);",
+            "DROP INDEX IF EXISTS uq_mesure_station_date;",
+            "DROP INDEX IF EXISTS idx_mesure_date;",
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_mesure_station_ts ON mesure (station, mesure_ts);",
+            "CREATE INDEX IF NOT EXISTS idx_mesure_ts ON mesure (mesure_ts);",
+        ]),
+    ]
+    SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+    # Nombre de requêtes préparées conservées par connexion. Les requêtes sont paramétrées (?) : une même forme de requête
+    # (mêmes critères, valeurs différentes) est préparée une seule fois puis réutilisée
+    TAILLE_CACHE_REQUETES = 256
+
+    # Colonnes des mesures exportées en tableaux NumPy (mesures_colonnes).
+    # La date est la colonne mesure_ts (timestamp epoch) : le texte de mesure_date, de longueur variable, n'est pas exporté
+    DTYPE_MESURE = [("id", "i8"), ("mesure_ts", "i8"), ("wind_heading", "f8"), ("wind_speed_avg", "f8"),
+                    ("wind_speed_max", "f8"), ("wind_speed_min", "f8"), ("station", "i8")]
+    # Colonnes lues pour les statistiques de vent (statistiques_vent)
+    DTYPE_VENT = [("wind_heading", "f8"), ("wind_speed_avg", "f8"), ("wind_speed_max", "f8"), ("station", "i8")]
+
+    def __init__(self, nom_bdd, backup_path=None, frequence_backup=5, max_mesure=10, max_mesure_mod=MAX_MESURE_MOD_STATION,
+                 intervalle_backup=None, sauvegarde_asynchrone=True, pages_backup=64, pause_backup=0.005,
+                 durabilite=DURABILITE_COMPLETE, delai_validation=1000, lecture_seule=False, nb_lecteurs=4, metriques=None):
         """Constructeur
 
         Args:
             nom_bdd (str): Chemin complet de la bdd
             backup_path (str, optional): Chemin complet pour le backup de la bdd. Defaults to None, le nom sera le même que celui de la BDD mais avec .backup.db.
-            frequence_backup (int, optional): Fréquence de backup de la BDD. Defaults to 5.
+            frequence_backup (int, optional): Fréquence de backup de la BDD (en nombre d'écritures). Defaults to 5.
             max_mesure (int, optional): Nombre maximum de mesures à sauvegarder en BDD. Defaults to 10.
             max_mesure_mod (str, optional) : mode de gestion du maximum de mesure ('station','all')
+            intervalle_backup (float, optional): Délai maximum en secondes entre deux backups (vérifié à chaque écriture). Defaults to None, pas de délai.
+            sauvegarde_asynchrone (bool, optional): True pour faire les backups automatiques en arrière-plan. Defaults to True.
+            pages_backup (int, optional): Nombre de pages copiées à chaque étape du backup en arrière-plan. Defaults to 64.
+            pause_backup (float, optional): Pause en secondes entre deux étapes du backup (et avant de réessayer une étape sur une BDD verrouillée), pour laisser la main aux écritures. Defaults to 0.005.
+            durabilite (str, optional): mode de durabilité des écritures ('complete', 'wal', 'groupee'). Defaults to DURABILITE_COMPLETE.
+            delai_validation (int, optional): en mode 'groupee', délai maximum en ms avant la validation des écritures. Defaults to 1000,
+                                              None pour ne valider qu'à l'appel de valider().
+            lecture_seule (bool, optional): True pour une DAO de consultation : connexions en lecture seule (mode=ro), une par thread et sans verrou,
+                                            lectures en parallèle sur un pool de threads (soumettre_lecture). La DAO qui écrit doit être en mode 'wal' ou 'groupee'
+                                            pour que lectures et écritures ne se bloquent pas. Defaults to False.
+            nb_lecteurs (int, optional): nombre de threads du pool de lecture (lecture_seule). Defaults to 4.
+            metriques (Metriques, optional): métriques à alimenter (durées et lignes des requêtes, validations, sauvegardes),
+                                             peut être partagé avec le controller. Defaults to None, pas de mesure.
+
+        Raises:
+            ValueError: Si le mode de durabilité est inconnu
         """
+        if durabilite not in PiouPiouDao.DURABILITES:
+            raise ValueError(f"Mode de durabilité inconnu : {durabilite}")
         self.nom_bdd = nom_bdd
+        self.durabilite = durabilite
+        self.delai_validation = delai_validation
+        # Validation groupée : minuteur armé à la première écriture non validée
+        self._minuteur_validation = None
+        self._sauvegarde_en_attente = False
         self.frequence_backup = frequence_backup
         self._nb_enregistrement = 0
         if backup_path is None:
             backup_path = self.nom_bdd.replace(".db", ".backup.db")
         self.backup_path = backup_path
+        self.intervalle_backup = intervalle_backup
+        self.sauvegarde_asynchrone = sauvegarde_asynchrone
+        self.pages_backup = pages_backup
+        self.pause_backup = pause_backup
+        # Sauvegarde en arrière-plan
+        self._thread_sauvegarde = None
+        self._verrou_sauvegarde = threading.Lock()
+        self._debut_derniere_sauvegarde = time.monotonic()
+        self._etat_sauvegarde = {"en_cours": False, "fichier": None, "date": None, "duree": None, "succes": None, "erreur": None,
+                                 "pages_restantes": None, "pages_totales": None, "nb_sauvegardes": 0}
+        # Connexion persistante, partagée entre les threads et protégée par un verrou
+        self._conn = None
+        self._verrou = threading.RLock()
+        # Lecture seule : une connexion par thread, sans verrou (les écritures échouent)
+        self.lecture_seule = lecture_seule
+        self.nb_lecteurs = nb_lecteurs
+        self._connexion_locale = threading.local()
+        self._connexions_lecture = []
+        self._generation_lecture = 0
+        self._verrou_lecture = threading.Lock()
+        self._executeur_lecture = None
+        if lecture_seule:
+            self._verrou = nullcontext()
+        self._atexit_enregistre = False
+        # La rétention (max_mesure) est appliquée par des triggers, une fois la BDD initialisée
+        self._retention_initialisee = False
+        # Nombre de mesures réellement insérées lors du dernier ajout (les doublons sont ignorés)
+        self.nb_mesures_inserees = 0
+        # Dernière mesure de chaque station, chargée par initialiser_bdd
+        self.cache_mesures = CacheDernieresMesures()
+        self.metriques = metriques
         self.max_mesure = max_mesure
         self.max_mesure_mode = max_mesure_mod
 
+    @property
+    def max_mesure(self):
+        return self._max_mesure
+
+    @max_mesure.setter
+    def max_mesure(self, max_mesure):
+        self._max_mesure = max_mesure
+        if self._retention_initialisee:
+            self.appliquer_retention()
+
+    @property
+    def max_mesure_mode(self):
+        return self._max_mesure_mode
+
+    @max_mesure_mode.setter
+    def max_mesure_mode(self, max_mesure_mode):
+        if max_mesure_mode not in (PiouPiouDao.MAX_MESURE_MOD_STATION, PiouPiouDao.MAX_MESURE_MOD_ALL):
+            raise ValueError(f"Mode de gestion du maximum de mesure inconnu : {max_mesure_mode}")
+        self._max_mesure_mode = max_mesure_mode
+        if self._retention_initialisee:
+            self.appliquer_retention()
+
+    def __enter__(self):
+        self.ouvrir()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.fermer()
+        return False
+
+    def ouvrir(self, verbose=False):
+        """Ouvre la connexion persistante à la BDD (si elle n'est pas déjà ouverte)
+
+        Args:
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+
+        Returns:
+            Connection: la connexion persistante (en lecture seule : la connexion du thread courant)
+        """
+        if self.lecture_seule:
+            return self._ouvrir_lecture(verbose)
+        with self._verrou:
+            if self._conn is None:
+                self._conn = self.connecter(verbose=verbose)
+                if verbose > 1:
+                    print("SQLite DAO > Connexion persistante ouverte")
+                # Fermeture propre de la connexion à l'arrêt du programme
+                if not self._atexit_enregistre:
+                    atexit.register(self.fermer)
+                    self._atexit_enregistre = True
+            return self._conn
+
+    def _ouvrir_lecture(self, verbose=False):
+        """
+        Args:
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+
+        Returns:
+            Connection: la connexion en lecture seule du thread courant (ouverte si besoin)
+        """
+        locale = self._connexion_locale
+        # après fermer(), les connexions des threads sont rouvertes
+        if getattr(locale, "generation", None) != self._generation_lecture:
+            locale.conn = self.connecter(verbose=verbose)
+            locale.generation = self._generation_lecture
+            with self._verrou_lecture:
+                self._connexions_lecture.append(locale.conn)
+                if not self._atexit_enregistre:
+                    atexit.register(self.fermer)
+                    self._atexit_enregistre = True
+            if verbose > 1:
+                print(f"SQLite DAO > Connexion en lecture seule ouverte ({threading.current_thread().name})")
+        return locale.conn
+
+    def soumettre_lecture(self, fonction, *args, **kwargs):
+        """Exécute une lecture sur le pool de threads de lecture (DAO en lecture seule).
+        Toutes les requêtes de la fonction voient le même état de la BDD (instantané WAL), sans bloquer ni attendre les écritures.
+
+        Args:
+            fonction (callable): lecture à exécuter, par exemple ma_dao.select_mesures
+            *args, **kwargs: paramètres de la fonction
+
+        Raises:
+            ValueError: Si la DAO n'est pas en lecture seule
+
+        Returns:
+            Future: résultat de la fonction
+        """
+        if not self.lecture_seule:
+            raise ValueError("Les lectures en parallèle nécessitent une DAO en lecture seule (lecture_seule=True)")
+        with self._verrou_lecture:
+            if self._executeur_lecture is None:
+                self._executeur_lecture = ThreadPoolExecutor(max_workers=self.nb_lecteurs, thread_name_prefix="piou_piou_lecture")
+            return self._executeur_lecture.submit(self._lire_instantane, fonction, *args, **kwargs)
+
+    def _lire_instantane(self, fonction, *args, **kwargs):
+        """Exécute la fonction dans une transaction de lecture : ses requêtes voient toutes le même état de la BDD
+        """
+        conn = self.ouvrir()
+        conn.execute("BEGIN;")
+        try:
+            return fonction(*args, **kwargs)
+        finally:
+            # fin de la transaction de lecture, rien à valider
+            conn.rollback()
+
+    def fermer(self, verbose=False):
+        """Ferme la connexion persistante à la BDD, si elle est ouverte (en lecture seule : le pool et les connexions de lecture)
+
+        Args:
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+        """
+        if self.lecture_seule:
+            with self._verrou_lecture:
+                self._desenregistrer_atexit()
+                executeur, self._executeur_lecture = self._executeur_lecture, None
+                connexions, self._connexions_lecture = self._connexions_lecture, []
+                self._generation_lecture += 1
+            if executeur is not None:
+                executeur.shutdown(wait=True)
+            for conn in connexions:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            if verbose > 1:
+                print(f"SQLite DAO > {len(connexions)} connexions en lecture seule fermées")
+            return
+        # La sauvegarde en cours doit se terminer avant la fermeture
+        self.attendre_sauvegarde()
+        with self._verrou:
+            self._desenregistrer_atexit()
+            self._annuler_minuteur()
+            if self._conn is not None:
+                try:
+                    self._conn.commit()
+                    self._conn.close()
+                    if verbose > 1:
+                        print("SQLite DAO > Connexion persistante fermée")
+                finally:
+                    self._conn = None
+        if self.metriques is not None:
+            self.metriques.ecrire_prometheus()
+
+    def _desenregistrer_atexit(self):
+        """Fermeture explicite : la DAO n'est plus retenue (ni refermée) par atexit jusqu'à l'arrêt du programme
+        """
+        if self._atexit_enregistre:
+            atexit.unregister(self.fermer)
+            self._atexit_enregistre = False
+
+    def valider(self, verbose=False):
+        """Valide (commit) les écritures en attente. En mode 'groupee', à appeler à la fin de chaque cycle d'écritures
+
+        Args:
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
+
+        Returns:
+            bool: True si des écritures ont été validées
+        """
+        with self._verrou:
+            self._annuler_minuteur()
+            if self._conn is None or not self._conn.in_transaction:
+                return False
+            self._commit(self._conn)
+            if verbose > 1:
+                print("SQLite DAO > Écritures validées")
+            if self._sauvegarde_en_attente:
+                self._sauvegarde_en_attente = False
+                self._declencher_sauvegarde(verbose)
+            return True
+
+    def _commit(self, conn):
+        """Valide la transaction en cours, en mesurant la durée de la validation si les métriques sont activées
+
+        Args:
+            conn (Connection): connexion persistante
+        """
+        if self.metriques is None:
+            conn.commit()
+            return
+        debut = time.perf_counter()
+        conn.commit()
+        self.metriques.observer("sql_validation_duree_secondes", time.perf_counter() - debut)
+        self.metriques.incrementer("sql_validations_total")
+        self.metriques.publier()
+
+    def _annuler_minuteur(self):
+        if self._minuteur_validation is not None:
+            self._minuteur_validation.cancel()
+            self._minuteur_validation = None
+
+    def _debut_ecriture(self, conn):
+        """En mode 'groupee', ouvre (si besoin) la transaction du groupe et un point de sauvegarde pour l'écriture :
+        une écriture en erreur est annulée seule, sans perdre les écritures en attente
+
+        Args:
+            conn (Connection): connexion persistante
+        """
+        if self.durabilite == PiouPiouDao.DURABILITE_GROUPEE:
+            if not conn.in_transaction:
+                conn.execute("BEGIN;")
+            conn.execute("SAVEPOINT ecriture;")
+
+    def _fin_ecriture(self, conn):
+        """Valide l'écriture : immédiatement, ou en mode 'groupee' avec les écritures du groupe (valider() ou minuteur)
+
+        Args:
+            conn (Connection): connexion persistante
+        """
+        if self.durabilite != PiouPiouDao.DURABILITE_GROUPEE:
+            self._commit(conn)
+            return
+        conn.execute("RELEASE ecriture;")
+        if self.delai_validation is not None and self._minuteur_validation is None:
+            self._minuteur_validation = threading.Timer(self.delai_validation / 1000, self.valider)
+            self._minuteur_validation.daemon = True
+            self._minuteur_validation.start()
+
+    def _annuler_ecriture(self, conn):
+        """Annule l'écriture en erreur (en mode 'groupee', uniquement depuis le point de sauvegarde)
+
+        Args:
+            conn (Connection): connexion persistante
+        """
+        if self.durabilite == PiouPiouDao.DURABILITE_GROUPEE and conn.in_transaction:
+            conn.execute("ROLLBACK TO ecriture;")
+            conn.execute("RELEASE ecriture;")
+        else:
+            conn.rollback()
+
+    def est_ouverte(self):
+        """
+        Returns:
+            bool: True si la connexion persistante est ouverte (en lecture seule : au moins une connexion de lecture)
+        """
+        if self.lecture_seule:
+            return len(self._connexions_lecture) > 0
+        return self._conn is not None
+
 
     def connecter(self, verbose=False):
         """Connecte la base de données
@@ -43,7 +694,26 @@ class PiouPiouDao:
         """
         conn = None
         try:
-            conn = sqlite3.connect(self.nom_bdd)
+            if self.lecture_seule:
+                # mode=ro : toute écriture échoue, le mode de journal est celui choisi par la DAO qui écrit
+                # check_same_thread=False : la connexion d'un thread est fermée par fermer(), depuis un autre thread
+                return sqlite3.connect(f"file:{quote(path.abspath(self.nom_bdd))}?mode=ro", uri=True, check_same_thread=False,
+                                       cached_statements=PiouPiouDao.TAILLE_CACHE_REQUETES)
+            # check_same_thread=False : la connexion persistante est partagée entre threads, l'accès est sérialisé par self._verrou
+            conn = sqlite3.connect(self.nom_bdd, check_same_thread=False, cached_statements=PiouPiouDao.TAILLE_CACHE_REQUETES)
+            if self.durabilite == PiouPiouDao.DURABILITE_COMPLETE:
+                # le mode WAL est enregistré dans le fichier : retour explicite au journal classique (rollback)
+                try:
+                    conn.execute("PRAGMA journal_mode = DELETE;")
+                except sqlite3.OperationalError as error:
+                    # une autre connexion utilise encore la BDD en WAL : le mode de journal ne peut pas changer
+                    print("SQLite > Le journal WAL de la BDD est conservé :", error)
+                conn.execute("PRAGMA synchronous = FULL;")
+            else:
+                # WAL : une écriture ajoute les pages modifiées au journal au lieu de copier puis réécrire la BDD,
+                # synchronous=NORMAL : synchronisation sur disque aux points de contrôle (checkpoint) et non à chaque validation
+                conn.execute("PRAGMA journal_mode = WAL;")
+                conn.execute("PRAGMA synchronous = NORMAL;")
         except sqlite3.Error as error:
             print("SQLite > Erreur de connexion à la BDD", error)
             try:
@@ -115,12 +785,15 @@ class PiouPiouDao:
             int: le nombre de mesures en BDD
         """
         sql = "SELECT count(*) FROM mesure"
+        params = ()
         if station is not None:
             if isinstance(station, Station):
-                sql += f" WHERE station = {station.id}" 
+                sql += " WHERE station = ?"
+                params = (station.id,)
             elif isinstance(station, int):
-                sql += f" WHERE station = {station}"
-        res = self._executer_sql(sql+";", verbose=verbose)
+                sql += " WHERE station = ?"
+                params = (station,)
+        res = self._executer_sql(sql+";", verbose=verbose, params=params)
         if verbose:
             print(res[0][0])
         # on retourne la 1ère valeur de la 1ère ligne
@@ -144,7 +817,9 @@ class PiouPiouDao:
         if station is not None:
             if isinstance(station, Station):
                 # INSERT OR IGNORE pour éviter des doublons, logiquement devrait éviter d'avoir l'exception IntegrityError
-                res = self._executer_sql(f"INSERT OR IGNORE INTO station (id, station_name, latitude, longitude) VALUES ({station.id},'{station.name}',{station.latitude}, {station.longitude});", verbose=verbose)
+                # valeurs paramétrées : noms avec apostrophes (L'Île-d'Olonne), coordonnées inconnues (NULL)
+                res = self._executer_sql("INSERT OR IGNORE INTO station (id, station_name, latitude, longitude) VALUES (?, ?, ?, ?);", verbose=verbose,
+                                         params=(station.id, station.name, station.latitude, station.longitude))
             elif isinstance(station, list):
                 res = []
                 try:
@@ -153,7 +828,7 @@ class PiouPiouDao:
                 # on ajoute toutes les stations qui n'existent pas déjà
                 except sqlite3.IntegrityError:
                     print(f"La station {st} existe déjà en BDD.")
-            elif isinstance(station, dict):
+            elif isinstance(station, (dict, MappingProxyType)):
                 res = []
                 try:
                     for st in station.values():
@@ -167,60 +842,192 @@ class PiouPiouDao:
             raise ValueError("La station ne peut pas être vide ou Null")
         return res
 
-    def ajouter_mesure(self, mesure, verbose=False):
-        """Ajoute une mesure en BDD, si elle n'existe pas déjà en BDD
-        Si la
+    def ajouter_mesure(self, mesure, verbose=False, ignorer_doublons=True):
+        """Ajoute une mesure en BDD, si elle n'existe pas déjà en BDD (même station et même date)
+        Le nombre de mesures réellement insérées est disponible dans nb_mesures_inserees.
 
         Args:
-            mesure (Mesure/list[Mesure]/dict{-:Mesure}): Mesure à ajouter
+            mesure (Mesure/list[Mesure]/VueMesures/dict{-:Mesure}): Mesure à ajouter
             verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+            ignorer_doublons (bool, optional): True pour ignorer les mesures déjà en BDD, False pour lever IntegrityError. Defaults to True.
 
         Raises:
             TypeError: Lorsque la mesure n'est pas de type : Mesure ou list[Mesure] ou dict{-:Mesure}
             ValueError: Lorsque la mesure vaut None
         Returns:
-            (int / List[int]): Identifiant des mesures ajoutées
+            (int / List[int]): Identifiant des mesures ajoutées (None pour une mesure déjà existante)
         """
         res = None
         if mesure is not None:
             if isinstance(mesure, Mesure):
-                nb_mesure = 0
-                sql_end = ""
-                if PiouPiouDao.MAX_MESURE_MOD_STATION in self.max_mesure_mode:
-                    id_station = mesure.station.id
-                    nb_mesure = self.nombre_mesures(station=id_station, verbose=verbose)
-                    sql_end = f" WHERE station={id_station}"
-                elif  PiouPiouDao.MAX_MESURE_MOD_ALL in self.max_mesure_mode:
-                    nb_mesure = self.nombre_mesures(verbose=verbose)
-
-                if nb_mesure > 0 and nb_mesure == self.max_mesure:
-                    # on supprime la mesure la plus ancienne pour garder uniquement les 10 dernières mesures
-                    self._executer_sql(f"DELETE FROM mesure WHERE id = (SELECT MIN(id) FROM mesure{sql_end});", verbose=verbose)
-                res = self._executer_sql(f"INSERT INTO mesure (id, mesure_date, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min, station) VALUES (NULL,'{mesure.date}',{mesure.wind_heading}, {mesure.wind_speed_avg}, {mesure.wind_speed_max}, {mesure.wind_speed_min},  {mesure.station.id});", verbose=verbose)
-                # Mise à jour de l'id de la mesure
-                mesure.id = res
-            elif isinstance(mesure, list):
-                res = []
-                try:
-                    for st in mesure:
-                        res.append(self.ajouter_mesure(st, verbose))
-                # on ajoute toutes les stations qui n'existent pas déjà
-                except sqlite3.IntegrityError:
-                    print(f"La mesure {st} existe déjà en BDD.")
-            elif isinstance(mesure, dict):
+                # La suppression des mesures les plus anciennes est faite par le trigger de rétention
+                res = self.ajouter_mesures([mesure], verbose, ignorer_doublons)[0]
+            elif isinstance(mesure, (list, tuple, dict, VueMesures)):
                 res = []
+                # Le lot est ajouté en une seule transaction
                 try:
-                    for st in mesure.values():
-                        res.append(self.ajouter_mesure(st, verbose))
-                # on ajoute toutes les stations qui n'existent pas déjà
+                    res = self.ajouter_mesures(mesure, verbose, ignorer_doublons)
                 except sqlite3.IntegrityError:
-                    print(f"La mesure {st} existe déjà en BDD.")
+                    print(f"Le lot de {len(mesure)} mesures n'a pas pu être ajouté en BDD.")
             else:
                 raise TypeError(f"type Station attendu et non {mesure}")
         else:
             raise ValueError("La mesure ne peut pas être vide ou Null")
         return res
 
+    def ajouter_mesures(self, mesures, verbose=False, ignorer_doublons=True):
+        """Ajoute un lot de mesures en BDD, en une seule transaction (executemany).
+        Le nombre maximum de mesures (max_mesure) est appliqué ligne à ligne par le trigger de rétention.
+        La date est enregistrée telle quelle et en timestamp epoch (mesure_ts).
+        Les doublons (même station et même date, quel que soit son format) sont écartés par la contrainte d'unicité, sans requête préalable.
+        Lorsque les doublons sont ignorés, une mesure dont la date est celle de la dernière mesure de sa station (cache_mesures) est écartée
+        avant toute requête, et sans rétention active un lot de mesures plus récentes que le cache est inséré sans recherche des identifiants.
+        Le nombre de mesures réellement insérées est disponible dans nb_mesures_inserees.
+
+        Args:
+            mesures (list[Mesure]/VueMesures/dict{-:Mesure}): Mesures à ajouter
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+            ignorer_doublons (bool, optional): True pour ignorer les mesures déjà en BDD (INSERT OR IGNORE), False pour lever IntegrityError. Defaults to True.
+
+        Raises:
+            TypeError: Lorsqu'un élément du lot n'est pas de type Mesure
+            ValueError: Lorsque le lot vaut None ou qu'une date n'est pas lisible
+
+        Returns:
+            List[int]: Identifiants des mesures ajoutées, dans l'ordre du lot
+                       (None pour une mesure ignorée ou déjà supprimée par la rétention pendant le lot)
+        """
+        if mesures is None:
+            raise ValueError("Le lot de mesures ne peut pas être vide ou Null")
+        if isinstance(mesures, dict):
+            mesures = list(mesures.values())
+        else:
+            # copie : le lot peut être la vue des mesures d'une station, modifiée pendant l'ajout
+            mesures = list(mesures)
+        for mesure in mesures:
+            if not isinstance(mesure, Mesure):
+                raise TypeError(f"type Mesure attendu et non {mesure}")
+        self.nb_mesures_inserees = 0
+        if len(mesures) == 0:
+            return []
+        with self._verrou:
+            a_inserer = self.cache_mesures.filtrer(mesures) if ignorer_doublons else mesures
+            if len(a_inserer) == 0:
+                if verbose:
+                    print("SQLite DAO > Mesures déjà en BDD :", len(mesures))
+                return [None] * len(mesures)
+            res = self._inserer_mesures(a_inserer, verbose=verbose, ignorer_doublons=ignorer_doublons)
+        if len(a_inserer) < len(mesures):
+            ids = {id(mesure): id_mesure for mesure, id_mesure in zip(a_inserer, res)}
+            res = [ids.get(id(mesure)) for mesure in mesures]
+        if self.nb_mesures_inserees > 0:
+            self._compter_enregistrement(verbose)
+        return res
+
+    def _inserer_mesures(self, mesures, verbose=False, ignorer_doublons=True):
+        """Insère le lot de mesures en une seule transaction et met à jour le cache des dernières mesures, voir ajouter_mesures
+
+        Returns:
+            List[int]: Identifiants des mesures ajoutées, dans l'ordre du lot
+                       (None pour une mesure ignorée ou déjà supprimée par la rétention pendant le lot)
+        """
+        lignes = [(mesure.date, date_vers_epoch(mesure.date), mesure.wind_heading, mesure.wind_speed_avg, mesure.wind_speed_max, mesure.wind_speed_min, mesure.station.id)
+                  for mesure in mesures]
+
+        sql = "INSERT INTO mesure (id, mesure_date, mesure_ts, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min, station) VALUES (NULL, ?, ?, ?, ?, ?, ?, ?);"
+        if ignorer_doublons:
+            sql = sql.replace("INSERT", "INSERT OR IGNORE", 1)
+        cur = None
+        with self._verrou:
+            conn = self.ouvrir(verbose=verbose)
+            try:
+                cur = conn.cursor()
+                self._debut_ecriture(conn)
+                if verbose:
+                    print("SQLite DAO >", sql, f"x {len(lignes)}", end="")
+                if self.metriques is not None:
+                    debut = time.perf_counter()
+                cur.executemany(sql, lignes)
+                nb_inserees = cur.rowcount
+                if self.metriques is not None:
+                    self.metriques.observer("sql_duree_secondes", time.perf_counter() - debut, type="INSERT_LOT")
+                    self.metriques.incrementer("sql_lignes_total", nb_inserees, type="INSERT_LOT")
+                res = [None] * len(lignes)
+                if nb_inserees > 0:
+                    # Identifiants lus après l'insertion, dans la transaction qui détient le verrou d'écriture :
+                    # les identifiants AUTOINCREMENT du lot sont consécutifs et se terminent par le dernier identifiant inséré
+                    # (last_insert_rowid n'est pas modifié par les triggers)
+                    dernier_id = cur.execute("SELECT last_insert_rowid();").fetchone()[0]
+                    premier_id = dernier_id - nb_inserees + 1
+                    if nb_inserees == len(lignes) and self.max_mesure <= 0:
+                        res = list(range(premier_id, dernier_id + 1))
+                    else:
+                        # Mesures ignorées (doublons) ou supprimées par le trigger de rétention pendant le lot :
+                        # les mesures encore en BDD sont associées, dans l'ordre du lot, par leur clé (station, mesure_ts)
+                        cur.execute("SELECT id, station, mesure_ts FROM mesure WHERE id BETWEEN ? AND ? ORDER BY id;", (premier_id, dernier_id))
+                        lignes_bdd = cur.fetchall()
+                        position = 0
+                        for i, ligne in enumerate(lignes):
+                            if position < len(lignes_bdd) and (lignes_bdd[position][1], lignes_bdd[position][2]) == (ligne[-1], ligne[1]):
+                                res[i] = lignes_bdd[position][0]
+                                position += 1
+                self._fin_ecriture(conn)
+            except sqlite3.Error as error:
+                print("SQLite > Erreur exécution SQL", error)
+                if self.metriques is not None:
+                    self.metriques.incrementer("sql_erreurs_total", type="INSERT_LOT")
+                self._annuler_ecriture(conn)
+                raise error
+            finally:
+                try:
+                    cur.close()
+                except Exception:
+                    pass
+            for mesure, ligne, id_mesure in zip(mesures, lignes, res):
+                if id_mesure is not None:
+                    mesure.id = id_mesure
+                    self.cache_mesures.mettre_a_jour(mesure, ligne[1])
+        self.nb_mesures_inserees = nb_inserees
+        if verbose:
+            print(f" => {nb_inserees} insérées :", res)
+        return res
+
+    def appliquer_retention(self, verbose=False):
+        """Enregistre max_mesure et max_mesure_mode pour le trigger de rétention,
+        puis supprime en une passe les mesures au-delà du maximum (utile lorsque le maximum diminue ou que le mode change).
+
+        Args:
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+        """
+        cur = None
+        with self._verrou:
+            conn = self.ouvrir(verbose=verbose)
+            try:
+                cur = conn.cursor()
+                self._debut_ecriture(conn)
+                max_mesure = self.max_mesure if self.max_mesure is not None else -1
+                cur.execute("UPDATE retention SET max_mesure = ?, mode = ? WHERE id = 1;", (max_mesure, self.max_mesure_mode))
+                if max_mesure > 0:
+                    if self.max_mesure_mode == PiouPiouDao.MAX_MESURE_MOD_STATION:
+                        # on garde uniquement les max_mesure dernières mesures de chaque station
+                        cur.execute("SELECT station FROM compteur_mesure WHERE nb > ?;", (max_mesure,))
+                        cur.executemany("DELETE FROM mesure WHERE station = ? AND id <= (SELECT id FROM mesure WHERE station = ? ORDER BY id DESC LIMIT 1 OFFSET ?);",
+                                        [(row[0], row[0], max_mesure) for row in cur.fetchall()])
+                    else:
+                        cur.execute("DELETE FROM mesure WHERE id <= (SELECT id FROM mesure ORDER BY id DESC LIMIT 1 OFFSET ?);", (max_mesure,))
+                if verbose:
+                    print(f"SQLite DAO > Rétention : {max_mesure} mesures max par '{self.max_mesure_mode}', {cur.rowcount} mesures supprimées")
+                self._fin_ecriture(conn)
+            except sqlite3.Error as error:
+                print("SQLite > Erreur exécution SQL", error)
+                self._annuler_ecriture(conn)
+                raise error
+            finally:
+                try:
+                    cur.close()
+                except Exception:
+                    pass
+
     def stations(self, verbose=False):
         """Retourne la liste des stations en BDD
 
@@ -249,93 +1056,354 @@ class PiouPiouDao:
         """
 
         sql = ""
+        params = ()
         if station is not None and isinstance(station, Station):
-            sql = f"SELECT id, mesure_date, wind_heading, wind_speed_avg, wind_speed_min, wind_speed_max, station FROM mesure WHERE station = {station.id} ORDER BY id;"
+            sql = "SELECT id, mesure_date, wind_heading, wind_speed_avg, wind_speed_min, wind_speed_max, station FROM mesure WHERE station = ? ORDER BY id;"
+            params = (station.id,)
         else:
-            sql = f"SELECT id, mesure_date, wind_heading, wind_speed_avg, wind_speed_min, wind_speed_max, station FROM mesure ORDER BY station, id;"
+            sql = "SELECT id, mesure_date, wind_heading, wind_speed_avg, wind_speed_min, wind_speed_max, station FROM mesure ORDER BY station, id;"
 
-        res = self._executer_sql(sql, verbose=verbose)
-        mesures_list = []
-        for row in res:
-            # date, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min, station
-            mesure = Mesure(date=row[1],wind_heading=row[2], wind_speed_avg=row[3], wind_speed_max=row[5], wind_speed_min=row[4], station=station)
-            mesures_list.append(mesure)
+        res = self._executer_sql(sql, verbose=verbose, params=params)
+        return self._creer_mesures(res, station, verbose)
 
-        return mesures_list
 
+    def premier_id_mesure(self, station, verbose=False):
+        """Retourne l'identifiant de la plus ancienne mesure conservée pour la station :
+        les mesures d'identifiant inférieur ont été supprimées par la rétention.
+
+        Args:
+            station (Station/int): Station ou identifiant de la station
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+
+        Returns:
+            int: identifiant de la plus ancienne mesure de la station, None si la station n'a pas de mesure
+        """
+        if isinstance(station, Station):
+            station = station.id
+        res = self._executer_sql("SELECT MIN(id) FROM mesure WHERE station = ?;", verbose=verbose, params=(int(station),))
+        return res[0][0]
 
-    def select_mesures(self, station=None, mesure_date=None, wind_heading=None, wind_speed_avg=None, wind_speed_min=None,wind_speed_max=None, id_mesure=None, verbose=False):
+    def select_mesures(self, station=None, mesure_date=None, wind_heading=None, wind_speed_avg=None, wind_speed_min=None,wind_speed_max=None, id_mesure=None, verbose=False, after_id=None, since=None, until=None, limit=None):
         """Recherche les mesures correspondants aux critères reçus
 
         Args:
-            station (Station, optional): Station pour laquelle on souhaite les mesures. Defaults to None.
-            mesure_date (str, optional): Date de la mesure. Defaults to None.
+            station (Station/int, optional): Station (ou identifiant de la station) pour laquelle on souhaite les mesures. Defaults to None.
+            mesure_date (str/datetime, optional): Date de la mesure, quel que soit son format. Defaults to None.
             wind_heading (float, optional): heading. Defaults to None.
             wind_speed_avg (float, optional): avg. Defaults to None.
             wind_speed_min (float, optional): min. Defaults to None.
             wind_speed_max (float, optional): max. Defaults to None.
             id_mesure (int, optional): identifiant de la mesure. Defaults to None.
             verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+            after_id (int, optional): pour ne retourner que les mesures d'identifiant supérieur (mesures plus récentes). Defaults to None.
+            since (str/datetime/int, optional): début de la période (inclus), date ou timestamp epoch. Defaults to None.
+            until (str/datetime/int, optional): fin de la période (exclue), date ou timestamp epoch. Defaults to None.
+            limit (int, optional): nombre maximum de mesures retournées. Defaults to None, pas de limite.
+                                   Pour paginer : after_id = identifiant de la dernière mesure de la page précédente.
+                                   Avec after_id ou limit, les mesures sont triées par identifiant (toutes stations confondues), sinon par station puis identifiant.
+
+        Raises:
+            ValueError: Si une date n'est pas lisible
 
         Returns:
             List[Mesure]: Liste des mesures correspondants aux paramètres
         """
+        sql = "SELECT id, mesure_date, wind_heading, wind_speed_avg, wind_speed_min, wind_speed_max, station FROM mesure "
+        sql_where, params = self._where_mesures(station=station, mesure_date=mesure_date, wind_heading=wind_heading, wind_speed_avg=wind_speed_avg,
+                                                wind_speed_min=wind_speed_min, wind_speed_max=wind_speed_max, id_mesure=id_mesure,
+                                                after_id=after_id, since=since, until=until)
+        # la pagination se fait sur l'identifiant : le tri doit suivre la même clé pour ne sauter aucune mesure
+        sql_end = " ORDER BY id" if after_id is not None or limit is not None else " ORDER BY station, id"
+        if limit is not None:
+            sql_end += " LIMIT ?"
+            params.append(int(limit))
+        sql_end += ";"
 
-        nb_param = 0
+        requete = sql+sql_where+sql_end
+        res = self._executer_sql(requete, verbose=verbose, params=params)
+        return self._creer_mesures(res, station, verbose)
 
-        sql = f"SELECT id, mesure_date, wind_heading, wind_speed_avg, wind_speed_min, wind_speed_max, station FROM mesure "
-        sql_where = ""
-        sql_key = "WHERE"
-        sql_end = " ORDER BY station, id;"
+    def iterer_mesures(self, station=None, since=None, until=None, after_id=None, limit=None, taille_lot=500, verbose=False):
+        """Parcourt les mesures en mémoire constante (générateur), dans l'ordre d'enregistrement (id croissant).
+        Les mesures sont lues par lots de taille_lot, chaque lot est une requête courte reprenant après le dernier identifiant lu
+        (pagination par clé sur l'index de l'id) : le verrou n'est pas conservé entre deux lots et les écritures ne sont pas bloquées pendant le parcours.
+
+        Args:
+            station (Station/int, optional): Station (ou identifiant de la station) pour laquelle on souhaite les mesures. Defaults to None, toutes les stations.
+            since (str/datetime/int, optional): début de la période (inclus), date ou timestamp epoch. Defaults to None.
+            until (str/datetime/int, optional): fin de la période (exclue), date ou timestamp epoch. Defaults to None.
+            after_id (int, optional): pour ne parcourir que les mesures d'identifiant supérieur. Defaults to None.
+            limit (int, optional): nombre maximum de mesures parcourues. Defaults to None, pas de limite.
+            taille_lot (int, optional): nombre de mesures lues par requête. Defaults to 500.
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+
+        Raises:
+            ValueError: Si taille_lot n'est pas strictement positive ou si une date n'est pas lisible
+
+        Yields:
+            Mesure: mesures correspondants aux paramètres
+        """
+        if taille_lot is None or int(taille_lot) < 1:
+            raise ValueError(f"La taille des lots doit être strictement positive et non {taille_lot}")
+        sql = "SELECT id, mesure_date, wind_heading, wind_speed_avg, wind_speed_min, wind_speed_max, station FROM mesure "
+        sql_where, params = self._where_mesures(station=station, since=since, until=until)
+        sql_where += "AND" if len(sql_where) > 0 else "WHERE"
+        # même requête pour tous les lots, seuls le dernier identifiant lu et la taille du lot changent
+        requete = f"{sql}{sql_where} id > ? ORDER BY id LIMIT ?;"
+        dernier_id = after_id if after_id is not None else 0
+        nb_lues = 0
+        stations_par_id = None
+        while limit is None or nb_lues < limit:
+            taille = int(taille_lot) if limit is None else min(int(taille_lot), limit - nb_lues)
+            res = self._executer_sql(requete, verbose=verbose, params=params + [int(dernier_id), taille])
+            if len(res) == 0:
+                return
+            if stations_par_id is None and not isinstance(station, Station):
+                stations_par_id = {st.id: st for st in self.stations(verbose=verbose)}
+            yield from self._creer_mesures(res, station, verbose, stations_par_id=stations_par_id)
+            dernier_id = res[-1][0]
+            nb_lues += len(res)
+            if len(res) < taille:
+                return
+
+    def _where_mesures(self, station=None, mesure_date=None, wind_heading=None, wind_speed_avg=None, wind_speed_min=None,wind_speed_max=None, id_mesure=None, after_id=None, since=None, until=None):
+        """Construit la clause WHERE paramétrée de la recherche des mesures, voir select_mesures.
+        Le texte de la clause ne dépend que des critères précisés et non de leurs valeurs :
+        la requête préparée est réutilisée d'un appel à l'autre (cache des requêtes de la connexion).
+
+        Returns:
+            (str, list): clause WHERE (vide si aucun critère n'est précisé) et valeurs de ses paramètres, dans l'ordre
+        """
+        criteres = []
+        params = []
+
+        if isinstance(station, Station):
+            criteres.append("station = ?")
+            params.append(station.id)
+        elif isinstance(station, int) and not isinstance(station, bool):
+            criteres.append("station = ?")
+            params.append(station)
 
-        if station is not None and isinstance(station, Station):
-            sql_where += f"{sql_key} station = {station.id} "
-            nb_param += 1
-            sql_key = "AND"
-        
         if id_mesure  is not None and isinstance(id_mesure, int):
-            sql_where += f"{sql_key} id = {id_mesure} "
-            nb_param += 1
-            sql_key = "AND"
+            criteres.append("id = ?")
+            params.append(id_mesure)
+
+        if after_id  is not None and isinstance(after_id, int):
+            criteres.append("id > ?")
+            params.append(after_id)
+
+        if mesure_date  is not None and isinstance(mesure_date, (str, datetime)):
+            criteres.append("mesure_ts = ?")
+            params.append(date_vers_epoch(mesure_date))
 
-        if mesure_date  is not None and isinstance(mesure_date, str):
-            sql_where += f"{sql_key} mesure_date = '{mesure_date}' "
-            nb_param += 1
-            sql_key = "AND"
+        # les périodes sont des parcours d'intervalle sur l'index des timestamps
+        if since is not None:
+            criteres.append("mesure_ts >= ?")
+            params.append(date_vers_epoch(since))
+
+        if until is not None:
+            criteres.append("mesure_ts < ?")
+            params.append(date_vers_epoch(until))
 
         if wind_heading  is not None and isinstance(wind_heading, float):
-            sql_where += f"{sql_key} wind_heading = {wind_heading} "
-            nb_param += 1
-            sql_key = "AND"
+            criteres.append("wind_heading = ?")
+            params.append(wind_heading)
 
         if wind_speed_avg  is not None:
-            sql_where += f"{sql_key} wind_speed_avg = {wind_speed_avg} "
-            nb_param += 1
-            sql_key = "AND"
+            criteres.append("wind_speed_avg = ?")
+            params.append(wind_speed_avg)
 
         if wind_speed_min  is not None:
-            sql_where += f"{sql_key} wind_speed_min = {wind_speed_min} "
-            nb_param += 1
-            sql_key = "AND"
+            criteres.append("wind_speed_min = ?")
+            params.append(wind_speed_min)
 
         if wind_speed_max  is not None:
-            sql_where += f"{sql_key} wind_speed_max = {wind_speed_max} "
-            nb_param += 1
-            sql_key = "AND"
+            criteres.append("wind_speed_max = ?")
+            params.append(wind_speed_max)
 
-        requete = sql+sql_where+sql_end
-        res = self._executer_sql(requete, verbose=verbose)
+        sql_where = ""
+        if len(criteres) > 0:
+            sql_where = "WHERE " + " AND ".join(criteres) + " "
+        return sql_where, params
+
+    def _creer_mesures(self, lignes, station=None, verbose=False, stations_par_id=None):
+        """Créé les mesures à partir des lignes (id, mesure_date, wind_heading, wind_speed_avg, wind_speed_min, wind_speed_max, station)
+
+        Args:
+            lignes (list[tuple]): lignes lues en BDD
+            station (Station, optional): Station des mesures. Defaults to None, la station de chaque ligne est lue en BDD.
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+            stations_par_id (dict{int:Station}, optional): stations déjà lues en BDD. Defaults to None.
+
+        Returns:
+            List[Mesure]: Liste des mesures
+        """
+        if stations_par_id is None and not isinstance(station, Station) and len(lignes) > 0:
+            stations_par_id = {st.id: st for st in self.stations(verbose=verbose)}
         mesures_list = []
-        for row in res:
+        for row in lignes:
+            station_mesure = station if isinstance(station, Station) else stations_par_id.get(row[6])
             # date, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min, station
-            mesure = Mesure(date=row[1],wind_heading=row[2], wind_speed_avg=row[3], wind_speed_max=row[5], wind_speed_min=row[4], station=station)
+            mesure = Mesure(date=row[1],wind_heading=row[2], wind_speed_avg=row[3], wind_speed_max=row[5], wind_speed_min=row[4], station=station_mesure, id=row[0])
             mesures_list.append(mesure)
 
         return mesures_list
 
 
+    def mesures_colonnes(self, station=None, since=None, until=None, verbose=False):
+        """Retourne les mesures sous forme de tableaux NumPy structurés (une colonne par champ, voir DTYPE_MESURE),
+        lus directement depuis le curseur, sans créer d'objet Mesure
+
+        Args:
+            station (Station/int, optional): Station concernée. Defaults to None, toutes les stations.
+            since (str/datetime/int, optional): début de la période (inclus), date ou timestamp epoch. Defaults to None.
+            until (str/datetime/int, optional): fin de la période (exclue), date ou timestamp epoch. Defaults to None.
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+
+        Raises:
+            ImportError: Si NumPy n'est pas installé
+
+        Returns:
+            dict{int: ndarray}: mesures de chaque station (triées par id), par identifiant de station
+        """
+        if np is None:
+            raise ImportError("NumPy est nécessaire pour l'export des mesures en colonnes (pip install numpy)")
+        # -1 : date illisible, mesure enregistrée avant la version 5 du schéma
+        return self._lire_colonnes("id, IFNULL(mesure_ts, -1), wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min, station",
+                                   PiouPiouDao.DTYPE_MESURE, station, since, until, verbose)
+
+    def _lire_colonnes(self, colonnes, dtype, station=None, since=None, until=None, verbose=False):
+        """Lit les colonnes demandées des mesures directement dans un tableau NumPy structuré, découpé par station
+
+        Args:
+            colonnes (str): colonnes (ou expressions) SQL lues, dans l'ordre des champs du dtype, la dernière est la station
+            dtype (list): champs du tableau structuré, le dernier est "station"
+            station (Station/int, optional): Station concernée. Defaults to None, toutes les stations.
+            since (str/datetime/int, optional): début de la période (inclus), date ou timestamp epoch. Defaults to None.
+            until (str/datetime/int, optional): fin de la période (exclue), date ou timestamp epoch. Defaults to None.
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+
+        Returns:
+            dict{int: ndarray}: mesures de chaque station (triées par id), par identifiant de station
+        """
+        sql = f"SELECT {colonnes} FROM mesure "
+        # mêmes critères que select_mesures et iterer_mesures
+        sql_where, params = self._where_mesures(station=station if isinstance(station, Station) or station is None else int(station), since=since, until=until)
+        # une mesure sans station ne peut pas être convertie en entier (ni rangée par station)
+        sql_where += "AND station IS NOT NULL " if len(sql_where) > 0 else "WHERE station IS NOT NULL "
+        sql += sql_where + "ORDER BY station, id;"
+        if verbose:
+            print("SQLite DAO >", sql, params)
+        with self._verrou:
+            cur = self.ouvrir(verbose=verbose).execute(sql, params)
+            try:
+                # les valeurs NULL deviennent NaN
+                donnees = np.fromiter(cur, dtype=dtype)
+            finally:
+                cur.close()
+
+        res = {}
+        # les lignes sont triées par station : découpage (sans copie) aux changements de station
+        id_stations, debuts = np.unique(donnees["station"], return_index=True)
+        fins = list(debuts[1:]) + [len(donnees)]
+        for id_station, debut, fin in zip(id_stations, debuts, fins):
+            res[int(id_station)] = donnees[debut:fin]
+        return res
+
+    def statistiques_vent(self, station=None, since=None, until=None, nb_secteurs=16, pas_vitesse=5, verbose=False):
+        """Calcule les statistiques de vent sur une période, avec NumPy et sans créer d'objet Mesure :
+        rose des vents, distribution des vitesses, facteur de rafale et direction moyenne (moyenne circulaire)
+
+        Args:
+            station (Station/int, optional): Station concernée. Defaults to None, statistiques de chaque station.
+            since (str/datetime/int, optional): début de la période (inclus), date ou timestamp epoch. Defaults to None.
+            until (str/datetime/int, optional): fin de la période (exclue), date ou timestamp epoch. Defaults to None.
+            nb_secteurs (int, optional): nombre de secteurs de la rose des vents, le 1er secteur est centré sur le Nord. Defaults to 16.
+            pas_vitesse (float, optional): largeur en km/h des classes de la distribution des vitesses moyennes. Defaults to 5.
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+
+        Raises:
+            ImportError: Si NumPy n'est pas installé
+
+        Returns:
+            dict: statistiques de la station (voir _calculer_statistiques_vent),
+                  ou {identifiant de station: statistiques} si aucune station n'est précisée
+        """
+        if np is None:
+            raise ImportError("NumPy est nécessaire pour calculer les statistiques de vent (pip install numpy)")
+        # seules les colonnes utilisées par les statistiques sont lues
+        colonnes = self._lire_colonnes("wind_heading, wind_speed_avg, wind_speed_max, station", PiouPiouDao.DTYPE_VENT, station, since, until, verbose)
+        if station is not None:
+            id_station = station.id if isinstance(station, Station) else int(station)
+            donnees = colonnes.get(id_station, np.empty(0, dtype=PiouPiouDao.DTYPE_VENT))
+            return PiouPiouDao._calculer_statistiques_vent(donnees["wind_heading"], donnees["wind_speed_avg"], donnees["wind_speed_max"], nb_secteurs, pas_vitesse)
+        res = {}
+        for id_station, donnees in colonnes.items():
+            res[id_station] = PiouPiouDao._calculer_statistiques_vent(donnees["wind_heading"], donnees["wind_speed_avg"], donnees["wind_speed_max"], nb_secteurs, pas_vitesse)
+        return res
+
+    @staticmethod
+    def _calculer_statistiques_vent(wind_heading, wind_speed_avg, wind_speed_max, nb_secteurs=16, pas_vitesse=5):
+        """
+        Args:
+            wind_heading (ndarray): directions en degrés
+            wind_speed_avg (ndarray): vitesses moyennes en km/h
+            wind_speed_max (ndarray): vitesses maximales en km/h
+            nb_secteurs (int, optional): nombre de secteurs de la rose des vents. Defaults to 16.
+            pas_vitesse (float, optional): largeur en km/h des classes de la distribution des vitesses. Defaults to 5.
+
+        Returns:
+            dict: nb_mesures, vitesse_moyenne, vitesse_max,
+                  rose_des_vents (nombre de mesures par secteur), vitesse_par_secteur (vitesse moyenne par secteur),
+                  distribution_vitesse (nombre de mesures par classe), bornes_vitesse,
+                  facteur_rafale (moyenne de max / avg), facteur_rafale_max,
+                  direction_moyenne (degrés, None si indéterminée) et constance (0 : vent variable, 1 : direction constante)
+        """
+        largeur = 360.0 / nb_secteurs
+        avec_direction = ~np.isnan(wind_heading)
+        secteurs = (np.floor(((wind_heading[avec_direction] + largeur / 2) % 360.0) / largeur).astype(int)) % nb_secteurs
+        rose = np.bincount(secteurs, minlength=nb_secteurs)
+        vitesses_secteur = np.nan_to_num(wind_speed_avg[avec_direction], nan=0.0)
+        somme_secteur = np.bincount(secteurs, weights=vitesses_secteur, minlength=nb_secteurs)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            vitesse_par_secteur = np.where(rose > 0, somme_secteur / rose, np.nan)
+
+        vitesses = wind_speed_avg[~np.isnan(wind_speed_avg)]
+        vitesse_max = float(vitesses.max()) if len(vitesses) > 0 else 0.0
+        bornes = np.arange(0.0, vitesse_max + pas_vitesse, pas_vitesse)
+        if len(bornes) < 2:
+            bornes = np.array([0.0, float(pas_vitesse)])
+        distribution, bornes = np.histogram(vitesses, bins=bornes)
+
+        avec_vent = (wind_speed_avg > 0) & ~np.isnan(wind_speed_max)
+        facteurs = wind_speed_max[avec_vent] / wind_speed_avg[avec_vent]
+
+        angles = np.radians(wind_heading[avec_direction])
+        direction_moyenne = None
+        constance = 0.0
+        if len(angles) > 0:
+            sin_moyen = np.sin(angles).mean()
+            cos_moyen = np.cos(angles).mean()
+            constance = float(np.hypot(sin_moyen, cos_moyen))
+            if constance > 1e-9:
+                direction_moyenne = float(np.degrees(np.arctan2(sin_moyen, cos_moyen)) % 360.0)
+
+        return {
+            "nb_mesures": int(len(wind_heading)),
+            "vitesse_moyenne": float(vitesses.mean()) if len(vitesses) > 0 else None,
+            "vitesse_max": float(np.nanmax(wind_speed_max)) if np.any(~np.isnan(wind_speed_max)) else None,
+            "rose_des_vents": rose,
+            "vitesse_par_secteur": vitesse_par_secteur,
+            "distribution_vitesse": distribution,
+            "bornes_vitesse": bornes,
+            "facteur_rafale": float(facteurs.mean()) if len(facteurs) > 0 else None,
+            "facteur_rafale_max": float(facteurs.max()) if len(facteurs) > 0 else None,
+            "direction_moyenne": direction_moyenne,
+            "constance": constance,
+        }
+
     def initialiser_bdd(self, drop_if_exist = False, verbose=False):
-        """Créé les tables manquantes
+        """Créé les tables manquantes et met à jour le schéma d'une BDD existante (migrations versionnées)
 
         Args:
             drop_if_exist (bool, optional): Pour supprimer les tables si elles existent déjà /!\ Suppression des données. Defaults to False.
@@ -345,17 +1413,151 @@ class PiouPiouDao:
             bool: Si les tables existent dans la BDD ou non
         """
         if drop_if_exist:
+            self._supprimer_table_retention(verbose)
             self._supprimer_table_mesure(verbose)
             self._supprimer_table_station(verbose)
-        # Vérifier si la BDD existe déjà
-        tables = self.liste_tables(verbose)
-        if "station" not in tables:
-            self._creer_table_station(verbose)
-        if "mesure" not in tables:
-            self._creer_table_mesure(verbose)
-        # vérifier que les tables sont bien créées
-        tables = self.liste_tables(verbose)
-        return "station" in tables and "mesure" in tables
+            self._executer_sql("PRAGMA user_version = 0;", verbose=verbose)
+        version = self.version_schema(verbose)
+        succes = True
+        if version < PiouPiouDao.SCHEMA_VERSION:
+            for version_migration, description, requetes in PiouPiouDao.MIGRATIONS:
+                if version_migration > version:
+                    self._migrer(version_migration, description, requetes, verbose)
+            # vérifier que les tables sont bien créées
+            tables = self.liste_tables(verbose)
+            succes = "station" in tables and "mesure" in tables and "retention" in tables
+        if succes:
+            self.appliquer_retention(verbose)
+            self._retention_initialisee = True
+            self.charger_cache_mesures(verbose)
+        # le schéma et la rétention sont validés sans attendre, quel que soit le mode de durabilité
+        self.valider(verbose)
+        return succes
+
+    def charger_cache_mesures(self, verbose=False):
+        """Charge dans cache_mesures la dernière mesure de chaque station (une ligne par station, lue sur l'index d'unicité)
+
+        Args:
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+        """
+        # SQLite : les colonnes sans agrégat sont celles de la ligne retenue par MAX
+        res = self._executer_sql("SELECT station, MAX(mesure_ts), wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min FROM mesure WHERE station IS NOT NULL AND mesure_ts IS NOT NULL GROUP BY station;", verbose=verbose)
+        with self._verrou:
+            self.cache_mesures.charger(res)
+
+    def version_schema(self, verbose=False):
+        """
+        Args:
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+
+        Returns:
+            int: Version du schéma de la BDD (0 si la BDD n'a jamais été migrée)
+        """
+        return self._executer_sql("PRAGMA user_version;", verbose=verbose)[0][0]
+
+    def empreinte(self, verbose=False):
+        """Résume l'état de la BDD pour détecter toute modification entre deux lancements :
+        version du schéma, dernière séquence des mesures (augmente à chaque insertion), nombre total de mesures (diminue à chaque suppression),
+        nombre et plus grand identifiant des stations, paramètres de rétention enregistrés.
+        PRAGMA data_version n'est pas utilisable : sa valeur n'a de sens que pour une même connexion, elle n'est pas conservée d'un processus à l'autre.
+
+        Args:
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+
+        Returns:
+            dict: empreinte de la BDD, None si le schéma n'est pas à jour (BDD vide ou à migrer)
+        """
+        if self.version_schema(verbose) != PiouPiouDao.SCHEMA_VERSION:
+            return None
+        res = self._executer_sql("SELECT (SELECT user_version FROM pragma_user_version), (SELECT seq FROM sqlite_sequence WHERE name = 'mesure'), "
+                                 "(SELECT count(*) FROM station), (SELECT MAX(id) FROM station), max_mesure, mode, nb_total FROM retention WHERE id = 1;", verbose=verbose)
+        if len(res) == 0:
+            return None
+        cles = ("schema", "seq_mesure", "nb_stations", "id_station_max", "max_mesure", "mode", "nb_mesures")
+        return dict(zip(cles, res[0]))
+
+    def instantane(self, verbose=False):
+        """Exporte l'état de la DAO nécessaire à un démarrage rapide (reprendre_instantane) : empreinte de la BDD et cache des dernières mesures.
+        Les écritures en attente sont validées avant le calcul de l'empreinte.
+
+        Args:
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+
+        Returns:
+            dict: {"empreinte": empreinte(), "dernieres_mesures": lignes du cache}, sérialisable en JSON
+        """
+        with self._verrou:
+            self.valider(verbose)
+            return {"empreinte": self.empreinte(verbose), "dernieres_mesures": self.cache_mesures.lignes()}
+
+    def reprendre_instantane(self, instantane, verbose=False):
+        """Démarrage rapide, à la place de initialiser_bdd : si la BDD n'a pas changé depuis l'instantané (même empreinte)
+        et que les paramètres de rétention n'ont pas changé, le cache des dernières mesures est rechargé depuis l'instantané,
+        sans migration, sans application de la rétention et sans lecture des mesures.
+
+        Args:
+            instantane (dict): export instantane() d'un lancement précédent
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+
+        Returns:
+            bool: True si l'instantané est valide et a été repris, False s'il faut appeler initialiser_bdd
+        """
+        try:
+            empreinte = self.empreinte(verbose)
+            max_mesure = self.max_mesure if self.max_mesure is not None else -1
+            valide = (empreinte is not None and empreinte == instantane["empreinte"]
+                      and empreinte["max_mesure"] == max_mesure and empreinte["mode"] == self.max_mesure_mode)
+            if valide:
+                lignes = [tuple(ligne) for ligne in instantane["dernieres_mesures"]]
+        except (sqlite3.Error, KeyError, TypeError) as error:
+            print("SQLite DAO > Instantané illisible", error)
+            valide = False
+        if not valide:
+            if verbose:
+                print("SQLite DAO > Instantané périmé, initialisation complète de la BDD")
+            return False
+        with self._verrou:
+            self.cache_mesures.charger(lignes)
+        self._retention_initialisee = True
+        if verbose:
+            print(f"SQLite DAO > Démarrage depuis l'instantané : {len(lignes)} stations en cache")
+        return True
+
+    def _migrer(self, version, description, requetes, verbose=False):
+        """Exécute les requêtes d'une migration et la version du schéma dans une seule transaction
+
+        Args:
+            version (int): version du schéma après la migration
+            description (str): description de la migration (traces)
+            requetes (list[str]): requêtes de la migration
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+        """
+        cur = None
+        with self._verrou:
+            conn = self.ouvrir(verbose=verbose)
+            try:
+                if verbose:
+                    print(f"SQLite DAO > Migration du schéma vers la version {version} : {description}")
+                # les écritures en attente (mode 'groupee') sont validées avant la transaction de la migration
+                self.valider(verbose)
+                cur = conn.cursor()
+                cur.execute("BEGIN;")
+                for requete in requetes:
+                    if verbose > 1:
+                        print("SQLite DAO >", requete)
+                    cur.execute(requete)
+                cur.execute(f"PRAGMA user_version = {int(version)};")
+                conn.commit()
+            except sqlite3.Error as error:
+                print(f"SQLite > Erreur lors de la migration vers la version {version}", error)
+                conn.rollback()
+                raise error
+            finally:
+                try:
+                    cur.close()
+                except Exception:
+                    pass
+        self._compter_enregistrement(verbose)
 
     def creer_sauvegarde(self, file_path, verbose=False):
         """Créer un fichier de sauvegarde de la BDD courante
@@ -368,13 +1570,18 @@ class PiouPiouDao:
             boolean: True si fichier de sauvegarde créé, False sinon
         """
         success = False
+        BDD_Destination = None
+        debut = time.perf_counter()
         try:
-            conn = self.connecter()
-            BDD_Destination = sqlite3.connect (file_path)
-            conn.backup (BDD_Destination)
+            BDD_Destination = sqlite3.connect(file_path)
+            # La sauvegarde utilise la connexion persistante, les écritures sont suspendues pendant la copie
+            with self._verrou:
+                conn = self.ouvrir(verbose=verbose)
+                self.valider(verbose)
+                conn.backup(BDD_Destination)
             if verbose:
                 print("SQLite DAO > Sauvegarde effectuée :",file_path)
-        # Fermeture des connexions
+        # Fermeture de la connexion de sauvegarde
         finally:
             try:
                 BDD_Destination.close()
@@ -382,69 +1589,254 @@ class PiouPiouDao:
                     print("SQLite DAO > connexion sauvegarde fermée")
             except Exception:
                 pass
-            try:
-                conn.close()
-                if verbose > 1:
-                    print("SQLite DAO > La connexion est fermée")
-            except Exception:
-                pass
         # Vérification que le fichier existe bien
         try:
             with open(file_path): success=True
         except IOError:
             pass   
+        with self._verrou_sauvegarde:
+            self._etat_sauvegarde.update({"fichier": file_path, "date": time.time(), "duree": time.perf_counter() - debut, "succes": success, "erreur": None})
+            if success:
+                self._etat_sauvegarde["nb_sauvegardes"] += 1
+        self._mesurer_sauvegarde("complete", time.perf_counter() - debut, success)
         return success
 
+    def lancer_sauvegarde(self, file_path=None, verbose=False):
+        """Lance une sauvegarde de la BDD en arrière-plan. La copie est faite par étapes de pages_backup pages,
+        les écritures peuvent donc continuer pendant la sauvegarde.
+        La sauvegarde est d'abord écrite dans un fichier temporaire, qui remplace le fichier de sauvegarde une fois complet.
+
+        Args:
+            file_path (str, optional): Chemin complet avec nom du fichier de la sauvegarde. Defaults to None, backup_path.
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+
+        Returns:
+            bool: True si la sauvegarde a été lancée, False si une sauvegarde est déjà en cours
+        """
+        if file_path is None:
+            file_path = self.backup_path
+        # la sauvegarde est lue par une autre connexion : elle ne voit que les écritures validées
+        self.valider(verbose)
+        with self._verrou_sauvegarde:
+            if self._thread_sauvegarde is not None and self._thread_sauvegarde.is_alive():
+                if verbose > 1:
+                    print("SQLite DAO > Sauvegarde déjà en cours")
+                return False
+            self._debut_derniere_sauvegarde = time.monotonic()
+            self._etat_sauvegarde["en_cours"] = True
+            self._etat_sauvegarde["fichier"] = file_path
+            self._thread_sauvegarde = threading.Thread(target=self._sauvegarder_par_etapes, args=(file_path, verbose), name="piou_piou_sauvegarde", daemon=True)
+            self._thread_sauvegarde.start()
+        return True
+
+    def attendre_sauvegarde(self, timeout=None):
+        """Attend la fin de la sauvegarde en arrière-plan en cours
+
+        Args:
+            timeout (float, optional): Délai d'attente maximum en secondes. Defaults to None.
+
+        Returns:
+            bool: True si aucune sauvegarde n'est en cours
+        """
+        thread = self._thread_sauvegarde
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def etat_sauvegarde(self):
+        """
+        Returns:
+            dict: État de la dernière sauvegarde (en_cours, fichier, date de fin, duree en secondes, succes, erreur, pages restantes / totales, nombre de sauvegardes)
+        """
+        with self._verrou_sauvegarde:
+            return self._etat_sauvegarde.copy()
+
+    def stats(self):
+        """
+        Returns:
+            dict: État de la DAO : nombre d'écritures depuis la dernière sauvegarde automatique, taille du cache des dernières mesures,
+                  état de la sauvegarde et métriques (Metriques.stats(), None si les métriques ne sont pas activées)
+        """
+        return {"nb_enregistrements": self._nb_enregistrement, "cache_mesures": len(self.cache_mesures),
+                "sauvegarde": self.etat_sauvegarde(), "metriques": self.metriques.stats() if self.metriques is not None else None}
+
+    def _sauvegarder_par_etapes(self, file_path, verbose=False):
+        fichier_temp = None
+        debut = time.perf_counter()
+        succes = False
+        erreur = None
+        conn = None
+        BDD_Destination = None
+
+        def _progression(status, remaining, total):
+            with self._verrou_sauvegarde:
+                self._etat_sauvegarde["pages_restantes"] = remaining
+                self._etat_sauvegarde["pages_totales"] = total
+            # le paramètre sleep de backup ne s'applique qu'après SQLITE_BUSY/LOCKED : pause explicite entre deux étapes
+            if remaining > 0 and self.pause_backup > 0:
+                time.sleep(self.pause_backup)
+
+        try:
+            # Connexion dédiée : la connexion persistante reste disponible pour les écritures
+            conn = self.connecter(verbose=verbose)
+            # fichier temporaire unique dans le répertoire de la sauvegarde : deux sauvegardes simultanées ne partagent pas le même fichier
+            descripteur, fichier_temp = tempfile.mkstemp(dir=path.dirname(path.abspath(file_path)), prefix=path.basename(file_path) + ".", suffix=".tmp")
+            close(descripteur)
+            # mkstemp crée le fichier en 0600, comme pour le fichier Prometheus la sauvegarde reste lisible
+            chmod(fichier_temp, 0o644)
+            BDD_Destination = sqlite3.connect(fichier_temp)
+            conn.backup(BDD_Destination, pages=self.pages_backup, progress=_progression, sleep=self.pause_backup)
+            BDD_Destination.close()
+            BDD_Destination = None
+            replace(fichier_temp, file_path)
+            fichier_temp = None
+            succes = True
+            if verbose:
+                print("SQLite DAO > Sauvegarde effectuée :", file_path)
+        except (sqlite3.Error, OSError) as error:
+            erreur = str(error)
+            print("SQLite DAO > Erreur lors de la sauvegarde", error)
+        finally:
+            for connexion in (BDD_Destination, conn):
+                try:
+                    connexion.close()
+                except Exception:
+                    pass
+            if fichier_temp is not None:
+                # sauvegarde interrompue : le fichier temporaire est supprimé
+                try:
+                    remove(fichier_temp)
+                except OSError:
+                    pass
+            with self._verrou_sauvegarde:
+                self._etat_sauvegarde.update({"en_cours": False, "date": time.time(), "duree": time.perf_counter() - debut,
+                                              "succes": succes, "erreur": erreur})
+                if succes:
+                    self._etat_sauvegarde["nb_sauvegardes"] += 1
+            self._mesurer_sauvegarde("etapes", time.perf_counter() - debut, succes)
+
+    def _mesurer_sauvegarde(self, mode, duree, succes):
+        """Enregistre la durée et le résultat d'une sauvegarde dans les métriques, si elles sont activées
+
+        Args:
+            mode (str): 'complete' (creer_sauvegarde) ou 'etapes' (sauvegarde en arrière-plan)
+            duree (float): durée de la sauvegarde en secondes
+            succes (bool): True si la sauvegarde a réussi
+        """
+        if self.metriques is not None:
+            self.metriques.observer("sauvegarde_duree_secondes", duree, mode=mode)
+            if not succes:
+                self.metriques.incrementer("sauvegarde_erreurs_total", mode=mode)
+
     def _supprimer_table_station(self, verbose=False):
         res = self._executer_sql("DROP TABLE IF EXISTS station;", verbose=verbose)
         return res
 
     def _supprimer_table_mesure(self, verbose=False):
+        self.cache_mesures.vider()
         res = self._executer_sql("DROP TABLE IF EXISTS mesure;", verbose=verbose)
         return res
 
-    def _creer_table_station(self, verbose=False):
-        res = self._executer_sql("CREATE TABLE station (id INTEGER PRIMARY KEY, station_name TEXT NOT NULL, latitude REAL, longitude REAL);", verbose=verbose)
+    def _supprimer_table_retention(self, verbose=False):
+        self._retention_initialisee = False
+        self._executer_sql("DROP TABLE IF EXISTS compteur_mesure;", verbose=verbose)
+        res = self._executer_sql("DROP TABLE IF EXISTS retention;", verbose=verbose)
         return res
 
-    def _creer_table_mesure(self, verbose=False):
-        res = self._executer_sql("CREATE TABLE mesure (id INTEGER PRIMARY KEY AUTOINCREMENT, mesure_date TEXT NOT NULL, wind_heading REAL, wind_speed_avg REAL, wind_speed_max REAL, wind_speed_min REAL, station INTEGER, FOREIGN KEY(station) references station(id));", verbose=verbose)
-        return res
+    def _compter_enregistrement(self, verbose=False):
+        """Compte un changement de données et déclenche la sauvegarde tous les frequence_backup changements,
+        ou lorsque intervalle_backup secondes se sont écoulées depuis la dernière sauvegarde
 
-    def _executer_sql(self, sql, verbose=False):
-        conn = None
+        Args:
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+        """
+        self._nb_enregistrement += 1
+        declenchement = self.frequence_backup > 0 and self._nb_enregistrement >= self.frequence_backup
+        if not declenchement and self.intervalle_backup is not None:
+            declenchement = time.monotonic() - self._debut_derniere_sauvegarde >= self.intervalle_backup
+        if declenchement:
+            if self.durabilite == PiouPiouDao.DURABILITE_GROUPEE and self._conn is not None and self._conn.in_transaction:
+                # la sauvegarde ne contiendrait pas les écritures en attente : elle est faite après leur validation
+                self._sauvegarde_en_attente = True
+            else:
+                self._declencher_sauvegarde(verbose)
+
+    def _declencher_sauvegarde(self, verbose=False):
+        """Lance la sauvegarde automatique (en arrière-plan ou non selon sauvegarde_asynchrone)
+
+        Args:
+            verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False
+        """
+        if self.backup_path is not None:
+            if self.sauvegarde_asynchrone:
+                # Si une sauvegarde est déjà en cours, la prochaine écriture relancera la demande
+                if self.lancer_sauvegarde(self.backup_path, verbose):
+                    self._nb_enregistrement = 0
+            elif self.creer_sauvegarde(self.backup_path, verbose):
+                self._debut_derniere_sauvegarde = time.monotonic()
+                self._nb_enregistrement = 0
+        else:
+            print("Impossible de sauvegarder, backup_path vide")
+
+    @staticmethod
+    def _type_requete(sql):
+        """
+        Returns:
+            str: type de la requête pour les métriques (premier mot-clé : SELECT, INSERT, UPDATE, ...)
+        """
+        mots = sql.split(None, 1)
+        return mots[0].upper() if mots else ""
+
+    def _executer_sql(self, sql, verbose=False, params=()):
         cur = None
         # Séparation des try / except pour différencier les erreurs
         try:
-            conn = self.connecter()
-            cur = conn.cursor()
-            if verbose > 1:
-                print("SQLite DAO > Base de données crée et correctement connectée à SQLite")
-            try:
-                if verbose:
-                    print("SQLite DAO >", sql, end="")
-                cur.execute(sql)
-                conn.commit()
-                if "INSERT" in sql:
-                    res = cur.lastrowid
-                else:
-                    res = cur.fetchall()
-
+            with self._verrou:
+                conn = self.ouvrir(verbose=verbose)
+                cur = conn.cursor()
                 # On compte tous les changements de données (stucture de BDD, insertion de données ou suppression)
                 # on ne peut pas mettre "SELECT" not in sql car en cas de requête imbriquée, elle ne serait pas comptée
-                if "INSERT" in sql or "UPDATE" in sql or "CREATE" in sql or "DROP" in sql or "DELETE" in sql:
-                    self._nb_enregistrement += 1
-                    if self.frequence_backup > 0 and self._nb_enregistrement >= self.frequence_backup :
-                        if self.backup_path is not None:
-                            if self.creer_sauvegarde(self.backup_path, verbose):
-                                self._nb_enregistrement = 0
-                        else:
-                            print("Impossible de sauvegarder, backup_path vide")
-                if verbose:
-                    print(" =>",res)
-            except sqlite3.Error as error:
-                print("SQLite > Erreur exécution SQL", error)
-                raise error
+                ecriture = "INSERT" in sql or "UPDATE" in sql or "CREATE" in sql or "DROP" in sql or "DELETE" in sql
+                # en mode 'groupee', une lecture ne valide pas les écritures en attente
+                # en lecture seule, une lecture ne termine pas la transaction de lecture en cours (soumettre_lecture)
+                groupee = self.durabilite == PiouPiouDao.DURABILITE_GROUPEE or self.lecture_seule
+                metriques = self.metriques
+                try:
+                    if verbose:
+                        print("SQLite DAO >", sql, end="" if len(params) == 0 else f" {tuple(params)}")
+                    if metriques is not None:
+                        debut = time.perf_counter()
+                    if ecriture:
+                        self._debut_ecriture(conn)
+                    cur.execute(sql, params)
+                    if "INSERT" in sql:
+                        res = cur.lastrowid
+                    else:
+                        res = cur.fetchall()
+                    if metriques is not None:
+                        # durée de la requête, hors validation (mesurée à part)
+                        type_requete = PiouPiouDao._type_requete(sql)
+                        metriques.observer("sql_duree_secondes", time.perf_counter() - debut, type=type_requete)
+                        metriques.incrementer("sql_lignes_total", cur.rowcount if ecriture else len(res), type=type_requete)
+                    if ecriture:
+                        self._fin_ecriture(conn)
+                    elif not groupee:
+                        conn.commit()
+
+                    if ecriture:
+                        self._compter_enregistrement(verbose)
+                    if verbose:
+                        print(" =>",res)
+                except sqlite3.Error as error:
+                    print("SQLite > Erreur exécution SQL", error)
+                    if metriques is not None:
+                        metriques.incrementer("sql_erreurs_total", type=PiouPiouDao._type_requete(sql))
+                    if ecriture:
+                        self._annuler_ecriture(conn)
+                    elif not groupee:
+                        conn.rollback()
+                    raise error
         except sqlite3.Error as error:
             print("SQLite > Erreur de connexion à la BDD", error)
             raise error
@@ -455,12 +1847,6 @@ class PiouPiouDao:
                 cur.close()
             except Exception:
                 pass
-            try:
-                if verbose > 1:
-                    print("SQLite > La connexion est fermée")
-                conn.close()
-            except Exception:
-                pass       
         return res
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -477,13 +1863,18 @@ def _remove_file(file_path):
 
 if __name__ == "__main__":
 
+    import json
+    import shutil
+    import weakref
+    from os import listdir
+
     verbose = 1
-    # Récupère le répertoire du programme
-    curent_path = getcwd()+ "\\projet_sql_piou_piou_foil\\"
+    # Répertoire temporaire dédié aux tests (portable Windows / Linux)
+    curent_path = tempfile.mkdtemp(prefix="piou_piou_tests_")
     print(curent_path)
 
-    test_file_bdd = curent_path+'bdd_test.db'
-    test_file_bdd_save = curent_path+"bdd_test_sauvegarde.db"
+    test_file_bdd = path.join(curent_path, 'bdd_test.db')
+    test_file_bdd_save = path.join(curent_path, "bdd_test_sauvegarde.db")
 
     ma_dao = PiouPiouDao(test_file_bdd)
     assert ma_dao.test_connexion(verbose=verbose)
@@ -502,6 +1893,7 @@ if __name__ == "__main__":
     assert ma_dao.creer_sauvegarde(test_file_bdd_save, verbose=verbose)
 
     # suppression du fichier s'il existe déjà (sinon les tests seront failed)
+    ma_dao.fermer()
     _remove_file(test_file_bdd)
       
     ma_dao2 = PiouPiouDao(test_file_bdd, max_mesure_mod=PiouPiouDao.MAX_MESURE_MOD_ALL)
@@ -516,6 +1908,8 @@ if __name__ == "__main__":
     print("liste des tables:",res)
     assert res is not None and len(res)>1
 
+    assert ma_dao2.version_schema(verbose=verbose) == PiouPiouDao.SCHEMA_VERSION
+
     # Création alors que les tables existent déjà
     assert ma_dao2.initialiser_bdd(verbose=verbose)
     res = ma_dao2.liste_tables(verbose=verbose)
@@ -566,35 +1960,416 @@ if __name__ == "__main__":
     assert nb_mesures_334_2 > 0
     assert nb_mesures_334_1 == nb_mesures_334_2
 
-    # Tester la suppression des mesures les plus anciennes
+    # Une mesure déjà en BDD (même station et même date) est ignorée
+    m = mesures_list[0]
+    res = ma_dao2.ajouter_mesure(Mesure(m.date, m.wind_heading+1, m.wind_speed_avg, m.wind_speed_max, m.wind_speed_min, m.station), verbose=verbose)
+    assert res is None and ma_dao2.nb_mesures_inserees == 0
+    assert ma_dao2.nombre_mesures(verbose=verbose) == nb_mesures
+    try:
+        ma_dao2.ajouter_mesure(Mesure(m.date, m.wind_heading, m.wind_speed_avg, m.wind_speed_max, m.wind_speed_min, m.station), verbose=verbose, ignorer_doublons=False)
+        assert False
+    except sqlite3.IntegrityError:
+        assert True
+
+    # Tester la suppression des mesures les plus anciennes (les dates doivent être différentes pour ne pas être des doublons)
     i = 0.5
+    n = 0
     while nb_mesures < 10:
         for m in mesures_list:
-            m2 = Mesure(m.date, m.wind_heading+i, m.wind_speed_avg+i, m.wind_speed_max+i, m.wind_speed_min+i, m.station)
+            n += 1
+            m2 = Mesure(f"2022-01-20 10:{n // 60:02d}:{n % 60:02d}", m.wind_heading+i, m.wind_speed_avg+i, m.wind_speed_max+i, m.wind_speed_min+i, m.station)
             res = ma_dao2.ajouter_mesure(m2, verbose=verbose)
         i += .5
         nb_mesures = ma_dao2.nombre_mesures(verbose=verbose)
 
+    # Tester l'ajout d'un lot de mesures en une seule transaction
+    lot = []
+    for m in mesures_list:
+        n += 1
+        lot.append(Mesure(f"2022-01-20 10:{n // 60:02d}:{n % 60:02d}", m.wind_heading+0.25, m.wind_speed_avg, m.wind_speed_max, m.wind_speed_min, m.station))
+    res = ma_dao2.ajouter_mesures(lot, verbose=verbose)
+    assert len(res) == len(lot) and ma_dao2.nb_mesures_inserees == len(lot)
+    assert res == sorted(res) and res[-1] - res[0] == len(lot) - 1
+    assert lot[-1].id == res[-1]
+    assert ma_dao2.nombre_mesures(verbose=verbose) == 10
+
+    # Un lot contenant des doublons : seules les nouvelles mesures sont insérées
+    n += 1
+    nouvelle = Mesure(f"2022-01-20 10:{n // 60:02d}:{n % 60:02d}", 45.0, 1, 2, 0, lot[0].station)
+    res = ma_dao2.ajouter_mesures([lot[0], nouvelle, lot[1]], verbose=verbose)
+    assert ma_dao2.nb_mesures_inserees == 1
+    assert res[0] is None and res[2] is None and res[1] == nouvelle.id
+
     # Test ajouter mesure en mode par station
     ma_dao2.max_mesure_mode = PiouPiouDao.MAX_MESURE_MOD_STATION
+    assert ma_dao2.nombre_mesures(verbose=verbose) == 10
 
     # Tester la suppression des mesures les plus anciennes
     i = 0.5
     nb_mesures = 0
     while nb_mesures < 10:
         for m in mesures_list:
-            m2 = Mesure(m.date, m.wind_heading+i, m.wind_speed_avg+i, m.wind_speed_max+i, m.wind_speed_min+i, m.station)
+            n += 1
+            m2 = Mesure(f"2022-01-20 10:{n // 60:02d}:{n % 60:02d}", m.wind_heading+i, m.wind_speed_avg+i, m.wind_speed_max+i, m.wind_speed_min+i, m.station)
             res = ma_dao2.ajouter_mesure(m2, verbose=verbose)
         i += .5
         nb_mesures = ma_dao2.nombre_mesures(station=m.station, verbose=verbose)
 
 
+    assert nb_mesures == 10
+    for st in list_stations.values():
+        assert ma_dao2.nombre_mesures(station=st, verbose=verbose) <= 10
+
+    # Lecture incrémentale : uniquement les mesures plus récentes qu'un identifiant
+    mesures_334 = ma_dao2.select_mesures(station=list_stations[334], verbose=verbose)
+    assert all(m.id is not None for m in mesures_334)
+    assert ma_dao2.premier_id_mesure(list_stations[334], verbose=verbose) == mesures_334[0].id
+    res = ma_dao2.select_mesures(station=list_stations[334], after_id=mesures_334[-3].id, verbose=verbose)
+    assert [m.id for m in res] == [m.id for m in mesures_334[-2:]]
+
+    # Cache des dernières mesures : une mesure déjà connue est écartée sans requête
+    derniere = mesures_334[-1]
+    assert ma_dao2.cache_mesures.derniere(334)[0] == derniere.timestamp
+    nb_avant = ma_dao2.nombre_mesures(verbose=verbose)
+    inconnue = Mesure("2023-01-01 00:00:00", 0, 1, 2, 0, list_stations[334])
+    assert ma_dao2.cache_mesures.filtrer([Mesure(derniere.date, 0, 1, 2, 0, list_stations[334]), inconnue, inconnue]) == [inconnue]
+    ma_dao2.cache_mesures.charger([])
+    assert ma_dao2.cache_mesures.derniere(334) is None
+    ma_dao2.charger_cache_mesures(verbose=verbose)
+    assert ma_dao2.cache_mesures.derniere(list_stations[334])[0] == derniere.timestamp
+    assert ma_dao2.nombre_mesures(verbose=verbose) == nb_avant
+    # une mesure sans date (mesure_ts NULL) n'entre pas dans le cache et ne bloque pas les mises à jour suivantes
+    ma_dao2.cache_mesures.charger([(999, None, 0, 1, 2, 0)])
+    ma_dao2.cache_mesures.mettre_a_jour(Mesure(None, 0, 1, 2, 0, Station(999, "Sans date")))
+    ma_dao2.cache_mesures.mettre_a_jour(inconnue, mesure_ts=None)
+    ma_dao2.cache_mesures.mettre_a_jour(Mesure("2023-01-01 00:00:00", 0, 1, 2, 0, Station(999, "Sans date")))
+    assert ma_dao2.cache_mesures.derniere(999)[0] == inconnue.timestamp
+    ma_dao2.charger_cache_mesures(verbose=verbose)
+    assert all(ligne[1] is not None for ligne in ma_dao2.cache_mesures.lignes())
+
+    # Parcours par lots et pagination
+    assert [m.id for m in ma_dao2.iterer_mesures(station=list_stations[334], taille_lot=2, verbose=verbose)] == [m.id for m in mesures_334]
+    toutes = sorted(ma_dao2.mesures(verbose=verbose), key=lambda m: m.id)
+    parcours = list(ma_dao2.iterer_mesures(taille_lot=3, verbose=verbose))
+    assert [m.id for m in parcours] == [m.id for m in toutes] and all(m.station is not None for m in parcours)
+    assert [m.id for m in ma_dao2.iterer_mesures(after_id=toutes[1].id, limit=4, taille_lot=3, verbose=verbose)] == [m.id for m in toutes[2:6]]
+    page_1 = ma_dao2.select_mesures(station=list_stations[334], limit=2, verbose=verbose)
+    page_2 = ma_dao2.select_mesures(station=list_stations[334], after_id=page_1[-1].id, limit=2, verbose=verbose)
+    assert [m.id for m in page_1 + page_2] == [m.id for m in mesures_334[:4]]
+    # pagination toutes stations confondues : aucune mesure sautée
+    pages, page = [], ma_dao2.select_mesures(limit=3, verbose=verbose)
+    while len(page) > 0:
+        pages += page
+        page = ma_dao2.select_mesures(after_id=page[-1].id, limit=3, verbose=verbose)
+    assert [m.id for m in pages] == [m.id for m in toutes]
+    try:
+        next(ma_dao2.iterer_mesures(taille_lot=0))
+        assert False, "ValueError attendue"
+    except ValueError:
+        pass
+
+    # Recherche par date (quel que soit son format) et par période
+    derniere = mesures_334[-1]
+    assert [m.id for m in ma_dao2.select_mesures(mesure_date=derniere.date.replace(" ", "T") + "Z", verbose=verbose)] == [derniere.id]
+    assert ma_dao2.ajouter_mesures([Mesure(derniere.date.replace(" ", "T") + ".000Z", 0, 1, 2, 0, list_stations[334])], verbose=verbose) == [None]
+    res = ma_dao2.select_mesures(station=list_stations[334], since=mesures_334[-3].date, until=derniere.timestamp, verbose=verbose)
+    assert [m.id for m in res] == [m.id for m in mesures_334[-3:-1]]
+
+    # Statistiques de vent
+    if np is not None:
+        stats = ma_dao2.statistiques_vent(list_stations[334], since="2022-01-20 00:00:00", verbose=verbose)
+        assert stats["nb_mesures"] == len(ma_dao2.select_mesures(station=list_stations[334], verbose=verbose))
+        assert stats["rose_des_vents"].sum() == stats["nb_mesures"] and len(stats["rose_des_vents"]) == 16
+        assert stats["distribution_vitesse"].sum() == stats["nb_mesures"]
+        assert stats["facteur_rafale"] >= 1
+        assert stats["direction_moyenne"] is not None and 0 <= stats["direction_moyenne"] < 360
+        stats_stations = ma_dao2.statistiques_vent(until=datetime(2030, 1, 1), nb_secteurs=4, verbose=verbose)
+        assert 334 in stats_stations and set(stats_stations.keys()) <= {116, 194, 334}
+        assert stats_stations[334]["nb_mesures"] == stats["nb_mesures"]
+        # moyenne circulaire : 350° et 10° => Nord
+        res = PiouPiouDao._calculer_statistiques_vent(np.array([350.0, 10.0]), np.array([10.0, 20.0]), np.array([15.0, 30.0]))
+        assert abs((res["direction_moyenne"] + 180) % 360 - 180) < 1e-6
+        assert res["rose_des_vents"][0] == 2 and res["facteur_rafale"] == 1.5
+
+    # La station de chaque mesure est renseignée, même sans filtre sur la station
+    toutes = ma_dao2.mesures(verbose=verbose)
+    assert all(m.station is not None for m in toutes)
+    assert [m.id for m in toutes if m.station.id == 334] == [m.id for m in mesures_334]
+
+    # Export en colonnes
+    if np is not None:
+        colonnes = ma_dao2.mesures_colonnes(verbose=verbose)
+        assert sum(len(tableau) for tableau in colonnes.values()) == len(toutes)
+        assert list(colonnes[334]["id"]) == [m.id for m in mesures_334]
+        assert list(colonnes[334]["wind_speed_max"]) == [m.wind_speed_max for m in mesures_334]
+        assert list(ma_dao2.mesures_colonnes(station=334, verbose=verbose).keys()) == [334]
+        assert list(colonnes[334]["mesure_ts"]) == [m.timestamp for m in mesures_334]
+        # les mesures sans station sont ignorées
+        ma_dao2._executer_sql("INSERT INTO mesure (mesure_date, mesure_ts, wind_heading, station) VALUES ('2022-01-01T12:00:00.123456+02:00', 1641031200, 1.0, NULL);", verbose=verbose)
+        assert sum(len(tableau) for tableau in ma_dao2.mesures_colonnes(verbose=verbose).values()) == len(toutes)
+        ma_dao2._executer_sql("DELETE FROM mesure WHERE station IS NULL;", verbose=verbose)
+
+    # Diminution du maximum : suppression en une passe, puis maintien par le trigger
+    ma_dao2.max_mesure = 3
+    for st in list_stations.values():
+        assert ma_dao2.nombre_mesures(station=st, verbose=verbose) <= 3
+    res = ma_dao2.ajouter_mesure(Mesure("2022-01-19 08:00:00", 90.0, 1, 2, 0, list_stations[334]), verbose=verbose)
+    assert ma_dao2.nombre_mesures(station=334, verbose=verbose) == 3
+    assert ma_dao2.select_mesures(station=list_stations[334], verbose=verbose)[-1].date == "2022-01-19 08:00:00"
+    # les mesures supprimées par la rétention pendant le lot n'ont pas d'identifiant
+    lot = [Mesure(f"2022-01-19 09:{n:02d}:00", 90.0, 1, 2, 0, list_stations[334]) for n in range(10)]
+    ids = ma_dao2.ajouter_mesures(lot + [Mesure(lot[-1].date, 90.0, 1, 2, 0, list_stations[334])], verbose=verbose)
+    assert ids[:7] == [None] * 7 and ids[-1] is None and ma_dao2.nb_mesures_inserees == 10
+    assert ids[7:10] == [m.id for m in ma_dao2.select_mesures(station=list_stations[334], verbose=verbose)]
+    assert [m.id for m in lot[:7]] == [None] * 7
+
+    # Sauvegarde en arrière-plan
+    ma_dao2.attendre_sauvegarde()
+    assert ma_dao2.lancer_sauvegarde(test_file_bdd_save, verbose=verbose)
+    assert ma_dao2.attendre_sauvegarde(timeout=10)
+    etat = ma_dao2.etat_sauvegarde()
+    assert etat["succes"] and not etat["en_cours"] and etat["duree"] is not None
+    assert etat["fichier"] == test_file_bdd_save and path.exists(test_file_bdd_save)
+    # sauvegardes simultanées vers le même fichier : chacune son fichier temporaire, aucun ne reste
+    sauvegardes = [threading.Thread(target=ma_dao2._sauvegarder_par_etapes, args=(test_file_bdd_save,)) for _ in range(4)]
+    for sauvegarde in sauvegardes:
+        sauvegarde.start()
+    for sauvegarde in sauvegardes:
+        sauvegarde.join()
+    assert ma_dao2.etat_sauvegarde()["succes"]
+    lecteur = sqlite3.connect(test_file_bdd_save)
+    assert lecteur.execute("SELECT count(*) FROM mesure;").fetchone()[0] == ma_dao2.nombre_mesures(verbose=verbose)
+    lecteur.close()
+    ma_dao2._sauvegarder_par_etapes(path.join(curent_path, "absent", "sauvegarde.db"))
+    assert not ma_dao2.etat_sauvegarde()["succes"]
+    assert not any(nom.endswith(".tmp") for nom in listdir(curent_path))
+
+    ma_dao2.fermer()
+    assert not ma_dao2.est_ouverte()
+
+    # Contexte : ouverture et fermeture automatique de la connexion
+    with PiouPiouDao(test_file_bdd) as ma_dao3:
+        assert ma_dao3.est_ouverte()
+        assert ma_dao3.nombre_stations(verbose=verbose) == 3
+    assert not ma_dao3.est_ouverte()
+
+    # Migration d'une BDD créée avant le versionnement du schéma
+    _remove_file(test_file_bdd)
+    conn = sqlite3.connect(test_file_bdd)
+    conn.execute("CREATE TABLE station (id INTEGER PRIMARY KEY, station_name TEXT NOT NULL, latitude REAL, longitude REAL);")
+    conn.execute("CREATE TABLE mesure (id INTEGER PRIMARY KEY AUTOINCREMENT, mesure_date TEXT NOT NULL, wind_heading REAL, wind_speed_avg REAL, wind_speed_max REAL, wind_speed_min REAL, station INTEGER, FOREIGN KEY(station) references station(id));")
+    conn.executemany("INSERT INTO mesure (mesure_date, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min, station) VALUES (?, 0, 1, 2, 0, ?);",
+                     [(f"2022-01-17 15:{i:02d}:00", 334) for i in [0, 1, 2, 3, 0]] + [("2022-01-17T15:01:00.000Z", 334)])
+    conn.commit()
+    conn.close()
+    with PiouPiouDao(test_file_bdd) as ma_dao4:
+        assert ma_dao4.version_schema(verbose=verbose) == 0
+        assert ma_dao4.initialiser_bdd(verbose=verbose)
+        assert ma_dao4.version_schema(verbose=verbose) == PiouPiouDao.SCHEMA_VERSION
+        assert ma_dao4.nombre_mesures(station=334, verbose=verbose) == 4
+        index = [row[0] for row in ma_dao4._executer_sql("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='mesure';")]
+        assert "idx_mesure_station_id" in index and "uq_mesure_station_ts" in index and "uq_mesure_station_date" not in index
+        # la même date au format ISO 'Z' est un doublon, les timestamps sont renseignés
+        assert ma_dao4._executer_sql("SELECT mesure_ts FROM mesure ORDER BY id;") == [(1642431600 + 60 * i,) for i in range(4)]
+        assert len(ma_dao4.select_mesures(since="2022-01-17T15:01:00Z", until=datetime(2022, 1, 17, 15, 3), verbose=verbose)) == 2
+        ma_dao4.max_mesure = 2
+        assert ma_dao4.nombre_mesures(station=334, verbose=verbose) == 2
+
+    # Durabilité : journal WAL et validation groupée des écritures
+    _remove_file(test_file_bdd)
+    with PiouPiouDao(test_file_bdd, durabilite=PiouPiouDao.DURABILITE_GROUPEE, delai_validation=None, frequence_backup=0) as ma_dao5:
+        assert ma_dao5.initialiser_bdd(verbose=verbose)
+        assert ma_dao5._executer_sql("PRAGMA journal_mode;") == [("wal",)]
+        ma_dao5.ajouter_station(list_stations[334], verbose=verbose)
+        station_334 = ma_dao5.stations(verbose=verbose)[0]
+        ma_dao5.ajouter_mesures([Mesure(f"2022-01-20 11:00:{n:02d}", 0, 1, 2, 0, station_334) for n in range(3)], verbose=verbose)
+        # une autre connexion ne voit que les écritures validées
+        lecteur = sqlite3.connect(test_file_bdd)
+        assert lecteur.execute("SELECT count(*) FROM mesure;").fetchone()[0] == 0
+        # une écriture en erreur est annulée seule, les écritures en attente sont conservées
+        try:
+            ma_dao5.ajouter_mesures([Mesure("2022-01-20 11:00:00", 0, 1, 2, 0, station_334)], verbose=verbose, ignorer_doublons=False)
+            assert False, "IntegrityError attendue"
+        except sqlite3.IntegrityError:
+            pass
+        assert ma_dao5.valider(verbose=verbose)
+        assert not ma_dao5.valider(verbose=verbose)
+        assert lecteur.execute("SELECT count(*) FROM mesure;").fetchone()[0] == 3
+        # validation automatique après delai_validation ms
+        ma_dao5.delai_validation = 20
+        ma_dao5.ajouter_mesures([Mesure("2022-01-20 11:01:00", 0, 1, 2, 0, station_334)], verbose=verbose)
+        time.sleep(0.5)
+        assert lecteur.execute("SELECT count(*) FROM mesure;").fetchone()[0] == 4
+        lecteur.close()
+
+        # DAO en lecture seule : les lectures ne bloquent pas l'écriture et ne sont pas bloquées par elle
+        ma_dao5.delai_validation = None
+        with PiouPiouDao(test_file_bdd, lecture_seule=True, nb_lecteurs=2) as ma_dao_lecture:
+            ma_dao5.ajouter_mesures([Mesure("2022-01-20 11:02:00", 0, 1, 2, 0, station_334)], verbose=verbose)
+            # écriture en attente de validation : les lectures voient le dernier état validé, sans attendre
+            assert ma_dao_lecture.soumettre_lecture(ma_dao_lecture.nombre_mesures).result(timeout=5) == 4
+            # une lecture en cours (instantané) n'empêche pas la validation des écritures
+            ecriture_validee = threading.Event()
+            def _lire_pendant_ecriture():
+                avant = ma_dao_lecture.nombre_mesures()
+                ecriture_validee.wait(timeout=5)
+                return avant, ma_dao_lecture.nombre_mesures(), len(ma_dao_lecture.mesures())
+            lecture = ma_dao_lecture.soumettre_lecture(_lire_pendant_ecriture)
+            time.sleep(0.1)
+            assert ma_dao5.valider(verbose=verbose)
+            ecriture_validee.set()
+            assert lecture.result(timeout=5) == (4, 4, 4)
+            assert ma_dao_lecture.soumettre_lecture(ma_dao_lecture.nombre_mesures).result(timeout=5) == 5
+            lectures = [ma_dao_lecture.soumettre_lecture(ma_dao_lecture.select_mesures, station=station_334) for _ in range(4)]
+            assert all(len(lecture.result(timeout=5)) == 5 for lecture in lectures)
+            try:
+                ma_dao_lecture.ajouter_station(Station(1, "Lecture seule", 47.0, -2.0))
+                assert False, "OperationalError attendue"
+            except sqlite3.OperationalError:
+                pass
+        assert not ma_dao_lecture.est_ouverte()
+        try:
+            ma_dao5.soumettre_lecture(ma_dao5.nombre_mesures)
+            assert False, "ValueError attendue"
+        except ValueError:
+            pass
+    # la durabilité complète quitte le mode WAL enregistré dans le fichier
+    with PiouPiouDao(test_file_bdd, frequence_backup=0) as ma_dao5:
+        assert ma_dao5._executer_sql("PRAGMA journal_mode;") == [("delete",)]
+        assert ma_dao5.nombre_mesures(verbose=verbose) == 5
+    try:
+        PiouPiouDao(test_file_bdd, durabilite="rapide")
+        assert False, "ValueError attendue"
+    except ValueError:
+        pass
+
+    # Requêtes paramétrées : apostrophes et coordonnées inconnues, une seule forme de requête par combinaison de critères
+    _remove_file(test_file_bdd)
+    with PiouPiouDao(test_file_bdd, frequence_backup=0) as ma_dao7:
+        assert ma_dao7.initialiser_bdd(verbose=verbose)
+        assert ma_dao7.ajouter_station(Station(85, "L'Île-d'Olonne"), verbose=verbose) == 85
+        station_85 = ma_dao7.stations(verbose=verbose)[0]
+        assert station_85.name == "L'Île-d'Olonne" and station_85.latitude is None and station_85.longitude is None
+        ma_dao7.ajouter_mesures([Mesure(f"2022-01-20 11:00:{n:02d}", 0, 1, 2, 0, station_85) for n in range(3)], verbose=verbose)
+        assert ma_dao7.nombre_mesures(85, verbose=verbose) == 3
+        res = ma_dao7.select_mesures(station=station_85, since="2022-01-20 11:00:01", limit=1, verbose=verbose)
+        assert [mesure.date for mesure in res] == ["2022-01-20 11:00:01"]
+        assert len(ma_dao7.mesures(station_85, verbose=verbose)) == 3
+        assert [mesure.date for mesure in ma_dao7.iterer_mesures(station_85, taille_lot=2, verbose=verbose)] == [f"2022-01-20 11:00:{n:02d}" for n in range(3)]
+        # le texte de la clause ne dépend pas des valeurs des critères
+        assert ma_dao7._where_mesures(station=station_85, since=0) == ("WHERE station = ? AND mesure_ts >= ? ", [85, 0])
+        assert ma_dao7._where_mesures(station=station_85, since=10)[0] == ma_dao7._where_mesures(station=station_85, since=0)[0]
+        assert ma_dao7._where_mesures() == ("", [])
+        assert ma_dao7._where_mesures(station=85, until=0) == ma_dao7._where_mesures(station=station_85, until=0)
+
+    # Démarrage rapide : l'instantané est repris tant que la BDD n'a pas changé
+    with PiouPiouDao(test_file_bdd, frequence_backup=0) as ma_dao8:
+        assert ma_dao8.initialiser_bdd(verbose=verbose)
+        instantane = json.loads(json.dumps(ma_dao8.instantane(verbose=verbose)))
+    print(instantane)
+    assert instantane["empreinte"]["schema"] == PiouPiouDao.SCHEMA_VERSION and instantane["empreinte"]["nb_mesures"] == 3
+    assert len(instantane["dernieres_mesures"]) == 1
+    with PiouPiouDao(test_file_bdd, frequence_backup=0) as ma_dao8:
+        assert ma_dao8.reprendre_instantane(instantane, verbose=verbose)
+        assert ma_dao8._retention_initialisee and ma_dao8.cache_mesures.derniere(85) is not None
+        station_85 = ma_dao8.stations(verbose=verbose)[0]
+        # mesure déjà en BDD : écartée par le cache repris de l'instantané
+        ma_dao8.ajouter_mesures([Mesure("2022-01-20 11:00:02", 0, 1, 2, 0, station_85)], verbose=verbose)
+        assert ma_dao8.nb_mesures_inserees == 0
+        ma_dao8.ajouter_mesures([Mesure("2022-01-20 11:00:03", 0, 1, 2, 0, station_85)], verbose=verbose)
+        assert ma_dao8.nb_mesures_inserees == 1
+        # la BDD a changé : l'instantané est périmé
+        assert not ma_dao8.reprendre_instantane(instantane, verbose=verbose)
+        instantane = ma_dao8.instantane(verbose=verbose)
+    # paramètres de rétention différents : la rétention doit être appliquée par initialiser_bdd
+    with PiouPiouDao(test_file_bdd, max_mesure=2) as ma_dao8:
+        assert not ma_dao8.reprendre_instantane(instantane, verbose=verbose)
+    # instantané incomplet
+    with PiouPiouDao(test_file_bdd) as ma_dao8:
+        assert not ma_dao8.reprendre_instantane({"empreinte": instantane["empreinte"]}, verbose=verbose)
+        assert ma_dao8.reprendre_instantane(instantane, verbose=verbose)
+    _remove_file(test_file_bdd_save)
+    with PiouPiouDao(test_file_bdd_save) as ma_dao8:
+        assert ma_dao8.empreinte(verbose=verbose) is None
+
+    # Métriques : histogrammes de durées, compteurs et export Prometheus
+    metriques = Metriques(bornes=(0.001, 0.01))
+    metriques.observer("test_duree_secondes", 0.0005, type="A")
+    metriques.observer("test_duree_secondes", 0.005, type="A")
+    metriques.observer("test_duree_secondes", 1, type="A")
+    metriques.incrementer("test_total", 3, type='B"1')
+    res = metriques.stats()
+    assert res["histogrammes"]["test_duree_secondes"]["type=A"]["buckets"] == {0.001: 1, 0.01: 2, float("inf"): 3}
+    assert res["histogrammes"]["test_duree_secondes"]["type=A"]["nb"] == 3
+    assert res["histogrammes"]["test_duree_secondes"]["type=A"]["max"] == 1
+    assert res["compteurs"]["test_total"]['type=B"1'] == 3
+    texte = metriques.texte_prometheus()
+    print(texte)
+    assert '# TYPE piou_piou_test_duree_secondes histogram' in texte
+    assert 'piou_piou_test_duree_secondes_bucket{type="A",le="+Inf"} 3' in texte
+    assert 'piou_piou_test_total{type="B\\"1"} 3' in texte
+    metriques.reinitialiser()
+    assert metriques.stats() == {"compteurs": {}, "histogrammes": {}}
+    assert not metriques.publier()
+
+    _remove_file(test_file_bdd)
+    fichier_prometheus = path.join(curent_path, "bdd_test.prom")
+    metriques = Metriques(fichier_prometheus=fichier_prometheus, intervalle_prometheus=3600)
+    with PiouPiouDao(test_file_bdd, frequence_backup=0, metriques=metriques) as ma_dao6:
+        assert ma_dao6.initialiser_bdd(verbose=verbose)
+        ma_dao6.ajouter_station(list_stations[334], verbose=verbose)
+        station_334 = ma_dao6.stations(verbose=verbose)[0]
+        ma_dao6.ajouter_mesures([Mesure(f"2022-01-20 11:00:{n:02d}", 0, 1, 2, 0, station_334) for n in range(3)], verbose=verbose)
+        assert len(ma_dao6.select_mesures(station=station_334, verbose=verbose)) == 3
+        assert ma_dao6.creer_sauvegarde(test_file_bdd_save, verbose=verbose)
+        res = ma_dao6.stats()
+        print(res)
+        assert res["cache_mesures"] == 1
+        assert res["metriques"]["histogrammes"]["sql_duree_secondes"]["type=SELECT"]["nb"] > 0
+        assert res["metriques"]["compteurs"]["sql_lignes_total"]["type=INSERT_LOT"] == 3
+        assert res["metriques"]["compteurs"]["sql_validations_total"][""] > 0
+        assert res["metriques"]["histogrammes"]["sauvegarde_duree_secondes"]["mode=complete"]["nb"] == 1
+        try:
+            ma_dao6._executer_sql("SELECT * FROM table_inconnue;")
+            assert False, "OperationalError attendue"
+        except sqlite3.OperationalError:
+            pass
+        assert ma_dao6.stats()["metriques"]["compteurs"]["sql_erreurs_total"]["type=SELECT"] == 1
+        # le fichier est écrit à la première validation, puis au plus toutes les intervalle_prometheus secondes
+        assert path.exists(fichier_prometheus)
+    # et à la fermeture de la DAO
+    with open(fichier_prometheus, encoding="utf-8") as fichier:
+        texte = fichier.read()
+    assert 'piou_piou_sql_erreurs_total{type="SELECT"} 1' in texte
+    assert 'piou_piou_sauvegarde_duree_secondes_count{mode="complete"} 1' in texte
+    # écritures simultanées : chacune son fichier temporaire, aucun ne reste
+    ecritures = [threading.Thread(target=metriques.ecrire_prometheus) for _ in range(8)]
+    for ecriture in ecritures:
+        ecriture.start()
+    for ecriture in ecritures:
+        ecriture.join()
+    assert not any(nom.endswith(".tmp") for nom in listdir(curent_path))
+    with open(fichier_prometheus, encoding="utf-8") as fichier:
+        assert fichier.read() == metriques.texte_prometheus()
+    # une DAO fermée n'est plus retenue par atexit
+    ma_dao6 = PiouPiouDao(test_file_bdd, frequence_backup=0)
+    ma_dao6.ouvrir()
+    reference_dao6 = weakref.ref(ma_dao6)
+    ma_dao6.fermer()
+    del ma_dao6
+    assert reference_dao6() is None
+    # sans métriques, la DAO ne mesure rien
+    assert PiouPiouDao(test_file_bdd).stats()["metriques"] is None
+
     # Suppression des fichiers de tests
     _remove_file(test_file_bdd)
     _remove_file(test_file_bdd.replace(".db", ".backup.db"))
     _remove_file(test_file_bdd_save)
+    _remove_file(test_file_bdd + "-wal")
+    _remove_file(test_file_bdd + "-shm")
 
     
 
 
   
+    shutil.rmtree(curent_path, ignore_errors=True)
@@ -1,6 +1,100 @@
+from bisect import bisect_left, insort
+from collections import deque
+from collections.abc import Sequence
+from datetime import datetime, timezone
+from math import asin, cos, floor, radians, sin, sqrt
+from types import MappingProxyType
+
+# Rayon moyen de la Terre, en km
+RAYON_TERRE_KM = 6371.0088
+# Distance d'un degré de latitude, en km
+KM_PAR_DEGRE = 111.195
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    """Distance orthodromique (formule de haversine) entre deux points
+
+    Args:
+        latitude1 (float): latitude du 1er point, en degrés
+        longitude1 (float): longitude du 1er point, en degrés
+        latitude2 (float): latitude du 2nd point, en degrés
+        longitude2 (float): longitude du 2nd point, en degrés
+
+    Returns:
+        float: distance en km
+    """
+    d_lat = radians(latitude2 - latitude1)
+    d_lon = radians(longitude2 - longitude1)
+    a = sin(d_lat / 2) ** 2 + cos(radians(latitude1)) * cos(radians(latitude2)) * sin(d_lon / 2) ** 2
+    return 2 * RAYON_TERRE_KM * asin(min(1.0, sqrt(a)))
+
+
+def date_vers_epoch(date):
+    """Convertit une date en timestamp epoch (nombre de secondes depuis le 01/01/1970 UTC)
+
+    Args:
+        date (str/datetime/int): date ISO 8601 ("2022-01-17T15:23:40.000Z", "2022-01-17 15:23:40"...) ou timestamp,
+                                 une date sans fuseau horaire est en UTC
+
+    Raises:
+        ValueError: Si la date n'est pas lisible
+
+    Returns:
+        int: timestamp epoch, en secondes
+    """
+    if isinstance(date, (int, float)) and not isinstance(date, bool):
+        return int(date)
+    if isinstance(date, str):
+        texte = date.strip()
+        # fromisoformat ne gère le suffixe Z qu'à partir de Python 3.11
+        if texte[-1:] in ("Z", "z"):
+            texte = texte[:-1] + "+00:00"
+        date = datetime.fromisoformat(texte)
+    if not isinstance(date, datetime):
+        raise ValueError(f"Date attendue et non {date}")
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp())
+
+
+class VueMesures(Sequence):
+    """Vue en lecture seule, sans copie, des mesures d'une station.
+    La vue reflète l'état courant de la station : list(vue) pour figer les mesures.
+    """
+    __slots__ = ("_mesures",)
+
+    def __init__(self, mesures):
+        self._mesures = mesures
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._mesures[i] for i in range(len(self._mesures))[index]]
+        return self._mesures[index]
+
+    def __len__(self):
+        return len(self._mesures)
+
+    def __iter__(self):
+        return iter(self._mesures)
+
+    def __reversed__(self):
+        return reversed(self._mesures)
+
+    def __eq__(self, other):
+        if isinstance(other, (VueMesures, list)):
+            return list(self._mesures) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self._mesures))
+
+
 class Station:
     """Représente une station PiouPiou
     """
+    # Pas de __dict__ par instance : moins de mémoire lorsque de nombreuses stations sont suivies
+    __slots__ = ("id", "name", "latitude", "longitude", "_mesures", "_max_mesure", "_vue_mesures")
+
     # verbose (bool/int, optional): Niveau de détail pour les traces. Defaults to False.
     verbose = False
 
@@ -17,8 +111,10 @@ class Station:
         self.name = name
         self.latitude = latitude
         self.longitude = longitude
-        self._mesures = []
         self._max_mesure = max_mesure
+        # Avec un maximum, la mesure la plus ancienne est retirée automatiquement (en O(1)) lors de l'ajout
+        self._mesures = deque(maxlen=max_mesure if max_mesure > 0 else None)
+        self._vue_mesures = VueMesures(self._mesures)
 
     def ajouter_mesure(self, nouvelle_mesure=None, date=None, wind_heading=None, wind_speed_avg=None, wind_speed_max=None, wind_speed_min=None):
         """Créé et ajoute la mesure (si différente de la dernière mesure enregistrée)
@@ -49,22 +145,75 @@ class Station:
     def nb_mesures(self):
         return len(self._mesures)
 
+    def iter_mesures(self):
+        """
+        Returns:
+            Iterator[Mesure]: itérateur sur les mesures, de la plus ancienne à la plus récente
+        """
+        return iter(self._mesures)
+
+    def derniere_mesure(self):
+        """
+        Returns:
+            Mesure: la mesure la plus récente, None si la station n'a pas de mesure
+        """
+        if len(self._mesures) > 0:
+            return self._mesures[-1]
+        return None
+
+    def dernier_id_mesure(self):
+        """
+        Returns:
+            int: identifiant (en BDD) de la mesure enregistrée la plus récente, None si aucune mesure n'est enregistrée
+        """
+        for mesure in reversed(self._mesures):
+            if mesure.id is not None:
+                return mesure.id
+        return None
+
+    def retirer_mesures(self, id_min=None, non_enregistrees=False):
+        """Retire les mesures qui ne sont plus en BDD
+
+        Args:
+            id_min (int, optional): les mesures d'identifiant inférieur sont retirées (supprimées en BDD par la rétention). Defaults to None.
+            non_enregistrees (bool, optional): True pour retirer aussi les mesures sans identifiant (non enregistrées en BDD). Defaults to False.
+
+        Returns:
+            int: nombre de mesures retirées
+        """
+        nb_avant = len(self._mesures)
+        if non_enregistrees and any(mesure.id is None for mesure in self._mesures):
+            # modification sur place, pour que les vues sur les mesures restent valides
+            enregistrees = [mesure for mesure in self._mesures if mesure.id is not None]
+            self._mesures.clear()
+            self._mesures.extend(enregistrees)
+        # Les mesures supprimées par la rétention sont les plus anciennes, donc en tête
+        if id_min is not None:
+            while len(self._mesures) > 0 and self._mesures[0].id is not None and self._mesures[0].id < id_min:
+                self._mesures.popleft()
+        return nb_avant - len(self._mesures)
+
     @property
     def mesures(self):
-        return self._mesures.copy()
+        """
+        Returns:
+            VueMesures: vue en lecture seule (sans copie) des mesures
+        """
+        return self._vue_mesures
 
     @mesures.setter
     def mesures(self, mesures):
-        if isinstance(mesures, list):
-            self._mesures = []
+        if isinstance(mesures, (list, VueMesures)):
+            # copie préalable : la liste reçue peut être la vue des mesures de cette station
+            mesures = list(mesures)
+            self._mesures.clear()
             for mesure in mesures:
                 self.mesures =  mesure 
         elif isinstance(mesures, Mesure):
             # Pour limiter le nombre d'enregistrements
             # Vérification que la dernière mesure identique (même si l'heure est différente)
             if len(self._mesures) > 0 and self._mesures[-1] != mesures:
-                if self._max_mesure > 0 and len(self._mesures) == self._max_mesure:
-                        del self._mesures[0]
+                # Au-delà de _max_mesure, la deque retire la mesure la plus ancienne
                 self._mesures.append(mesures)
             elif len(self._mesures) == 0:
                 self._mesures.append(mesures)
@@ -88,6 +237,8 @@ class Station:
     
 
 class Mesure:
+    __slots__ = ("date", "wind_heading", "wind_speed_avg", "wind_speed_max", "wind_speed_min", "_station", "id")
+
     def __init__(self, date, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min, station, id=None):
         """
         Args:
@@ -112,6 +263,16 @@ class Mesure:
     def station(self):
         return self._station
 
+    @property
+    def timestamp(self):
+        """
+        Returns:
+            int: date de la mesure en timestamp epoch (secondes UTC), None si la date est vide
+        """
+        if self.date is None:
+            return None
+        return date_vers_epoch(self.date)
+
     @station.setter
     def station(self, station):
         if isinstance(station, Station):
@@ -206,28 +367,46 @@ class Mesure:
 
 
 class GestionnaireDeStations:
-    """Contient la liste des stations à surveiller
+    """Contient la liste des stations à surveiller.
+    Les stations sont indexées par nom (recherche exacte ou par préfixe, sans tenir compte de la casse)
+    et par position (grille de TAILLE_CELLULE degrés) pour les recherches de proximité.
     """
+    __slots__ = ("_stations", "_vue_stations", "_noms", "_noms_tries", "_grille")
+
+    # Taille en degrés d'une cellule de la grille de l'index géographique
+    TAILLE_CELLULE = 0.5
 
     def __init__(self, stations=None):
         self._stations = {}
+        self._vue_stations = MappingProxyType(self._stations)
+        # nom en minuscules => identifiants des stations
+        self._noms = {}
+        # (nom en minuscules, identifiant) triés, pour la recherche par préfixe
+        self._noms_tries = []
+        # (ligne, colonne) de la cellule => identifiants des stations
+        self._grille = {}
         if stations is not None:
             self.stations = stations
 
     @property
     def stations(self):
-        return self._stations.copy()
+        """
+        Returns:
+            MappingProxyType: vue en lecture seule (sans copie) des stations, par identifiant
+        """
+        return self._vue_stations
 
     @stations.setter
     def stations(self, stations):
-        if self._stations is None:
-            self._stations = {}
         if isinstance(stations, Station):
+            if stations.id in self._stations:
+                self._desindexer(self._stations[stations.id])
             self._stations[stations.id] = stations
+            self._indexer(stations)
         elif isinstance(stations, list):
             for st in stations:
                 self.stations = st
-        elif isinstance(stations, dict):
+        elif isinstance(stations, (dict, MappingProxyType)):
             for st in stations.values():
                 self.stations = st
         else:
@@ -237,15 +416,244 @@ class GestionnaireDeStations:
         # Recherche par ID
         if station is not None and isinstance(station, int):
             return self._stations.get(station, None)
-        # Recherche par le nom, on parcours la liste des stations
+        # Recherche par le nom : nom exact puis préfixe (index), sinon on parcours la liste des stations
         elif station is not None and isinstance(station, str):
+            ids = self._noms.get(station.casefold())
+            if ids:
+                return self._stations[ids[0]]
+            par_prefixe = self.stations_par_prefixe(station, limite=1)
+            if len(par_prefixe) > 0:
+                return par_prefixe[0]
             for st in self._stations.values():
                 if station in st.name:
                     return st
             return None
         # Sans critère on retourne la liste des stations
         else:
-            return self._stations.copy()
+            return self._vue_stations
+
+    def iter_stations(self):
+        """
+        Returns:
+            Iterator[Station]: itérateur sur les stations
+        """
+        return iter(self._stations.values())
+
+    def stations_par_prefixe(self, prefixe, limite=None):
+        """Recherche les stations dont le nom commence par le préfixe, sans tenir compte de la casse
+
+        Args:
+            prefixe (str): début du nom
+            limite (int, optional): nombre maximum de stations retournées. Defaults to None.
+
+        Returns:
+            List[Station]: stations trouvées, par ordre alphabétique
+        """
+        prefixe = prefixe.casefold()
+        res = []
+        i = bisect_left(self._noms_tries, (prefixe,))
+        while i < len(self._noms_tries) and self._noms_tries[i][0].startswith(prefixe):
+            if limite is not None and len(res) >= limite:
+                break
+            res.append(self._stations[self._noms_tries[i][1]])
+            i += 1
+        return res
+
+    def stations_dans_rayon(self, latitude, longitude, rayon_km):
+        """Recherche les stations situées à moins de rayon_km du point, seules les cellules de la grille proches sont parcourues
+
+        Args:
+            latitude (float): latitude du point, en degrés
+            longitude (float): longitude du point, en degrés
+            rayon_km (float): rayon de recherche, en km
+
+        Returns:
+            List[(Station, float)]: stations et distance en km, de la plus proche à la plus éloignée
+        """
+        taille = GestionnaireDeStations.TAILLE_CELLULE
+        nb_colonnes = GestionnaireDeStations._nb_colonnes()
+        delta_lat = rayon_km / KM_PAR_DEGRE
+        # un degré de longitude est plus court loin de l'équateur
+        cos_lat = max(cos(radians(min(90.0, abs(latitude) + delta_lat))), 1e-6)
+        delta_lon = min(180.0, rayon_km / (KM_PAR_DEGRE * cos_lat))
+        colonne_min = floor((longitude - delta_lon) / taille)
+        colonne_max = floor((longitude + delta_lon) / taille)
+        # les colonnes sont parcourues modulo 360° : les stations de l'autre côté de l'antiméridien sont trouvées
+        if colonne_max - colonne_min + 1 >= nb_colonnes:
+            colonnes = range(nb_colonnes)
+        else:
+            colonnes = [colonne % nb_colonnes for colonne in range(colonne_min, colonne_max + 1)]
+        res = []
+        for ligne in range(floor((latitude - delta_lat) / taille), floor((latitude + delta_lat) / taille) + 1):
+            for colonne in colonnes:
+                for id_station in self._grille.get((ligne, colonne), ()):
+                    st = self._stations[id_station]
+                    distance = distance_km(latitude, longitude, st.latitude, st.longitude)
+                    if distance <= rayon_km:
+                        res.append((st, distance))
+        res.sort(key=lambda st_distance: st_distance[1])
+        return res
+
+    def stations_proches(self, latitude, longitude, k=1):
+        """Recherche les k stations les plus proches du point, en parcourant la grille par anneaux autour du point.
+        Le parcours s'arrête dès que la k-ième distance trouvée est inférieure à la distance minimale de l'anneau suivant.
+        Lorsque les anneaux parcourus contiennent plus de cellules que la grille n'en occupe (point éloigné de toutes les stations),
+        les distances de toutes les stations sont calculées directement.
+
+        Args:
+            latitude (float): latitude du point, en degrés
+            longitude (float): longitude du point, en degrés
+            k (int, optional): nombre de stations. Defaults to 1.
+
+        Returns:
+            List[(Station, float)]: stations et distance en km, de la plus proche à la plus éloignée
+        """
+        if k <= 0 or len(self._grille) == 0:
+            return []
+        taille = GestionnaireDeStations.TAILLE_CELLULE
+        nb_colonnes = GestionnaireDeStations._nb_colonnes()
+        ligne_0 = floor(latitude / taille)
+        colonne_0 = floor(longitude / taille)
+        candidats = []
+        nb_cellules = 0
+        anneau = 0
+        while True:
+            nb_cellules += max(1, 8 * anneau)
+            if nb_cellules > len(self._grille) or 2 * anneau + 1 >= nb_colonnes:
+                # recherche exhaustive, moins coûteuse que les anneaux restants
+                candidats = [(st, distance_km(latitude, longitude, st.latitude, st.longitude))
+                             for cellule in self._grille.values() for st in map(self._stations.__getitem__, cellule)]
+                break
+            for ligne, colonne in GestionnaireDeStations._cellules_anneau(ligne_0, colonne_0, anneau):
+                for id_station in self._grille.get((ligne, colonne % nb_colonnes), ()):
+                    st = self._stations[id_station]
+                    candidats.append((st, distance_km(latitude, longitude, st.latitude, st.longitude)))
+            if len(candidats) >= k:
+                candidats.sort(key=lambda st_distance: st_distance[1])
+                if candidats[k - 1][1] <= GestionnaireDeStations._distance_min_anneau(latitude, anneau + 1):
+                    break
+            anneau += 1
+        candidats.sort(key=lambda st_distance: st_distance[1])
+        return candidats[:k]
+
+    @staticmethod
+    def _nb_colonnes():
+        """
+        Returns:
+            int: nombre de colonnes de la grille sur 360° de longitude
+        """
+        return round(360 / GestionnaireDeStations.TAILLE_CELLULE)
+
+    @staticmethod
+    def _cellules_anneau(ligne_0, colonne_0, anneau):
+        """
+        Yields:
+            (int, int): cellules (ligne, colonne non ramenée modulo 360°) du bord de l'anneau, à anneau cellules de la cellule centrale
+        """
+        if anneau == 0:
+            yield ligne_0, colonne_0
+            return
+        for colonne in range(colonne_0 - anneau, colonne_0 + anneau + 1):
+            yield ligne_0 - anneau, colonne
+            yield ligne_0 + anneau, colonne
+        for ligne in range(ligne_0 - anneau + 1, ligne_0 + anneau):
+            yield ligne, colonne_0 - anneau
+            yield ligne, colonne_0 + anneau
+
+    @staticmethod
+    def _distance_min_anneau(latitude, anneau):
+        """Minorant de la distance entre le point et les stations des cellules de l'anneau (et des anneaux suivants)
+
+        Args:
+            latitude (float): latitude du point, en degrés
+            anneau (int): numéro de l'anneau (nombre de cellules depuis la cellule du point)
+
+        Returns:
+            float: distance minimale en km
+        """
+        taille = GestionnaireDeStations.TAILLE_CELLULE
+        # le point est quelque part dans sa cellule : au moins anneau - 1 cellules complètes d'écart
+        ecart = max(0, anneau - 1) * taille
+        # écart en latitude (ligne de l'anneau)
+        distance_lat = ecart * KM_PAR_DEGRE
+        # écart en longitude (colonne de l'anneau), le plus court à la latitude la plus éloignée de l'équateur atteinte par l'anneau
+        latitude_max = min(90.0, abs(latitude) + (anneau + 1) * taille)
+        distance_lon = 2 * RAYON_TERRE_KM * cos(radians(latitude_max)) * sin(radians(min(ecart, 180.0)) / 2)
+        return min(distance_lat, distance_lon)
+
+    def vers_instantane(self):
+        """Exporte les stations et leurs mesures enregistrées en BDD (identifiant renseigné), pour un démarrage rapide
+
+        Returns:
+            list: [id, nom, latitude, longitude, max_mesure, [[id, date, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min], ...]]
+                  pour chaque station, sérialisable en JSON
+        """
+        return [[st.id, st.name, st.latitude, st.longitude, st._max_mesure,
+                 [[m.id, m.date, m.wind_heading, m.wind_speed_avg, m.wind_speed_max, m.wind_speed_min] for m in st.iter_mesures() if m.id is not None]]
+                for st in self._stations.values()]
+
+    @classmethod
+    def depuis_instantane(cls, donnees):
+        """Recrée le gestionnaire, ses stations et leurs mesures à partir d'un export vers_instantane
+
+        Args:
+            donnees (list): export vers_instantane
+
+        Raises:
+            ValueError: Si l'export n'a pas le format attendu
+
+        Returns:
+            GestionnaireDeStations: le gestionnaire recréé
+        """
+        gestionnaire = cls()
+        try:
+            for id, name, latitude, longitude, max_mesure, mesures in donnees:
+                station = Station(id, name, latitude, longitude, max_mesure)
+                station.mesures = [Mesure(date, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min, station, id=id_mesure)
+                                   for id_mesure, date, wind_heading, wind_speed_avg, wind_speed_max, wind_speed_min in mesures]
+                gestionnaire.stations = station
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"Instantané des stations illisible : {error}") from error
+        return gestionnaire
+
+    def reindexer(self):
+        """Reconstruit les index, à appeler si le nom ou la position d'une station a été modifié"""
+        self._noms.clear()
+        self._noms_tries.clear()
+        self._grille.clear()
+        for st in self._stations.values():
+            self._indexer(st)
+
+    def _cellule(self, station):
+        if station.latitude is None or station.longitude is None:
+            return None
+        taille = GestionnaireDeStations.TAILLE_CELLULE
+        # colonne modulo 360° : -180° et 180° sont dans la même colonne
+        return (floor(station.latitude / taille), floor(station.longitude / taille) % GestionnaireDeStations._nb_colonnes())
+
+    def _indexer(self, station):
+        nom = str(station.name).casefold()
+        self._noms.setdefault(nom, []).append(station.id)
+        insort(self._noms_tries, (nom, station.id))
+        cellule = self._cellule(station)
+        if cellule is not None:
+            self._grille.setdefault(cellule, []).append(station.id)
+
+    def _desindexer(self, station):
+        nom = str(station.name).casefold()
+        ids = self._noms.get(nom, [])
+        if station.id in ids:
+            ids.remove(station.id)
+            if len(ids) == 0:
+                del self._noms[nom]
+        i = bisect_left(self._noms_tries, (nom, station.id))
+        if i < len(self._noms_tries) and self._noms_tries[i] == (nom, station.id):
+            del self._noms_tries[i]
+        cellule = self._cellule(station)
+        if cellule is not None and station.id in self._grille.get(cellule, []):
+            self._grille[cellule].remove(station.id)
+            if len(self._grille[cellule]) == 0:
+                del self._grille[cellule]
 
     def ajouter_mesure(self, station, nouvelle_mesure):
          
@@ -303,11 +711,31 @@ def test_station_mesure_constructeur(verbose=False):
     mesure_334_2 = Mesure("2022-01-17T15:35:44.000Z", 202.5, 3, 4.5, 0.25, stations[334])
     assert stations[334].ajouter_mesure(mesure_334_2) == mesure_334_2
 
+    print("Mesure > timestamp")
+    assert mesure_334_2.timestamp == 1642433744
+    assert date_vers_epoch("2022-01-17 15:35:44") == date_vers_epoch(datetime(2022, 1, 17, 15, 35, 44)) == 1642433744
+    assert date_vers_epoch("2022-01-17T16:35:44+01:00") == 1642433744
+    assert date_vers_epoch(1642433744) == 1642433744
+    try:
+        date_vers_epoch("hier")
+        assert False, "ValueError attendue"
+    except ValueError:
+        pass
+
     mesure_116_1 = Mesure("2022-01-17T15:32:29.000Z", 202.5, 3, 5.25, 1, stations[116])
     assert stations[116].ajouter_mesure(mesure_116_1) == mesure_116_1
     mesure_116_2 = Mesure("2022-01-18T08:26:10.000Z", 112.5, 3.75, 9.75, 0, stations[334])
     assert stations[116].ajouter_mesure(mesure_116_2) == mesure_116_2
 
+    # identifiants en BDD des mesures
+    assert stations[116].dernier_id_mesure() is None
+    mesure_116_1.id = 1
+    assert stations[116].dernier_id_mesure() == 1
+    mesure_116_2.id = 2
+    assert stations[116].dernier_id_mesure() == 2
+    assert stations[116].retirer_mesures(id_min=1) == 0
+    assert stations[116].nb_mesures() == 2
+
     # test que l'ajout de la mesure n'est pas faite si la dernière mesure est équivalente
     assert stations[116].ajouter_mesure(mesure_116_2) == mesure_116_2
     assert len(stations[116].mesures) == 2
@@ -353,11 +781,33 @@ def test_station_mesure_error(station, verbose=False):
     except TypeError:
         assert True
 
+    # Nombre maximum de mesures en mémoire : la plus ancienne est retirée
+    station_max = Station(2, "Max", max_mesure=2)
+    for i in range(4):
+        station_max.ajouter_mesure(Mesure(f"2022-01-17 15:0{i}:00", 10.0 * i, 3, 5, 1, station_max))
+    assert station_max.nb_mesures() == 2
+    assert [m.wind_heading for m in station_max.mesures] == [20.0, 30.0]
+    try:
+        station_max.attribut_inconnu = 1
+        assert False
+    except AttributeError:
+        assert True
+
+    # Retrait des mesures supprimées en BDD et des mesures non enregistrées
+    station_test = Station(1, "Test")
+    for i in range(4):
+        station_test.ajouter_mesure(Mesure(f"2022-01-17 15:0{i}:00", 10.0 * i, 3, 5, 1, station_test, id=10 + i))
+    station_test.ajouter_mesure(Mesure("2022-01-17 15:05:00", 90.0, 3, 5, 1, station_test))
+    assert station_test.dernier_id_mesure() == 13
+    assert station_test.retirer_mesures(id_min=12, non_enregistrees=True) == 3
+    assert [m.id for m in station_test.mesures] == [12, 13]
+
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # GestionnaireDeStations
 
 def test_GestionnaireDeStations(stations):
+    import json
     print("GestionnaireDeStations > constructeur")
     gestionnaire = GestionnaireDeStations()
     assert len(gestionnaire.stations) == 0
@@ -367,6 +817,77 @@ def test_GestionnaireDeStations(stations):
     station_res = gestionnaire.station(stations[334].name)
     assert station_res == stations[334]
 
+    print("GestionnaireDeStations > index des noms et index géographique")
+    assert gestionnaire.station("plérin") == stations[116]
+    assert gestionnaire.station("CHAMP") == stations[334]
+    assert gestionnaire.station("rdic") == stations[194]
+    assert gestionnaire.station("Inconnue") is None
+    assert gestionnaire.stations_par_prefixe("p") == [stations[116], stations[194]]
+    assert gestionnaire.stations_par_prefixe("p", limite=1) == [stations[116]]
+    # Saint-Brieuc
+    proches = gestionnaire.stations_proches(48.514, -2.765, k=2)
+    assert [st.id for st, distance in proches] == [116, 194]
+    assert proches[0][1] < proches[1][1]
+    assert [st.id for st, distance in gestionnaire.stations_proches(48.514, -2.765, k=10)] == [116, 194, 334]
+    assert [st.id for st, distance in gestionnaire.stations_dans_rayon(48.514, -2.765, 10)] == [116, 194]
+    assert gestionnaire.stations_dans_rayon(0, 0, 100) == []
+
+    print("GestionnaireDeStations > recherche loin des stations et autour de l'antiméridien")
+    europe = GestionnaireDeStations([Station(i, f"Europe {i}", 43 + (i % 40) * 0.25, -5 + (i // 40) * 0.6) for i in range(1000)])
+    for latitude, longitude in ((-33.87, 151.21), (0, 0), (89.9, 170)):
+        attendu = sorted(europe.stations.values(), key=lambda st: distance_km(latitude, longitude, st.latitude, st.longitude))[:3]
+        assert [st.id for st, distance in europe.stations_proches(latitude, longitude, k=3)] == [st.id for st in attendu]
+    fidji = GestionnaireDeStations([Station(1, "Est", -17.0, 179.9), Station(2, "Ouest", -17.0, -179.9), Station(3, "Loin", -17.0, 170.0)])
+    assert [st.id for st, distance in fidji.stations_dans_rayon(-17.0, 179.95, 50)] == [1, 2]
+    assert [st.id for st, distance in fidji.stations_dans_rayon(-17.0, -179.95, 50)] == [2, 1]
+    assert [st.id for st, distance in fidji.stations_proches(-17.0, -179.99, k=2)] == [2, 1]
+    assert abs(distance_km(48.582274, -2.780045, 48.555885, -2.722313) - 5.08) < 0.1
+
+    print("GestionnaireDeStations > vues en lecture seule")
+    vue = gestionnaire.stations
+    assert vue is gestionnaire.stations
+    try:
+        vue[1] = stations[334]
+        assert False
+    except TypeError:
+        assert True
+    gestionnaire.stations = Station(1, "Nouvelle")
+    assert len(vue) == 4
+    assert [st.id for st in gestionnaire.iter_stations()] == list(vue.keys())
+
+    vue_mesures = stations[334].mesures
+    assert vue_mesures is stations[334].mesures
+    assert not hasattr(vue_mesures, "append")
+    nb = len(vue_mesures)
+    derniere = Mesure("2022-01-18T08:30:00.000Z", 90.0, 10, 12, 8, stations[334])
+    stations[334].ajouter_mesure(derniere)
+    assert len(vue_mesures) == nb + 1 and vue_mesures[-1] is derniere
+    assert stations[334].derniere_mesure() is derniere
+    assert list(stations[334].iter_mesures()) == list(vue_mesures)
+    assert vue_mesures[-2:][-1] is derniere
+    assert Station(5, "Vide").derniere_mesure() is None
+    # réaffectation des mesures d'une station par sa propre vue
+    stations[334].mesures = stations[334].mesures
+    assert len(vue_mesures) == nb + 1
+
+    # Instantané : seules les mesures enregistrées en BDD (identifiant renseigné) sont exportées
+    station_max = Station(7, "L'Île-d'Olonne", max_mesure=2)
+    gestionnaire.stations = station_max
+    for i in range(3):
+        station_max.ajouter_mesure(Mesure(f"2022-01-17 15:0{i}:00", 10.0 * i, 3, 5, 1, station_max, id=20 + i))
+    station_max.ajouter_mesure(Mesure("2022-01-17 15:05:00", 90.0, 3, 5, 1, station_max))
+    copie = GestionnaireDeStations.depuis_instantane(json.loads(json.dumps(gestionnaire.vers_instantane())))
+    assert list(copie.stations.keys()) == list(gestionnaire.stations.keys())
+    assert copie.station(7) == station_max and copie.station(7)._max_mesure == 2
+    assert [m.id for m in copie.station(7).mesures] == [22]
+    assert copie.station(7).derniere_mesure().station is copie.station(7)
+    assert copie.station("l'île") is copie.station(7)
+    try:
+        GestionnaireDeStations.depuis_instantane([[1, "Incomplet"]])
+        assert False
+    except ValueError:
+        assert True
+
 
 if __name__ == "__main__":
     Station.verbose = False